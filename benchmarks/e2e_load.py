@@ -0,0 +1,329 @@
+"""
+Сквозной нагрузочный тест бота
+
+Настоящие Dispatcher и роутеры из bot.py работают против локальных
+заглушек Telegram Bot API, The Cat API и memegen.link (benchmarks/fakes.py).
+Виртуальные пользователи проходят сценарии (/randomcat, полный /newmeme,
+просмотр избранного) с заданной параллельностью; в отчёте — пропускная
+способность, p50/p95/p99 по сценариям и шагам и задержка event loop бота.
+
+Запуск из корня проекта:
+    python -m benchmarks.e2e_load --users 50 --duration 30
+    python -m benchmarks.e2e_load --memegen 0.3:0.5:0.02 --json report.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+from benchmarks.fakes import FakeEnvironment, Profile
+from benchmarks.stats import summarize
+
+BOT_TOKEN = "123456:BENCHMARK"
+
+# Методы, которыми бот показывает пользователю результат шага
+VISIBLE = {"sendMessage", "sendPhoto", "editMessageText", "editMessageMedia", "editMessageCaption"}
+ANSWER = {"answerCallbackQuery"}
+
+# Сценарии: (тип обновления, текст или callback_data, какой ответ ждать)
+JOURNEYS = {
+    "randomcat": [
+        ("text", "/randomcat", VISIBLE),
+        ("callback", "more_cat", VISIBLE)
+    ],
+    "newmeme": [
+        ("text", "/newmeme", VISIBLE),
+        ("callback", "random_cat_for_meme", VISIBLE),
+        ("text", "{top}", VISIBLE),
+        ("text", "{bottom}", VISIBLE),
+        ("callback", "confirm_meme", VISIBLE),
+        ("callback", "add_favorite", ANSWER)
+    ],
+    "favorites": [
+        ("text", "/favorites", VISIBLE),
+        ("callback", "view_favorites", VISIBLE),
+        ("callback", "favorite_show_1", VISIBLE),
+        ("callback", "favorite_show_2", VISIBLE),
+        ("callback", "favorites_list", VISIBLE)
+    ]
+}
+
+
+class LoopLagMonitor:
+    """Задержка event loop: насколько позже заказанного просыпается короткий sleep"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - started - self.interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+class LoadDriver:
+    """Виртуальные пользователи (выполняется в потоке заглушек)"""
+
+    def __init__(self, env: FakeEnvironment, args: argparse.Namespace):
+        self.bot_api = env.bot_api
+        self.args = args
+        self.mix = parse_mix(args.mix)
+        self.journeys: Dict[str, List[float]] = defaultdict(list)
+        self.steps: Dict[str, List[float]] = defaultdict(list)
+        self.failures: Dict[str, int] = defaultdict(int)
+        self.updates = 0
+
+    async def run_journey(self, user_id: int, name: str, record: bool) -> bool:
+        """Пройти сценарий; False — какой-то шаг не дождался ответа"""
+        captions = {
+            "top": f"top {random.randrange(self.args.caption_pool)}",
+            "bottom": f"bottom {random.randrange(self.args.caption_pool)}"
+        }
+        journey_started = time.perf_counter()
+        for kind, payload, expected in JOURNEYS[name]:
+            payload = payload.format(**captions)
+            if kind == "text":
+                update = self.bot_api.message_update(user_id, payload)
+            else:
+                update = self.bot_api.callback_update(user_id, payload)
+            reply = self.bot_api.expect(user_id, expected)
+            step_started = time.perf_counter()
+            self.bot_api.push_update(update)
+            self.updates += 1
+            try:
+                await asyncio.wait_for(reply, self.args.step_timeout)
+            except asyncio.TimeoutError:
+                if record:
+                    self.failures[name] += 1
+                return False
+            if record:
+                step = payload if kind == "callback" or payload.startswith("/") else "<text>"
+                self.steps[f"{name}:{step}"].append(time.perf_counter() - step_started)
+        if record:
+            self.journeys[name].append(time.perf_counter() - journey_started)
+        return True
+
+    async def user(self, user_id: int, warmup_until: float, deadline: float):
+        """Один пользователь проходит сценарии по очереди до конца теста"""
+        names = list(self.mix)
+        weights = [self.mix[name] for name in names]
+        while time.perf_counter() < deadline:
+            name = random.choices(names, weights)[0]
+            await self.run_journey(user_id, name, record=time.perf_counter() >= warmup_until)
+            if self.args.think_time:
+                await asyncio.sleep(random.expovariate(1 / self.args.think_time))
+
+    async def run(self) -> dict:
+        started = time.perf_counter()
+        warmup_until = started + self.args.warmup
+        deadline = warmup_until + self.args.duration
+        await asyncio.gather(*(
+            self.user(user_id, warmup_until, deadline)
+            for user_id in range(1, self.args.users + 1)
+        ))
+        elapsed = time.perf_counter() - warmup_until
+        return {
+            "elapsed": round(elapsed, 3),
+            "journeys": {
+                name: {
+                    "completed": len(self.journeys[name]),
+                    "failed": self.failures[name],
+                    "per_second": round(len(self.journeys[name]) / elapsed, 2),
+                    **summarize(self.journeys[name])
+                }
+                for name in sorted(set(self.journeys) | set(self.failures))
+            },
+            "steps": {name: {"count": len(values), **summarize(values)} for name, values in sorted(self.steps.items())},
+            "updates_sent": self.updates
+        }
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """Разобрать "randomcat=5,newmeme=2,favorites=3\""""
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in JOURNEYS:
+            raise SystemExit(f"Неизвестный сценарий: {name} (есть: {', '.join(JOURNEYS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def configure_environment(args: argparse.Namespace, env: FakeEnvironment, workdir: str):
+    """Направить бота на заглушки и временный каталог (до импорта модулей бота)"""
+    os.environ.update({
+        "CAT_API_URL": f"{env.cat_api.base_url}/v1/images/search",
+        "MEMEGEN_BASE_URL": f"{env.memegen.base_url}/images",
+        "FAVORITES_BACKEND": args.backend,
+        "FAVORITES_JSON_FILE": os.path.join(workdir, "favorites_storage.json"),
+        "FAVORITES_DB_FILE": os.path.join(workdir, "favorites.db"),
+        "FAVORITES_JOURNAL_FILE": os.path.join(workdir, "favorites.journal"),
+        "FAVORITES_SNAPSHOT_FILE": os.path.join(workdir, "favorites.snapshot.json"),
+        "MEME_BLOBS_DB_FILE": os.path.join(workdir, "meme_blobs.db"),
+        "FSM_DB_FILE": os.path.join(workdir, "fsm.db"),
+        "FILE_ID_CACHE_FILE": os.path.join(workdir, "file_id_cache.json"),
+        "MEME_RENDERER": args.renderer,
+        "THROTTLE_ENABLED": "1" if args.throttle else "0",
+        "RENDER_CACHE_DIR": "",
+        "METRICS_PORT": "0",
+        "TRACE_FILE": ""
+    })
+
+
+async def seed_favorites(favorites_storage, env: FakeEnvironment, users: int, count: int):
+    """Заполнить избранное пользователей, чтобы сценарию favorites было что листать"""
+    for user_id in range(1, users + 1):
+        for index in range(count):
+            await favorites_storage.add_favorite(user_id, {
+                "url": f"{env.memegen.base_url}/images/custom/seed_{user_id}/meme_{index}.png",
+                "top": f"seed {index}",
+                "bottom": "meme",
+                "created_at": ""
+            })
+
+
+async def run_benchmark(args: argparse.Namespace, env: FakeEnvironment) -> dict:
+    """Запустить бота с заглушками, прогнать нагрузку и собрать отчёт"""
+    # Модули бота читают настройки при импорте, поэтому импортируются после configure_environment
+    import bot as bot_module
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from services.storage_service import favorites_storage
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(env.bot_api.base_url))
+    bot = Bot(token=BOT_TOKEN, session=session)
+    dp = bot_module.create_dispatcher(bot)
+    await bot_module.start_services()
+    await seed_favorites(favorites_storage, env, args.users, args.seed_favorites)
+
+    lag = LoopLagMonitor()
+    lag.start()
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=1))
+    try:
+        driver = LoadDriver(env, args)
+        report = await asyncio.wrap_future(env.submit(driver.run()))
+    finally:
+        try:
+            await dp.stop_polling()
+        except RuntimeError:
+            pass  # Опрос не успел запуститься или уже остановлен
+        await polling
+        await lag.stop()
+        await bot_module.stop_services()
+        await bot.session.close()
+
+    report["event_loop_lag"] = summarize(lag.samples)
+    report["upstream_calls"] = env.calls()
+    report["config"] = {
+        "users": args.users,
+        "duration": args.duration,
+        "warmup": args.warmup,
+        "mix": parse_mix(args.mix),
+        "backend": args.backend,
+        "renderer": args.renderer,
+        "throttle": args.throttle,
+        "profiles": {
+            "bot_api": env.bot_api.profile.to_dict(),
+            "cat_api": env.cat_api.profile.to_dict(),
+            "cat_images": env.cat_api.image_profile.to_dict(),
+            "memegen": env.memegen.profile.to_dict()
+        }
+    }
+    return report
+
+
+def print_report(report: dict):
+    """Человекочитаемая сводка"""
+    print(f"\nДлительность замера: {report['elapsed']} с, обновлений отправлено: {report['updates_sent']}")
+    print(f"{'сценарий':<12} {'готово':>7} {'сбоев':>6} {'в сек':>7} {'p50 мс':>9} {'p95 мс':>9} {'p99 мс':>9}")
+    for name, row in report["journeys"].items():
+        print(
+            f"{name:<12} {row['completed']:>7} {row['failed']:>6} {row['per_second']:>7} "
+            f"{row['p50']!s:>9} {row['p95']!s:>9} {row['p99']!s:>9}"
+        )
+    print("\nШаги (p50 / p95 / p99, мс):")
+    for name, row in report["steps"].items():
+        print(f"  {name:<40} {row['p50']} / {row['p95']} / {row['p99']}")
+    lag = report["event_loop_lag"]
+    print(f"\nЗадержка event loop, мс: p50 {lag['p50']}, p99 {lag['p99']}, max {lag['max']}")
+    print(f"Вызовы заглушек: {report['upstream_calls']}")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Сквозной нагрузочный тест Cat Meme Bot")
+    parser.add_argument("--users", type=int, default=20, help="Одновременных пользователей")
+    parser.add_argument("--duration", type=float, default=20, help="Длительность замера, сек")
+    parser.add_argument("--warmup", type=float, default=3, help="Разогрев без учёта результатов, сек")
+    parser.add_argument("--mix", default="randomcat=5,newmeme=2,favorites=3", help="Веса сценариев")
+    parser.add_argument("--think-time", type=float, default=0, help="Средняя пауза между сценариями, сек")
+    parser.add_argument("--step-timeout", type=float, default=30, help="Ожидание ответа на шаг, сек")
+    parser.add_argument("--caption-pool", type=int, default=50, help="Различных подписей (влияет на кэш мемов)")
+    parser.add_argument("--seed-favorites", type=int, default=5, help="Избранных мемов у каждого пользователя")
+    parser.add_argument("--backend", default="json", help="FAVORITES_BACKEND")
+    parser.add_argument("--renderer", default="memegen", help="MEME_RENDERER")
+    parser.add_argument("--throttle", action="store_true", help="Включить ThrottlingMiddleware")
+    parser.add_argument("--bot-api", default="0.03:0.3", help="Профиль Bot API: задержка[:разброс[:ошибки]]")
+    parser.add_argument("--cat-api", default="0.08:0.4", help="Профиль The Cat API")
+    parser.add_argument("--cat-images", default="0.02:0.3", help="Профиль раздачи картинок котов")
+    parser.add_argument("--memegen", default="0.25:0.5", help="Профиль memegen.link")
+    parser.add_argument("--seed", type=int, default=None, help="Зерно генератора случайных чисел")
+    parser.add_argument("--json", dest="json_path", default="", help="Сохранить отчёт в JSON")
+    parser.add_argument("--log-level", default="WARNING", help="Уровень логов бота")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.seed is not None:
+        random.seed(args.seed)
+    logging.basicConfig(level=args.log_level, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    env = FakeEnvironment(
+        Profile.parse(args.bot_api),
+        Profile.parse(args.cat_api),
+        Profile.parse(args.cat_images),
+        Profile.parse(args.memegen)
+    )
+    env.start()
+    workdir = tempfile.mkdtemp(prefix="cat-meme-bench-")
+    try:
+        configure_environment(args, env, workdir)
+        report = asyncio.run(run_benchmark(args, env))
+    finally:
+        env.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Отчёт сохранён в {args.json_path}")
+    failed = sum(row["failed"] for row in report["journeys"].values())
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
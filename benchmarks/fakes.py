@@ -0,0 +1,362 @@
+"""
+Локальные заглушки внешних сервисов для нагрузочного теста
+
+FakeBotAPI — Telegram Bot API (getUpdates, sendMessage, sendPhoto,
+answerCallbackQuery, editMessage*), FakeCatAPI — The Cat API с раздачей
+картинок, FakeMemegen — memegen.link. У каждой заглушки свой профиль
+задержек и ошибок (Profile). FakeEnvironment запускает все три в отдельном
+потоке со своим event loop, чтобы нагрузка заглушек не искажала замеры бота.
+"""
+import asyncio
+import io
+import itertools
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+from aiohttp import web
+
+BOT_USER = {"id": 1000000, "is_bot": True, "first_name": "Cat Meme Bot", "username": "cat_meme_bench_bot"}
+
+
+class Profile:
+    """Профиль задержки (логнормальное распределение) и доли ошибок заглушки"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0):
+        """
+        Args:
+            latency: Медианная задержка ответа, сек
+            jitter: Сигма логнормального распределения (0 — задержка постоянная)
+            error_rate: Доля ответов с ошибкой 5xx
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    @classmethod
+    def parse(cls, spec: str) -> "Profile":
+        """Разобрать строку "задержка[:разброс[:доля ошибок]]", например "0.05:0.5:0.01\""""
+        parts = [float(part) for part in spec.split(":")] if spec else []
+        return cls(*parts)
+
+    async def delay(self):
+        """Подождать случайное время по профилю"""
+        if self.latency > 0:
+            await asyncio.sleep(self.latency * math.exp(random.gauss(0, self.jitter)))
+
+    def fails(self) -> bool:
+        """Ответить ли ошибкой"""
+        return random.random() < self.error_rate
+
+    def to_dict(self) -> dict:
+        return {"latency": self.latency, "jitter": self.jitter, "error_rate": self.error_rate}
+
+
+def _make_image(fmt: str, size: Tuple[int, int], color: Tuple[int, int, int]) -> bytes:
+    """Картинка для ответов заглушек"""
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def _server_error() -> web.Response:
+    return web.json_response({"message": "injected failure"}, status=503)
+
+
+class FakeCatAPI:
+    """The Cat API: /v1/images/search и раздача картинок /images/<id>.jpg"""
+
+    def __init__(self, profile: Profile, image_profile: Optional[Profile] = None):
+        self.profile = profile
+        self.image_profile = image_profile or Profile()
+        self.base_url = ""
+        self.calls = Counter()
+        self._ids = itertools.count(1)
+        self._image = _make_image("JPEG", (640, 480), (200, 160, 120))
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/v1/images/search", self.search)
+        app.router.add_get("/images/{name}", self.image)
+        return app
+
+    async def search(self, request: web.Request) -> web.Response:
+        self.calls["search"] += 1
+        await self.profile.delay()
+        if self.profile.fails():
+            self.calls["search_errors"] += 1
+            return _server_error()
+        limit = max(1, min(100, int(request.query.get("limit", "1"))))
+        cats = []
+        for _ in range(limit):
+            cat_id = f"bench{next(self._ids)}"
+            cats.append({"id": cat_id, "url": f"{self.base_url}/images/{cat_id}.jpg", "width": 640, "height": 480})
+        return web.json_response(cats)
+
+    async def image(self, request: web.Request) -> web.Response:
+        self.calls["image"] += 1
+        await self.image_profile.delay()
+        if self.image_profile.fails():
+            self.calls["image_errors"] += 1
+            return _server_error()
+        return web.Response(body=self._image, content_type="image/jpeg")
+
+
+class FakeMemegen:
+    """memegen.link: любой путь под /images/ отдаёт готовую картинку"""
+
+    def __init__(self, profile: Profile):
+        self.profile = profile
+        self.base_url = ""
+        self.calls = Counter()
+        self._image = _make_image("PNG", (640, 480), (120, 160, 200))
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/images/{path:.*}", self.render)
+        return app
+
+    async def render(self, request: web.Request) -> web.Response:
+        self.calls["render"] += 1
+        await self.profile.delay()
+        if self.profile.fails():
+            self.calls["render_errors"] += 1
+            return _server_error()
+        return web.Response(body=self._image, content_type="image/png")
+
+
+class FakeBotAPI:
+    """
+    Telegram Bot API
+
+    Обновления для бота ставятся в очередь через push_update и отдаются в
+    getUpdates. Ответы бота (sendMessage, sendPhoto...) будят того, кто ждёт
+    их в expect: так нагрузочный тест измеряет время от обновления до ответа.
+    """
+
+    def __init__(self, profile: Profile):
+        self.profile = profile
+        self.base_url = ""
+        self.calls = Counter()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._callback_ids = itertools.count(1)
+        self._pending: List[dict] = []
+        self._has_updates = asyncio.Event()
+        self._waiters: Dict[int, List[Tuple[Set[str], asyncio.Future]]] = {}
+        self._callbacks: Dict[str, int] = {}
+        self._last_message: Dict[int, dict] = {}
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=20 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    # Сторона теста
+
+    def message_update(self, user_id: int, text: str) -> dict:
+        """Обновление с текстовым сообщением пользователя"""
+        return {
+            "update_id": next(self._update_ids),
+            "message": {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": self._user(user_id),
+                "text": text
+            }
+        }
+
+    def callback_update(self, user_id: int, data: str) -> dict:
+        """Обновление с нажатием inline-кнопки под последним сообщением бота"""
+        callback_id = str(next(self._callback_ids))
+        self._callbacks[callback_id] = user_id
+        message = self._last_message.get(user_id) or {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": BOT_USER,
+            "text": "..."
+        }
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": callback_id,
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "message": message,
+                "data": data
+            }
+        }
+
+    def expect(self, chat_id: int, methods: Set[str]) -> asyncio.Future:
+        """Future, который завершится первым вызовом одного из методов для этого чата"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(chat_id, []).append((methods, future))
+        return future
+
+    def push_update(self, update: dict):
+        """Поставить обновление в очередь getUpdates"""
+        self._pending.append(update)
+        self._has_updates.set()
+
+    # Сторона бота
+
+    @staticmethod
+    def _user(user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": "Bench", "username": f"bench{user_id}"}
+
+    def _notify(self, chat_id: Optional[int], method: str):
+        waiters = self._waiters.get(chat_id)
+        if not waiters:
+            return
+        for entry in waiters:
+            methods, future = entry
+            if method in methods:
+                waiters.remove(entry)
+                if not future.done():
+                    future.set_result(method)
+                break
+
+    def _message(self, chat_id: int, message_id: Optional[int] = None, **content) -> dict:
+        message = {
+            "message_id": message_id or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER
+        }
+        message.update(content)
+        self._last_message[chat_id] = message
+        return message
+
+    def _photo(self, photo) -> list:
+        """Размеры фото в ответе: строка — file_id или URL, иначе — загруженный файл"""
+        if isinstance(photo, str) and not photo.startswith(("http://", "https://", "attach://")):
+            file_id = photo
+        else:
+            file_id = f"bench-photo-{next(self._file_ids)}"
+        return [{"file_id": file_id, "file_unique_id": file_id, "width": 640, "height": 480}]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await request.post()
+        self.calls[method] += 1
+
+        if method == "getUpdates":
+            return await self._get_updates(params)
+
+        await self.profile.delay()
+        if self.profile.fails():
+            self.calls["errors"] += 1
+            return web.json_response(
+                {"ok": False, "error_code": 500, "description": "Internal Server Error: injected failure"},
+                status=500
+            )
+
+        chat_id = int(params["chat_id"]) if "chat_id" in params else None
+        result = True
+        if method == "getMe":
+            result = BOT_USER
+        elif method == "sendMessage":
+            result = self._message(chat_id, text=params.get("text", ""))
+        elif method == "sendPhoto":
+            result = self._message(chat_id, photo=self._photo(params.get("photo")), caption=params.get("caption", ""))
+        elif method in ("editMessageText", "editMessageCaption"):
+            content = {"text": params.get("text", "")} if method == "editMessageText" else {"caption": params.get("caption", "")}
+            previous = self._last_message.get(chat_id, {})
+            if method == "editMessageCaption" and "photo" in previous:
+                content["photo"] = previous["photo"]
+            result = self._message(chat_id, int(params.get("message_id", 0)) or None, **content)
+        elif method == "editMessageMedia":
+            media = json.loads(params.get("media", "{}"))
+            result = self._message(
+                chat_id,
+                int(params.get("message_id", 0)) or None,
+                photo=self._photo(media.get("media")),
+                caption=media.get("caption", "")
+            )
+        elif method == "answerCallbackQuery":
+            chat_id = self._callbacks.pop(params.get("callback_query_id"), None)
+
+        self._notify(chat_id, method)
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, params) -> web.Response:
+        offset = int(params.get("offset", 0))
+        timeout = min(float(params.get("timeout", 0)), 5.0)
+        self._pending = [update for update in self._pending if update["update_id"] >= offset]
+        if not self._pending and timeout > 0:
+            self._has_updates.clear()
+            try:
+                await asyncio.wait_for(self._has_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return web.json_response({"ok": True, "result": self._pending[:100]})
+
+
+class FakeEnvironment:
+    """Все заглушки в отдельном потоке со своим event loop"""
+
+    def __init__(self, bot_profile: Profile, cat_profile: Profile, image_profile: Profile, memegen_profile: Profile):
+        self._profiles = (bot_profile, cat_profile, image_profile, memegen_profile)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._runners: List[web.AppRunner] = []
+        self.bot_api: Optional[FakeBotAPI] = None
+        self.cat_api: Optional[FakeCatAPI] = None
+        self.memegen: Optional[FakeMemegen] = None
+
+    def start(self):
+        """Запустить поток и серверы заглушек"""
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="bench-fakes", daemon=True)
+        self._thread.start()
+        self.submit(self._start()).result()
+
+    def submit(self, coro):
+        """Выполнить корутину в потоке заглушек (concurrent.futures.Future)"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def _serve(self, app: web.Application) -> str:
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        self._runners.append(runner)
+        host, port = runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def _start(self):
+        bot_profile, cat_profile, image_profile, memegen_profile = self._profiles
+        self.bot_api = FakeBotAPI(bot_profile)
+        self.cat_api = FakeCatAPI(cat_profile, image_profile)
+        self.memegen = FakeMemegen(memegen_profile)
+        for fake in (self.bot_api, self.cat_api, self.memegen):
+            fake.base_url = await self._serve(fake.app())
+
+    async def _stop(self):
+        for runner in self._runners:
+            await runner.cleanup()
+
+    def stop(self):
+        """Остановить серверы и поток"""
+        if self.loop is None:
+            return
+        self.submit(self._stop()).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+        self.loop = None
+
+    def calls(self) -> dict:
+        """Сколько раз вызывалась каждая заглушка"""
+        return {
+            "bot_api": dict(self.bot_api.calls),
+            "cat_api": dict(self.cat_api.calls),
+            "memegen": dict(self.memegen.calls)
+        }
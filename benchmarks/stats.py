@@ -0,0 +1,23 @@
+"""Общие функции статистики для нагрузочных тестов"""
+from typing import List, Optional
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Перцентиль по ближайшему рангу"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+def summarize(values: List[float]) -> dict:
+    """p50/p95/p99/max в миллисекундах"""
+    return {
+        name: round(value * 1000, 3) if value is not None else None
+        for name, value in (
+            ("p50", percentile(values, 50)),
+            ("p95", percentile(values, 95)),
+            ("p99", percentile(values, 99)),
+            ("max", max(values) if values else None)
+        )
+    }
@@ -0,0 +1,397 @@
+"""
+Нагрузочный тест хранилищ избранного
+
+Для каждого размера набора данных (пользователей, у каждого 0–50 мемов)
+генерируется JSON-файл в формате FavoritesStorage, с которого стартует
+каждый бэкенд (json, memory, sqlite, journal — остальные мигрируют из
+него при первом запуске). Каждая пара (бэкенд, размер) выполняется в
+отдельном процессе, чтобы замеры памяти не смешивались. Замеряются:
+
+- время первого запуска (загрузка или миграция) и перезапуска;
+- задержка и пропускная способность каждой операции последовательно
+  и смешанной нагрузки из параллельных корутин;
+- RSS после загрузки и пиковый, байты, записанные на операцию
+  (по /proc/self/io), и размер файлов на диске.
+
+Отчёт — JSON (--output), сводка печатается в консоль.
+
+Запуск из корня проекта:
+    python -m benchmarks.storage_bench --sizes 1000,10000 --output storage_report.json
+    python -m benchmarks.storage_bench --backends sqlite,journal --sizes 1000000 --ops 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+from benchmarks.stats import summarize
+
+BACKENDS = ("json", "memory", "sqlite", "journal")
+MAX_FAVORITES_PER_USER = 50
+PAGE_SIZE = 10
+
+# Смешанная нагрузка: операция -> вес
+MIXED_WEIGHTS = {
+    "get_favorites": 10,
+    "get_favorites_page": 25,
+    "get_favorite": 25,
+    "get_favorites_count": 10,
+    "add_favorite": 20,
+    "remove_favorite": 8,
+    "clear_favorites": 2
+}
+
+
+def _meme(user_id: int, index: int) -> dict:
+    return {
+        "url": f"https://cdn.example.com/memes/{user_id}/{index}.png",
+        "top": f"top text {index}",
+        "bottom": f"bottom text {user_id}",
+        "created_at": "2024-01-01 12:00:00+00:00",
+        "file_id": f"AgACAgIAAxkBAAI{user_id:x}{index:x}"
+    }
+
+
+def generate_dataset(path: Path, users: int, seed: int) -> dict:
+    """Записать набор данных потоково (без построения всего словаря в памяти)"""
+    rng = random.Random(seed)
+    total = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("{")
+        for user_id in range(1, users + 1):
+            count = rng.randint(0, MAX_FAVORITES_PER_USER)
+            total += count
+            favorites = [_meme(user_id, index) for index in range(count)]
+            if user_id > 1:
+                f.write(",")
+            f.write(f'\n"{user_id}": ')
+            f.write(json.dumps({"favorites": favorites}, ensure_ascii=False))
+        f.write("\n}\n")
+    return {"users": users, "favorites": total, "bytes": path.stat().st_size}
+
+
+# Замеры процесса
+
+def _rss_bytes() -> Optional[int]:
+    """Текущий RSS процесса (Linux)"""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _written_bytes() -> Optional[int]:
+    """Байты, переданные в write() всеми потоками процесса (Linux)"""
+    try:
+        with open("/proc/self/io", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _disk_bytes(path: Path) -> int:
+    return sum(item.stat().st_size for item in path.rglob("*") if item.is_file())
+
+
+# Выполнение одного случая в дочернем процессе
+
+def create_storage(backend: str, case_dir: Path, dataset: Path):
+    """Создать хранилище нужного бэкенда с файлами в каталоге случая"""
+    if backend == "json":
+        from services.storage_service import FavoritesStorage
+        return FavoritesStorage(path=dataset)
+    if backend == "memory":
+        from services.memory_storage import InMemoryFavoritesStorage
+        return InMemoryFavoritesStorage(path=dataset)
+    if backend == "sqlite":
+        from services.sqlite_storage import SQLiteFavoritesStorage
+        return SQLiteFavoritesStorage(db_path=str(case_dir / "favorites.db"), json_path=dataset)
+    if backend == "journal":
+        from services.journal_storage import JournalFavoritesStorage
+        return JournalFavoritesStorage(
+            journal_path=str(case_dir / "favorites.journal"),
+            snapshot_path=str(case_dir / "favorites.snapshot.json"),
+            legacy_path=dataset
+        )
+    raise ValueError(f"Неизвестный бэкенд: {backend}")
+
+
+class OperationRunner:
+    """Вызов операций хранилища со случайными аргументами"""
+
+    def __init__(self, storage, users: int, rng: random.Random):
+        self.storage = storage
+        self.users = users
+        self.rng = rng
+        self._added = 0
+
+    async def call(self, operation: str):
+        user_id = self.rng.randint(1, self.users)
+        if operation == "add_favorite":
+            self._added += 1
+            return await self.storage.add_favorite(user_id, _meme(user_id, 1000 + self._added))
+        if operation == "remove_favorite":
+            return await self.storage.remove_favorite(user_id, 0)
+        if operation == "get_favorites_page":
+            offset = self.rng.randrange(0, MAX_FAVORITES_PER_USER, PAGE_SIZE)
+            return await self.storage.get_favorites_page(user_id, offset, PAGE_SIZE)
+        if operation == "get_favorite":
+            return await self.storage.get_favorite(user_id, self.rng.randrange(MAX_FAVORITES_PER_USER))
+        return await getattr(self.storage, operation)(user_id)
+
+
+async def _flush(storage):
+    """Дописать отложенные изменения на диск (у бэкендов с отложенной записью)"""
+    flush = getattr(storage, "flush", None)
+    if flush is not None:
+        await flush()
+
+
+async def run_sequential(runner: OperationRunner, operation: str, ops: int, time_budget: float) -> dict:
+    """Операции одна за другой; останавливается по числу операций или бюджету времени"""
+    latencies: List[float] = []
+    written = _written_bytes()
+    started = time.perf_counter()
+    while len(latencies) < ops and time.perf_counter() - started < time_budget:
+        op_started = time.perf_counter()
+        await runner.call(operation)
+        latencies.append(time.perf_counter() - op_started)
+    elapsed = time.perf_counter() - started
+    return await _phase_result(runner.storage, latencies, elapsed, written)
+
+
+async def run_concurrent(runner: OperationRunner, ops: int, concurrency: int, time_budget: float) -> dict:
+    """Смешанная нагрузка из concurrency корутин"""
+    names = list(MIXED_WEIGHTS)
+    weights = [MIXED_WEIGHTS[name] for name in names]
+    latencies: Dict[str, List[float]] = {name: [] for name in names}
+    done = 0
+    written = _written_bytes()
+    started = time.perf_counter()
+
+    async def worker():
+        nonlocal done
+        while done < ops and time.perf_counter() - started < time_budget:
+            done += 1
+            operation = runner.rng.choices(names, weights)[0]
+            op_started = time.perf_counter()
+            await runner.call(operation)
+            latencies[operation].append(time.perf_counter() - op_started)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    all_latencies = [value for values in latencies.values() for value in values]
+    result = await _phase_result(runner.storage, all_latencies, elapsed, written)
+    result["concurrency"] = concurrency
+    result["by_operation"] = {name: {"ops": len(values), **summarize(values)} for name, values in latencies.items() if values}
+    return result
+
+
+async def _phase_result(storage, latencies: List[float], elapsed: float, written_before: Optional[int]) -> dict:
+    """Итог фазы; отложенная запись сбрасывается на диск и учитывается в байтах, но не во времени операций"""
+    started = time.perf_counter()
+    await _flush(storage)
+    flush_seconds = time.perf_counter() - started
+    written_after = _written_bytes()
+    written = written_after - written_before if written_before is not None and written_after is not None else None
+    return {
+        "ops": len(latencies),
+        "seconds": round(elapsed, 4),
+        "ops_per_second": round(len(latencies) / elapsed, 1) if elapsed > 0 else None,
+        "latency_ms": summarize(latencies),
+        "flush_seconds": round(flush_seconds, 4),
+        "bytes_written_per_op": round(written / len(latencies)) if written is not None and latencies else None
+    }
+
+
+async def run_case(args: argparse.Namespace) -> dict:
+    """Один бэкенд на одном наборе данных (выполняется в дочернем процессе)"""
+    case_dir = Path(args.case_dir)
+    dataset = case_dir / "favorites_storage.json"
+    rng = random.Random(args.seed)
+    result = {"backend": args.case, "users": args.users}
+
+    rss_before = _rss_bytes()
+    started = time.perf_counter()
+    storage = create_storage(args.case, case_dir, dataset)
+    await storage.start()
+    result["load_seconds"] = round(time.perf_counter() - started, 4)
+    rss_loaded = _rss_bytes()
+    result["rss_after_load_bytes"] = rss_loaded - rss_before if rss_loaded and rss_before else None
+
+    runner = OperationRunner(storage, args.users, rng)
+    result["operations"] = {}
+    # Чтение — до изменений, удаления — в конце, чтобы не опустошать набор раньше времени
+    for operation in (
+        "get_favorites", "get_favorites_page", "get_favorite", "get_favorites_count",
+        "add_favorite", "remove_favorite", "clear_favorites"
+    ):
+        result["operations"][operation] = await run_sequential(runner, operation, args.ops, args.phase_seconds)
+    result["concurrent"] = await run_concurrent(runner, args.ops, args.concurrency, args.phase_seconds)
+
+    started = time.perf_counter()
+    await storage.close()
+    result["close_seconds"] = round(time.perf_counter() - started, 4)
+
+    # Повторный запуск на уже сохранённых данных (без миграции)
+    started = time.perf_counter()
+    storage = create_storage(args.case, case_dir, dataset)
+    await storage.start()
+    result["restart_seconds"] = round(time.perf_counter() - started, 4)
+    await storage.close()
+
+    result["disk_bytes"] = _disk_bytes(case_dir)
+    result["peak_rss_bytes"] = _peak_rss_bytes()
+    return result
+
+
+def _case_main(args: argparse.Namespace):
+    # Модульный экземпляр хранилища создаётся при импорте — направляем его во временный файл
+    os.environ["FAVORITES_BACKEND"] = "json"
+    os.environ["FAVORITES_JSON_FILE"] = str(Path(args.case_dir) / "module_default.json")
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+    result = asyncio.run(run_case(args))
+    print(json.dumps(result))
+
+
+# Родительский процесс: наборы данных и запуск случаев
+
+def run_suite(args: argparse.Namespace) -> dict:
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="cat-meme-storage-bench-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    backends = [name.strip() for name in args.backends.split(",") if name.strip()]
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    report = {
+        "meta": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "ops": args.ops,
+            "concurrency": args.concurrency,
+            "phase_seconds": args.phase_seconds,
+            "seed": args.seed
+        },
+        "datasets": [],
+        "results": []
+    }
+    try:
+        for size in sizes:
+            dataset = workdir / f"dataset_{size}.json"
+            started = time.perf_counter()
+            info = generate_dataset(dataset, size, args.seed)
+            info["generate_seconds"] = round(time.perf_counter() - started, 2)
+            report["datasets"].append(info)
+            print(f"Набор {size} пользователей: {info['favorites']} мемов, {info['bytes'] / 1e6:.1f} МБ", file=sys.stderr)
+
+            for backend in backends:
+                case_dir = workdir / f"{backend}_{size}"
+                shutil.rmtree(case_dir, ignore_errors=True)
+                case_dir.mkdir()
+                shutil.copyfile(dataset, case_dir / "favorites_storage.json")
+                result = _run_child(args, backend, size, case_dir)
+                result["dataset_favorites"] = info["favorites"]
+                report["results"].append(result)
+                _print_result(result)
+                shutil.rmtree(case_dir, ignore_errors=True)
+            dataset.unlink()
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def _run_child(args: argparse.Namespace, backend: str, size: int, case_dir: Path) -> dict:
+    command = [
+        sys.executable, "-m", "benchmarks.storage_bench",
+        "--case", backend, "--users", str(size), "--case-dir", str(case_dir),
+        "--ops", str(args.ops), "--concurrency", str(args.concurrency),
+        "--phase-seconds", str(args.phase_seconds), "--seed", str(args.seed)
+    ]
+    try:
+        completed = subprocess.run(
+            command, capture_output=True, text=True, timeout=args.case_timeout,
+            cwd=Path(__file__).resolve().parent.parent
+        )
+    except subprocess.TimeoutExpired:
+        return {"backend": backend, "users": size, "error": f"timeout {args.case_timeout} s"}
+    if completed.returncode != 0:
+        return {"backend": backend, "users": size, "error": completed.stderr.strip().splitlines()[-1:]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def _print_result(result: dict):
+    name = f"{result['backend']:<8} {result['users']:>8}"
+    if "error" in result:
+        print(f"{name}  ошибка: {result['error']}", file=sys.stderr)
+        return
+    ops = result["operations"]
+    cells = "  ".join(
+        f"{operation}: {row['latency_ms']['p50']}/{row['latency_ms']['p99']} мс"
+        for operation, row in ops.items()
+    )
+    print(
+        f"{name}  загрузка {result['load_seconds']} с, перезапуск {result['restart_seconds']} с, "
+        f"смешанная {result['concurrent']['ops_per_second']} оп/с\n    {cells}",
+        file=sys.stderr
+    )
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест хранилищ избранного")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="Бэкенды через запятую")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Размеры наборов (пользователей), например 1000,1000000")
+    parser.add_argument("--ops", type=int, default=500, help="Операций в каждой фазе")
+    parser.add_argument("--concurrency", type=int, default=64, help="Корутин в смешанной нагрузке")
+    parser.add_argument("--phase-seconds", type=float, default=60, help="Бюджет времени на фазу, сек")
+    parser.add_argument("--case-timeout", type=float, default=1800, help="Таймаут одного случая, сек")
+    parser.add_argument("--seed", type=int, default=42, help="Зерно генератора")
+    parser.add_argument("--workdir", default="", help="Каталог для данных (по умолчанию — временный)")
+    parser.add_argument("--output", default="", help="Сохранить отчёт в JSON")
+    # Внутренние параметры дочернего процесса
+    parser.add_argument("--case", default="", help=argparse.SUPPRESS)
+    parser.add_argument("--users", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--case-dir", default="", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.case:
+        _case_main(args)
+        return 0
+
+    report = run_suite(args)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"Отчёт сохранён в {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    return 1 if any("error" in result for result in report["results"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,75 +1,180 @@
-import asyncio
-import logging
-import signal
-from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.types import BotCommand
-from config.settings import BOT_TOKEN
-from utils.logger import setup_logger
-from routers import commands
-from routers.handlers import callbacks, favorites_handlers
-from middlewares import LoggingMiddleware
-from filters import HasTextFilter, HasImageFilter
-
-
-async def set_bot_commands(bot: Bot):
-    """Регистрация команд бота в меню Telegram"""
-    commands_list = [
-        BotCommand(command="start", description="Запустить бота"),
-        BotCommand(command="help", description="Справка по командам"),
-        BotCommand(command="randomcat", description="Случайный котик"),
-        BotCommand(command="newmeme", description="Создать мем"),
-        BotCommand(command="favorites", description="Избранные мемы"),
-        BotCommand(command="test", description="Проверить API")
-    ]
-    
-    await bot.set_my_commands(commands_list)
-
-
-async def main():
-    """Главная функция запуска бота"""
-    # Настройка логирования
-    logger = setup_logger()
-    logger.info("Запуск Cat Meme Bot...")
-    
-    # Проверка токена
-    if not BOT_TOKEN:
-        logger.error("BOT_TOKEN не найден в переменных окружения!")
-        return    # Создание бота и диспетчера
-    bot = Bot(token=BOT_TOKEN)
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
-    
-    # Регистрация команд в меню Telegram
-    await set_bot_commands(bot)
-    
-    # Регистрация middleware
-    dp.message.middleware(LoggingMiddleware())
-    dp.callback_query.middleware(LoggingMiddleware())
-    
-    # Регистрация роутеров
-    dp.include_router(commands.router)
-    dp.include_router(callbacks.router)
-    dp.include_router(favorites_handlers.router)
-    
-    # Запуск бота
-    try:
-        logger.info("Бот успешно запущен!")
-        await dp.start_polling(bot)
-    except KeyboardInterrupt:
-        logger.info("Получен сигнал прерывания. Завершение работы бота...")
-    except Exception as e:
-        logger.error(f"Ошибка при запуске бота: {e}")
-    finally:
-        logger.info("Закрытие сессии бота...")
-        await bot.session.close()
-        logger.info("Бот остановлен")
-
-
-if __name__ == "__main__":
-    try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
-        print("\nПрограмма прервана пользователем")
-    except Exception as e:
+import asyncio
+import logging
+import signal
+from aiogram import Bot, Dispatcher
+from aiogram.types import BotCommand
+from config.settings import BOT_TOKEN, BOT_MODE, CAT_PREFETCH_ENABLED, MEME_RENDERER, THROTTLE_ENABLED
+from utils.logger import setup_logger
+
+# Роутеры и сервисы импортируются внутри функций: процессы пула изображений
+# (spawn) заново импортируют этот модуль, и импорт не должен создавать
+# хранилища, кэши и FSM (журнал избранного читался бы в каждом процессе)
+
+
+async def set_bot_commands(bot: Bot):
+    """Регистрация команд бота в меню Telegram"""
+    commands_list = [
+        BotCommand(command="start", description="Запустить бота"),
+        BotCommand(command="help", description="Справка по командам"),
+        BotCommand(command="randomcat", description="Случайный котик"),
+        BotCommand(command="newmeme", description="Создать мем"),
+        BotCommand(command="favorites", description="Избранные мемы"),
+        BotCommand(command="test", description="Проверить API")
+    ]
+    
+    await bot.set_my_commands(commands_list)
+
+
+def create_dispatcher(bot: Bot) -> Dispatcher:
+    """
+    Создать диспетчер со всеми middleware и роутерами бота
+    
+    Args:
+        bot: Экземпляр бота (его сессии добавляется middleware трассировки)
+    
+    Returns:
+        Dispatcher: Готовый к запуску диспетчер
+    """
+    from routers import commands
+    from routers.handlers import callbacks, favorites_handlers
+    from middlewares import (
+        LoggingMiddleware,
+        ThrottlingMiddleware,
+        MetricsMiddleware,
+        TracingMiddleware,
+        TracingRequestMiddleware
+    )
+    from services.fsm_storage import fsm_storage
+    from services.tracing import tracer
+    
+    dp = Dispatcher(storage=fsm_storage)
+    
+    # Регистрация middleware
+    if tracer.enabled:
+        # Трасса открывается на всё обновление, запросы к Telegram записываются спанами
+        dp.update.outer_middleware(TracingMiddleware())
+        bot.session.middleware(TracingRequestMiddleware())
+    if THROTTLE_ENABLED:
+        # Внешний middleware отсекает лишние события до фильтров и FSM; таблица лимитов общая
+        throttling = ThrottlingMiddleware()
+        dp.message.outer_middleware(throttling)
+        dp.callback_query.outer_middleware(throttling)
+    dp.message.middleware(LoggingMiddleware())
+    dp.callback_query.middleware(LoggingMiddleware())
+    dp.message.middleware(MetricsMiddleware())
+    dp.callback_query.middleware(MetricsMiddleware())
+    
+    # Регистрация роутеров
+    dp.include_router(commands.router)
+    dp.include_router(callbacks.router)
+    dp.include_router(favorites_handlers.router)
+    
+    return dp
+
+
+async def start_services():
+    """Запуск общих ресурсов и фоновых задач бота"""
+    from services.http_client import http_client
+    from services.fsm_storage import fsm_storage
+    from services.storage_service import favorites_storage
+    from services.file_id_cache import file_id_cache
+    from services.image_workers import image_workers
+    from services.metrics import metrics_server
+    from services.cat_prefetch import cat_prefetcher
+    
+    # Общий HTTP-клиент для внешних API
+    await http_client.start()
+    
+    # Хранилище состояний FSM
+    await fsm_storage.start()
+    
+    # Фоновые задачи хранилища избранного
+    await favorites_storage.start()
+    
+    # Кэш file_id отправленных фото
+    await file_id_cache.start()
+    
+    # Пул процессов для локальной генерации мемов
+    if MEME_RENDERER != "memegen":
+        from services.meme_renderer import has_cyrillic_font
+        if not has_cyrillic_font():
+            logging.getLogger('cat_meme_bot').warning(
+                "Шрифт с кириллицей не найден: русские подписи будут нарисованы квадратами. "
+                "Укажите TTF-шрифт в MEME_FONT_PATH"
+            )
+        await image_workers.start()
+    
+    # HTTP-сервер метрик для Prometheus
+    await metrics_server.start()
+    
+    # Фоновая предзагрузка котов
+    if CAT_PREFETCH_ENABLED:
+        await cat_prefetcher.start()
+
+
+async def stop_services():
+    """Остановка фоновых задач и сохранение данных"""
+    from services.http_client import http_client
+    from services.fsm_storage import fsm_storage
+    from services.storage_service import favorites_storage
+    from services.file_id_cache import file_id_cache
+    from services.image_workers import image_workers
+    from services.metrics import metrics_server
+    from services.cat_prefetch import cat_prefetcher
+    from services.tracing import tracer
+    
+    await cat_prefetcher.stop()
+    await favorites_storage.close()
+    await fsm_storage.close()
+    await file_id_cache.close()
+    await image_workers.close()
+    await metrics_server.close()
+    await tracer.close()
+    await http_client.close()
+
+
+async def main():
+    """Главная функция запуска бота"""
+    # Настройка логирования
+    logger = setup_logger()
+    logger.info("Запуск Cat Meme Bot...")
+    
+    # Проверка токена
+    if not BOT_TOKEN:
+        logger.error("BOT_TOKEN не найден в переменных окружения!")
+        return    # Создание бота и диспетчера
+    bot = Bot(token=BOT_TOKEN)
+    dp = create_dispatcher(bot)
+    
+    # Регистрация команд в меню Telegram
+    await set_bot_commands(bot)
+    
+    # Общие ресурсы и фоновые задачи
+    await start_services()
+    
+    # Запуск бота
+    try:
+        logger.info(f"Бот успешно запущен! Режим: {BOT_MODE}")
+        if BOT_MODE == "webhook":
+            from services.webhook_server import run_webhook
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(bot)
+    except KeyboardInterrupt:
+        logger.info("Получен сигнал прерывания. Завершение работы бота...")
+    except Exception as e:
+        logger.error(f"Ошибка при запуске бота: {e}")
+    finally:
+        logger.info("Закрытие сессии бота...")
+        await stop_services()
+        await bot.session.close()
+        logger.info("Бот остановлен")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\nПрограмма прервана пользователем")
+    except Exception as e:
         print(f"Критическая ошибка: {e}")
\ No newline at end of file
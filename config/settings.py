@@ -1,12 +1,159 @@
-import os
-from dotenv import load_dotenv
-
-# Загружаем переменные окружения
-load_dotenv()
-
-# Токен бота
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-
-# Настройки логирования
-LOG_LEVEL = "INFO"
-LOG_FILE = "bot.log"
+import os
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Токен бота
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+
+# Настройки логирования
+LOG_LEVEL = "INFO"
+LOG_FILE = "bot.log"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text или json (одна JSON-запись на строку)
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "")  # Ротация по времени (например, midnight); пусто — по размеру
+LOG_ROTATE_BYTES = int(os.getenv("LOG_ROTATE_BYTES", str(10 * 1024 * 1024)))  # Размер файла для ротации по размеру
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "7"))  # Сколько старых файлов хранить
+LOG_COMPRESS = os.getenv("LOG_COMPRESS", "1") == "1"  # Сжимать старые файлы gzip
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # Записей в очереди до записи на диск
+LOG_UPDATE_SAMPLE_RATE = float(os.getenv("LOG_UPDATE_SAMPLE_RATE", "1"))  # Доля записываемых строк о каждом обновлении
+
+# Настройки HTTP-клиента для внешних API
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))  # Всего соединений в пуле
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "20"))  # Соединений на один хост
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))  # Время жизни DNS-кэша, сек
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))  # Простой keep-alive соединения, сек
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))  # Таймаут установки соединения, сек
+
+# Адреса внешних API (переопределяются, например, для нагрузочного теста с локальными заглушками)
+CAT_API_URL = os.getenv("CAT_API_URL", "https://api.thecatapi.com/v1/images/search")
+MEMEGEN_BASE_URL = os.getenv("MEMEGEN_BASE_URL", "https://api.memegen.link/images")
+
+# Таймауты запросов к внешним API, сек
+CAT_API_TIMEOUT = float(os.getenv("CAT_API_TIMEOUT", "10"))
+CAT_API_BATCH_TIMEOUT = float(os.getenv("CAT_API_BATCH_TIMEOUT", "15"))
+MEMEGEN_TIMEOUT = float(os.getenv("MEMEGEN_TIMEOUT", "20"))
+MEME_DOWNLOAD_TIMEOUT = float(os.getenv("MEME_DOWNLOAD_TIMEOUT", "30"))
+API_TEST_TIMEOUT = float(os.getenv("API_TEST_TIMEOUT", "5"))
+
+# Максимальный размер скачиваемого изображения (лимит Telegram на загрузку фото — 10 МБ)
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+
+# Фоновая предзагрузка изображений котов
+CAT_PREFETCH_ENABLED = os.getenv("CAT_PREFETCH_ENABLED", "true").lower() == "true"
+CAT_PREFETCH_LOW_WATERMARK = int(os.getenv("CAT_PREFETCH_LOW_WATERMARK", "10"))  # Порог запуска дозагрузки
+CAT_PREFETCH_HIGH_WATERMARK = int(os.getenv("CAT_PREFETCH_HIGH_WATERMARK", "50"))  # Максимальный размер буфера
+CAT_PREFETCH_BATCH_SIZE = int(os.getenv("CAT_PREFETCH_BATCH_SIZE", "10"))  # Котов в одном запросе (limit=N)
+CAT_PREFETCH_CONCURRENCY = int(os.getenv("CAT_PREFETCH_CONCURRENCY", "2"))  # Параллельных запросов дозагрузки
+CAT_PREFETCH_RETRY_DELAY = float(os.getenv("CAT_PREFETCH_RETRY_DELAY", "5"))  # Пауза после неудачной дозагрузки, сек
+
+# Фильтры Блума недавно показанных котов (по пользователю)
+SEEN_CATS_BITS = int(os.getenv("SEEN_CATS_BITS", "1024"))  # Размер одного из двух поколений фильтра, бит
+SEEN_CATS_HASHES = int(os.getenv("SEEN_CATS_HASHES", "3"))  # Количество хэш-функций
+SEEN_CATS_CAPACITY = int(os.getenv("SEEN_CATS_CAPACITY", "100"))  # Котов в поколении до его смены (~2% ложных срабатываний на поколение)
+SEEN_CATS_TTL = float(os.getenv("SEEN_CATS_TTL", str(24 * 3600)))  # Сколько кот считается увиденным, сек
+SEEN_CATS_MAX_USERS = int(os.getenv("SEEN_CATS_MAX_USERS", "100000"))  # Пользователей с фильтрами, давние вытесняются
+SEEN_CATS_MAX_SKIPS = int(os.getenv("SEEN_CATS_MAX_SKIPS", "8"))  # Сколько увиденных котов из буфера пропустить
+
+# Хранилище избранного: "json" (чтение/запись файла на каждую операцию), "memory", "sqlite" или "journal"
+FAVORITES_BACKEND = os.getenv("FAVORITES_BACKEND", "json").lower()
+FAVORITES_MAX_PER_USER = int(os.getenv("FAVORITES_MAX_PER_USER", "5000"))  # Лимит избранного (memory, sqlite, journal), при превышении удаляются самые старые
+FAVORITES_JSON_MAX_PER_USER = int(os.getenv("FAVORITES_JSON_MAX_PER_USER", "50"))  # Лимит для "json": каждая операция читает и переписывает весь файл
+FAVORITES_PAGE_SIZE = int(os.getenv("FAVORITES_PAGE_SIZE", "10"))  # Мемов на странице списка избранного
+FAVORITES_JSON_FILE = os.getenv("FAVORITES_JSON_FILE", "storage/favorites_storage.json")  # Файл бэкенда "json" (и исходные данные для остальных)
+FAVORITES_FLUSH_INTERVAL = float(os.getenv("FAVORITES_FLUSH_INTERVAL", "5"))  # Период сброса на диск, сек
+FAVORITES_FLUSH_THRESHOLD = int(os.getenv("FAVORITES_FLUSH_THRESHOLD", "100"))  # Изменённых пользователей до внеочередного сброса
+FAVORITES_DB_FILE = os.getenv("FAVORITES_DB_FILE", "storage/favorites.db")  # База для бэкенда "sqlite"
+FAVORITES_JOURNAL_FILE = os.getenv("FAVORITES_JOURNAL_FILE", "storage/favorites.journal")  # Журнал операций для бэкенда "journal"
+FAVORITES_SNAPSHOT_FILE = os.getenv("FAVORITES_SNAPSHOT_FILE", "storage/favorites.snapshot.json")  # Снимок после компактификации
+FAVORITES_JOURNAL_COMPACT_BYTES = int(os.getenv("FAVORITES_JOURNAL_COMPACT_BYTES", str(4 * 1024 * 1024)))  # Размер журнала до компактификации
+FAVORITES_JOURNAL_BATCH = int(os.getenv("FAVORITES_JOURNAL_BATCH", "256"))  # Максимум операций в одной групповой записи
+
+# Общие мемы в избранном: мем хранится один раз в отдельной базе, в избранном — ссылки на него.
+# Меняет формат записей бэкенда, выключить обратно можно только на новом хранилище
+FAVORITES_DEDUP = os.getenv("FAVORITES_DEDUP", "0") == "1"
+MEME_BLOBS_DB_FILE = os.getenv("MEME_BLOBS_DB_FILE", "storage/meme_blobs.db")  # База общих мемов
+MEME_BLOBS_CACHE_SIZE = int(os.getenv("MEME_BLOBS_CACHE_SIZE", "10000"))  # Мемов в кэше памяти (LRU)
+MEME_BLOBS_GC_INTERVAL = float(os.getenv("MEME_BLOBS_GC_INTERVAL", "300"))  # Период сборки мемов без ссылок, сек
+MEME_BLOBS_GC_GRACE = float(os.getenv("MEME_BLOBS_GC_GRACE", "3600"))  # Сколько хранить мем без ссылок, сек
+
+# Кэш file_id отправленных фото (URL → file_id Telegram)
+FILE_ID_CACHE_FILE = os.getenv("FILE_ID_CACHE_FILE", "storage/file_id_cache.json")
+FILE_ID_CACHE_SIZE = int(os.getenv("FILE_ID_CACHE_SIZE", "10000"))  # Максимум записей, старые вытесняются (LRU)
+FILE_ID_CACHE_FLUSH_INTERVAL = float(os.getenv("FILE_ID_CACHE_FLUSH_INTERVAL", "30"))  # Период сохранения на диск, сек
+
+# Кэш готовых мемов по (фон, верхний текст, нижний текст)
+RENDER_CACHE_TTL = float(os.getenv("RENDER_CACHE_TTL", str(24 * 60 * 60)))  # Время жизни записи, сек
+RENDER_CACHE_MEMORY_BYTES = int(os.getenv("RENDER_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))  # Бюджет памяти
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", "")  # Каталог дискового уровня (пусто — отключён)
+RENDER_CACHE_DISK_BYTES = int(os.getenv("RENDER_CACHE_DISK_BYTES", str(512 * 1024 * 1024)))  # Бюджет диска
+
+# Движок генерации мемов: "memegen" (api.memegen.link), "local" (Pillow) или "local_fallback" (Pillow, при ошибке — memegen)
+MEME_RENDERER = os.getenv("MEME_RENDERER", "memegen").lower()
+MEME_RENDER_FORMAT = os.getenv("MEME_RENDER_FORMAT", "JPEG").upper()  # JPEG или PNG
+MEME_RENDER_MAX_SIDE = int(os.getenv("MEME_RENDER_MAX_SIDE", "1280"))  # Фон уменьшается до этого размера стороны, px
+MEME_FONT_PATH = os.getenv("MEME_FONT_PATH", "")  # TTF-шрифт для подписей (пусто — поиск системного)
+
+# Пул процессов для обработки изображений (локальный движок мемов)
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "0"))  # Количество процессов (0 — по числу ядер)
+IMAGE_QUEUE_SIZE = int(os.getenv("IMAGE_QUEUE_SIZE", "32"))  # Заданий в очереди сверх занятых процессов
+IMAGE_JOB_TIMEOUT = float(os.getenv("IMAGE_JOB_TIMEOUT", "15"))  # Таймаут одного задания, сек
+
+# Режим получения обновлений: polling (getUpdates) или webhook (встроенный HTTP-сервер)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")  # Публичный адрес для setWebhook (пусто — не регистрировать)
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # Проверяется в заголовке X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))  # Передаётся в setWebhook (1-100), сервер сам запросы не ограничивает
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "10"))  # Ожидание принятых обновлений при остановке, сек
+
+# Хранилище состояний FSM
+FSM_BACKEND = os.getenv("FSM_BACKEND", "sqlite")  # memory — только память, sqlite — память + база на диске
+FSM_DB_FILE = os.getenv("FSM_DB_FILE", "storage/fsm.db")
+FSM_IDLE_TTL = float(os.getenv("FSM_IDLE_TTL", str(30 * 60)))  # Простой, после которого запись выгружается из памяти, сек
+FSM_DISK_TTL = float(os.getenv("FSM_DISK_TTL", str(7 * 24 * 60 * 60)))  # Простой, после которого запись удаляется с диска, сек
+FSM_MEMORY_BYTES = int(os.getenv("FSM_MEMORY_BYTES", str(16 * 1024 * 1024)))  # Бюджет памяти на состояния
+FSM_SWEEP_INTERVAL = float(os.getenv("FSM_SWEEP_INTERVAL", "60"))  # Период очистки устаревших записей, сек
+
+# Ограничение частоты запросов пользователя (token bucket)
+THROTTLE_ENABLED = os.getenv("THROTTLE_ENABLED", "0") == "1"  # Выключено по умолчанию: лимиты стоит подобрать под свою нагрузку
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "1"))  # Токенов в секунду по умолчанию
+THROTTLE_BURST = float(os.getenv("THROTTLE_BURST", "5"))  # Запас токенов по умолчанию
+# Лимиты для отдельных команд и кнопок: ключ -> (токенов в секунду, запас)
+THROTTLE_LIMITS = {
+    "confirm_meme": (0.2, 2),  # Генерация мема — самое дорогое действие
+    "more_cat": (1, 3),
+    "random_cat_for_meme": (1, 3),
+    "randomcat": (1, 3),
+    "test": (0.1, 1)
+}
+THROTTLE_DEBOUNCE = float(os.getenv("THROTTLE_DEBOUNCE", "1.5"))  # Окно для повторных нажатий одной кнопки, сек
+THROTTLE_TABLE_SIZE = int(os.getenv("THROTTLE_TABLE_SIZE", "100000"))  # Максимум записей в таблице лимитов
+
+# Ограничение нагрузки на внешние API и автоматический выключатель (circuit breaker)
+CAT_API_MAX_CONCURRENCY = int(os.getenv("CAT_API_MAX_CONCURRENCY", "10"))  # Одновременных запросов к The Cat API
+CAT_API_MAX_WAITING = int(os.getenv("CAT_API_MAX_WAITING", "50"))  # Запросов в очереди сверх лимита
+MEMEGEN_MAX_CONCURRENCY = int(os.getenv("MEMEGEN_MAX_CONCURRENCY", "5"))  # Одновременных запросов к memegen.link
+MEMEGEN_MAX_WAITING = int(os.getenv("MEMEGEN_MAX_WAITING", "20"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))  # Ошибок подряд до размыкания
+BREAKER_RECOVERY_TIME = float(os.getenv("BREAKER_RECOVERY_TIME", "30"))  # Пауза до пробного запроса, сек
+
+# Дублирующие (hedged) запросы к внешним API: если ответа нет дольше p95, отправляется второй такой же
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "1") == "1"
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.05"))  # Доля дополнительных запросов (0.05 — не больше 5%)
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))  # Замеров задержки до включения дублирования
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.05"))  # Минимальная задержка перед дублем, сек
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))  # Сколько последних задержек учитывать в p95
+
+# Метрики в формате Prometheus
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))  # 0 — не запускать HTTP-сервер метрик
+
+# Трассировка обновлений (формат Chrome Trace Event: chrome://tracing, ui.perfetto.dev)
+TRACE_FILE = os.getenv("TRACE_FILE", "")  # Например, "storage/trace.json"; пустая строка — трассировка выключена
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))  # Доля сохраняемых обычных обновлений
+TRACE_SLOW_THRESHOLD = float(os.getenv("TRACE_SLOW_THRESHOLD", "2"))  # Обновления дольше этого сохраняются всегда, сек
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "256"))  # Максимум спанов в одной трассе
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(50 * 1024 * 1024)))  # Размер файла трасс до ротации
@@ -1,6 +1,6 @@
-# Filters module
-
-from .has_text import HasTextFilter
-from .has_image import HasImageFilter
-
-__all__ = ['HasTextFilter', 'HasImageFilter']
+# Filters module
+
+from .has_text import HasTextFilter
+from .has_image import HasImageFilter
+
+__all__ = ['HasTextFilter', 'HasImageFilter']
@@ -1 +1 @@
-# Keyboards module
+# Keyboards module
@@ -1,5 +1,13 @@
-# Middlewares module
-
-from .throttling import LoggingMiddleware
-
-__all__ = ['LoggingMiddleware']
+# Middlewares module
+
+from .throttling import LoggingMiddleware, ThrottlingMiddleware
+from .metrics import MetricsMiddleware
+from .tracing import TracingMiddleware, TracingRequestMiddleware
+
+__all__ = [
+    'LoggingMiddleware',
+    'ThrottlingMiddleware',
+    'MetricsMiddleware',
+    'TracingMiddleware',
+    'TracingRequestMiddleware'
+]
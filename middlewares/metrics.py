@@ -0,0 +1,30 @@
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+import time
+from typing import Callable, Dict, Any, Awaitable
+from services.metrics import HANDLER_LATENCY, HANDLER_ERRORS, HANDLERS_IN_FLIGHT
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Middleware для замера времени и ошибок каждого обработчика"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        # Внутренний middleware знает, какой обработчик выбран фильтрами
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object is not None else "unknown"
+
+        HANDLERS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, name)
+            HANDLERS_IN_FLIGHT.dec()
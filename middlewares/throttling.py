@@ -1,41 +1,207 @@
-from aiogram import BaseMiddleware
-from aiogram.types import TelegramObject, Update
-import logging
-import datetime
-from typing import Callable, Dict, Any, Awaitable
-
-
-class LoggingMiddleware(BaseMiddleware):
-    """Middleware для логирования всех входящих апдейтов"""
-    
-    async def __call__(
-        self,
-        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
-        event: TelegramObject,
-        data: Dict[str, Any]
-    ) -> Any:
-        # Получаем информацию об апдейте
-        update_type = "unknown"
-        user_id = None
-        
-        if isinstance(event, Update):
-            if event.message:
-                update_type = "message"
-                user_id = event.message.from_user.id if event.message.from_user else None
-            elif event.callback_query:
-                update_type = "callback_query"
-                user_id = event.callback_query.from_user.id if event.callback_query.from_user else None
-            elif event.inline_query:
-                update_type = "inline_query"
-                user_id = event.inline_query.from_user.id if event.inline_query.from_user else None
-        
-        # Логируем информацию об апдейте
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_message = f"[{timestamp}] Update: {update_type}, User ID: {user_id}"
-        
-        # Логируем в файл bot.log
-        logger = logging.getLogger("bot")
-        logger.info(log_message)
-        
-        # Вызываем следующий обработчик
-        return await handler(event, data)
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update, Message, CallbackQuery
+import logging
+import datetime
+import re
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Any, Awaitable, Optional, Tuple
+from config.settings import (
+    THROTTLE_RATE,
+    THROTTLE_BURST,
+    THROTTLE_LIMITS,
+    THROTTLE_DEBOUNCE,
+    THROTTLE_TABLE_SIZE
+)
+
+
+class LoggingMiddleware(BaseMiddleware):
+    """Middleware для логирования всех входящих апдейтов"""
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        # Получаем информацию об апдейте
+        update_type = "unknown"
+        user_id = None
+        
+        if isinstance(event, Update):
+            if event.message:
+                update_type = "message"
+                user_id = event.message.from_user.id if event.message.from_user else None
+            elif event.callback_query:
+                update_type = "callback_query"
+                user_id = event.callback_query.from_user.id if event.callback_query.from_user else None
+            elif event.inline_query:
+                update_type = "inline_query"
+                user_id = event.inline_query.from_user.id if event.inline_query.from_user else None
+        
+        # Логируем информацию об апдейте
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        log_message = f"[{timestamp}] Update: {update_type}, User ID: {user_id}"
+        
+        # Логируем в файл bot.log
+        logger = logging.getLogger("bot")
+        logger.info(log_message)
+        
+        # Вызываем следующий обработчик
+        return await handler(event, data)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Middleware для ограничения частоты сообщений и нажатий кнопок
+
+    Для каждого пользователя и каждой команды (или кнопки) ведётся token
+    bucket: токены восстанавливаются с заданной скоростью до запаса burst,
+    каждое событие тратит один токен. Повторное нажатие той же кнопки,
+    что и последняя нажатая на этом сообщении, в пределах окна debounce
+    отбрасывается (листание «вперёд — назад — вперёд» не теряется).
+    Таблицы упорядочены по последнему обращению и ограничены по размеру:
+    записи, которые успели бы восстановиться полностью, удаляются с начала,
+    поэтому память не растёт с числом пользователей.
+    """
+
+    def __init__(
+        self,
+        rate: float = THROTTLE_RATE,
+        burst: float = THROTTLE_BURST,
+        limits: Optional[Dict[str, Tuple[float, float]]] = None,
+        debounce: float = THROTTLE_DEBOUNCE,
+        table_size: int = THROTTLE_TABLE_SIZE
+    ):
+        """
+        Инициализация middleware
+
+        Args:
+            rate: Токенов в секунду по умолчанию
+            burst: Запас токенов по умолчанию
+            limits: Лимиты для отдельных команд и кнопок: ключ -> (токенов в секунду, запас)
+            debounce: Окно для повторных нажатий одной кнопки, сек
+            table_size: Максимум записей в каждой таблице
+        """
+        self.default_limit = (rate, burst)
+        self.limits = THROTTLE_LIMITS if limits is None else limits
+        self.debounce = debounce
+        self.table_size = max(1, table_size)
+
+        # Через это время простоя любой bucket снова полон, и запись можно забыть
+        self._bucket_ttl = max(b / r for r, b in [self.default_limit, *self.limits.values()])
+
+        self._buckets: OrderedDict = OrderedDict()  # (user_id, ключ) -> [токены, время, предупреждён]
+        self._presses: OrderedDict = OrderedDict()  # (user_id, сообщение) -> [data, время нажатия]
+
+        self.throttled = 0
+        self.debounced = 0
+
+    @staticmethod
+    def _event_key(event: TelegramObject) -> str:
+        """Ключ лимита: имя команды, data кнопки без номера или общий ключ"""
+        if isinstance(event, CallbackQuery):
+            # favorite_show_3 и favorite_show_4 — одна и та же кнопка
+            return re.sub(r"_\d+$", "", event.data or "") or "callback"
+        text = getattr(event, "text", None) or ""
+        if text.startswith("/") and len(text) > 1:
+            return text[1:].split(maxsplit=1)[0].split("@")[0].lower()
+        return "message"
+
+    @staticmethod
+    def _trim(table: OrderedDict, max_size: int, deadline: float):
+        """Удалить с начала таблицы устаревшие записи и записи сверх размера"""
+        while table:
+            value = next(iter(table.values()))
+            stamp = value[1] if isinstance(value, list) else value
+            if stamp >= deadline and len(table) <= max_size:
+                break
+            table.popitem(last=False)
+
+    def _consume(self, user_id: int, key: str, now: float) -> Tuple[bool, bool]:
+        """
+        Потратить токен
+
+        Returns:
+            Tuple[bool, bool]: (разрешено, первый отказ подряд — стоит предупредить)
+        """
+        rate, burst = self.limits.get(key, self.default_limit)
+        bucket_key = (user_id, key)
+        bucket = self._buckets.pop(bucket_key, None)
+        if bucket is None:
+            tokens, warned = burst, False
+        else:
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            warned = bucket[2]
+
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[bucket_key] = [tokens, now, not allowed]
+        self._trim(self._buckets, self.table_size, now - self._bucket_ttl)
+        return allowed, not allowed and not warned
+
+    def _is_repeat_press(self, callback: CallbackQuery, now: float) -> bool:
+        """Последним на этом сообщении в пределах окна нажимали ту же кнопку"""
+        if self.debounce <= 0:
+            return False
+        message_id = callback.message.message_id if callback.message else callback.inline_message_id
+        press_key = (callback.from_user.id, message_id)
+        last = self._presses.get(press_key)
+        if last is not None and last[0] == callback.data and now - last[1] < self.debounce:
+            return True
+        self._presses.pop(press_key, None)
+        self._presses[press_key] = [callback.data, now]
+        self._trim(self._presses, self.table_size, now - self.debounce)
+        return False
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = getattr(event, "from_user", None)
+        if user is None:
+            return await handler(event, data)
+
+        now = time.monotonic()
+        if isinstance(event, CallbackQuery) and self._is_repeat_press(event, now):
+            self.debounced += 1
+            # Ответ нужен, чтобы у пользователя пропали «часики» на кнопке
+            await self._notify(event, None)
+            return None
+
+        key = self._event_key(event)
+        allowed, warn = self._consume(user.id, key, now)
+        if allowed:
+            return await handler(event, data)
+
+        self.throttled += 1
+        logging.getLogger("bot").info(f"Throttled: user {user.id}, key {key}")
+        if isinstance(event, CallbackQuery):
+            await self._notify(event, "⏳ Не так быстро! Подожди немного")
+        elif warn:
+            # О сообщениях предупреждаем один раз, чтобы не отвечать на каждый спам
+            await self._notify(event, "⏳ Слишком много запросов, подожди немного")
+        return None
+
+    @staticmethod
+    async def _notify(event: TelegramObject, text: Optional[str]):
+        """Сообщить пользователю об ограничении"""
+        try:
+            if isinstance(event, CallbackQuery):
+                await event.answer(text)
+            elif isinstance(event, Message) and text:
+                await event.answer(text)
+        except Exception as e:
+            logging.getLogger("bot").warning(f"Не удалось ответить на ограниченное событие: {e}")
+
+    def stats(self) -> dict:
+        """Статистика ограничений для мониторинга"""
+        return {
+            "buckets": len(self._buckets),
+            "presses": len(self._presses),
+            "throttled": self.throttled,
+            "debounced": self.debounced
+        }
@@ -0,0 +1,39 @@
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.types import TelegramObject, Update
+from typing import Callable, Dict, Any, Awaitable
+from services.tracing import tracer, span
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Middleware, открывающий трассу на всё время обработки обновления"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        token = tracer.begin(event.update_id, f"update {event.event_type}")
+        user = data.get("event_from_user")
+        try:
+            return await handler(event, data)
+        finally:
+            tracer.end(token, update_id=event.update_id, user_id=user.id if user else None)
+
+
+class TracingRequestMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: спан на каждый запрос к Telegram Bot API"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot,
+        method: TelegramMethod
+    ):
+        with span(f"telegram.{method.__api_method__}"):
+            return await make_request(bot, method)
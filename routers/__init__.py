@@ -1 +1 @@
-# Routers module
+# Routers module
@@ -1,5 +1,5 @@
-# Handlers module
-
-from . import callbacks, favorites_handlers
-
-__all__ = ['callbacks', 'favorites_handlers']
+# Handlers module
+
+from . import callbacks, favorites_handlers
+
+__all__ = ['callbacks', 'favorites_handlers']
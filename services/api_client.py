@@ -1,145 +1,282 @@
-import aiohttp
-import logging
-from typing import Optional, List
-from urllib.parse import quote
-from collections import deque
-
-logger = logging.getLogger('cat_meme_bot')
-
-# Кэш для хранения последних изображений котов
-cat_cache = deque(maxlen=10)
-
-# Конфигурация API
-CAT_API_URL = "https://api.thecatapi.com/v1/images/search"
-MEMEGEN_BASE_URL = "https://api.memegen.link/images"
-
-
-async def get_random_cat_image() -> Optional[str]:
-    """Получить случайное изображение кота из The Cat API"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(CAT_API_URL, timeout=aiohttp.ClientTimeout(total=10)) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data and len(data) > 0:
-                        cat_url = data[0]["url"]
-                        # Добавляем в кэш
-                        cat_cache.append(cat_url)
-                        logger.info(f"Получено изображение кота: {cat_url}")
-                        return cat_url
-                else:
-                    logger.error(f"The Cat API вернул статус: {response.status}")
-    except aiohttp.ClientError as e:
-        logger.error(f"Ошибка сети при запросе к The Cat API: {e}")
-    except Exception as e:
-        logger.error(f"Неожиданная ошибка при запросе к The Cat API: {e}")
-    
-    return None
-
-
-async def get_multiple_cat_images(count: int = 5) -> List[str]:
-    """Получить несколько изображений котов для выбора"""
-    images = []
-    try:
-        async with aiohttp.ClientSession() as session:
-            params = {"limit": count}
-            async with session.get(CAT_API_URL, params=params, timeout=aiohttp.ClientTimeout(total=15)) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    for item in data:
-                        cat_url = item["url"]
-                        images.append(cat_url)
-                        cat_cache.append(cat_url)
-                    logger.info(f"Получено {len(images)} изображений котов")
-                else:
-                    logger.error(f"The Cat API вернул статус: {response.status}")
-    except aiohttp.ClientError as e:
-        logger.error(f"Ошибка сети при запросе к The Cat API: {e}")
-    except Exception as e:
-        logger.error(f"Неожиданная ошибка при запросе к The Cat API: {e}")
-    
-    return images
-
-
-def get_cached_cat_images() -> List[str]:
-    """Получить изображения котов из кэша"""
-    return list(cat_cache)
-
-
-async def generate_meme_with_memegen(image_url: str, top_text: str, bottom_text: str) -> Optional[str]:
-    """Генерировать мем через memegen.link с кастомным фоном (по документации)"""
-    try:
-        def clean_memegen_text(text):
-            return (text.replace(" ", "_")
-                        .replace("?", "~q")
-                        .replace("&", "~a")
-                        .replace("%", "~p")
-                        .replace("#", "~h")
-                        .replace("/", "~s")
-                        .replace("\\", "~b")
-                        .replace("<", "~l")
-                        .replace(">", "~g")
-                        .replace('"', "''"))
-        clean_top = clean_memegen_text(top_text)
-        clean_bottom = clean_memegen_text(bottom_text)
-        meme_url = f"{MEMEGEN_BASE_URL}/custom/{clean_top}/{clean_bottom}.png?background={quote(image_url)}"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(meme_url, timeout=aiohttp.ClientTimeout(total=20)) as response:
-                if response.status == 200:
-                    content_type = response.headers.get('content-type', '')
-                    if 'image' in content_type:
-                        logger.info(f"Мем создан через memegen.link: {meme_url}")
-                        return meme_url
-    except Exception as e:
-        logger.error(f"Ошибка при генерации мема через memegen.link: {e}")
-    return None
-
-
-async def download_meme_as_bytes(meme_url: str) -> Optional[bytes]:
-    """Скачать мем как байты для Telegram"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(meme_url, timeout=aiohttp.ClientTimeout(total=30)) as response:
-                if response.status == 200:
-                    content_type = response.headers.get('content-type', '')
-                    if 'image' in content_type:
-                        image_data = await response.read()
-                        logger.info(f"Мем скачан как байты, размер: {len(image_data)} байт")
-                        return image_data
-                else:
-                    logger.warning(f"Не удалось скачать мем: статус {response.status}")
-    except Exception as e:
-        logger.error(f"Ошибка при скачивании мема: {e}")
-    return None
-
-
-async def test_apis() -> dict:
-    """Тестирование доступности API"""
-    results = {
-        "cat_api": False,
-        "memegen": False
-    }
-    
-    # Тест The Cat API
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(CAT_API_URL, timeout=aiohttp.ClientTimeout(total=5)) as response:
-                results["cat_api"] = response.status == 200
-    except:
-        pass
-    
-    # Тест Memegen.link
-    try:
-        async with aiohttp.ClientSession() as session:
-            test_url = "https://api.memegen.link/images/drake/test/api.png"
-            async with session.get(test_url, timeout=aiohttp.ClientTimeout(total=5)) as response:
-                results["memegen"] = response.status == 200
-    except:
-        pass
-    
-    return results
-
-
-# Для обратной совместимости
-async def generate_working_meme(image_url: str, top_text: str, bottom_text: str) -> Optional[str]:
-    return await generate_meme_with_memegen(image_url, top_text, bottom_text)
+import aiohttp
+import logging
+import time
+from typing import Optional, List, Dict, Any
+from urllib.parse import quote
+from collections import deque
+from config.settings import (
+    CAT_API_URL,
+    MEMEGEN_BASE_URL,
+    CAT_API_TIMEOUT,
+    CAT_API_BATCH_TIMEOUT,
+    MEMEGEN_TIMEOUT,
+    MEME_DOWNLOAD_TIMEOUT,
+    API_TEST_TIMEOUT,
+    MAX_IMAGE_BYTES,
+    MEME_RENDERER
+)
+from services.http_client import http_client, request_timeout
+from services.image_workers import image_workers
+from services.metrics import UPSTREAM_LATENCY
+from services.tracing import span
+from services.upstream import cat_api_upstream, memegen_upstream, check_status, UpstreamUnavailableError
+
+logger = logging.getLogger('cat_meme_bot')
+
+# Кэш для хранения последних изображений котов
+cat_cache = deque(maxlen=10)
+
+# Картинки котов на случай недоступности The Cat API
+CAT_IMAGES_FALLBACK = [
+    "https://cdn2.thecatapi.com/images/bpc.jpg",
+    "https://cdn2.thecatapi.com/images/eac.jpg",
+    "https://cdn2.thecatapi.com/images/dho.jpg",
+    "https://cdn2.thecatapi.com/images/MTk3ODg4MA.jpg",
+    "https://cdn2.thecatapi.com/images/cml.jpg"
+]
+
+# Размер куска при потоковом чтении изображения
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+async def _request_random_cat() -> Optional[str]:
+    """Один запрос случайного кота к The Cat API"""
+    session = http_client.session
+    async with cat_api_upstream.slot():
+        async with session.get(CAT_API_URL, timeout=request_timeout(CAT_API_TIMEOUT)) as response:
+            check_status(response.status)
+            if response.status == 200:
+                data = await response.json()
+                if data and len(data) > 0:
+                    return data[0]["url"]
+            else:
+                logger.error(f"The Cat API вернул статус: {response.status}")
+    return None
+
+
+async def get_random_cat_image() -> Optional[str]:
+    """Получить случайное изображение кота из The Cat API"""
+    try:
+        # При медленном ответе отправляется дублирующий запрос
+        cat_url = await cat_api_upstream.hedged(_request_random_cat)
+        if cat_url:
+            # Добавляем в кэш
+            cat_cache.append(cat_url)
+            logger.info(f"Получено изображение кота: {cat_url}")
+            return cat_url
+    except UpstreamUnavailableError as e:
+        logger.warning(str(e))
+    except aiohttp.ClientError as e:
+        logger.error(f"Ошибка сети при запросе к The Cat API: {e}")
+    except Exception as e:
+        logger.error(f"Неожиданная ошибка при запросе к The Cat API: {e}")
+    
+    return None
+
+
+async def get_multiple_cat_images(count: int = 5, remember: bool = True) -> List[str]:
+    """
+    Получить несколько изображений котов для выбора
+    
+    Args:
+        count: Количество изображений (параметр limit The Cat API)
+        remember: Добавлять ли полученные изображения в cat_cache
+    
+    Returns:
+        List: Список URL изображений
+    """
+    images = []
+    try:
+        session = http_client.session
+        params = {"limit": count}
+        async with cat_api_upstream.slot():
+            async with session.get(CAT_API_URL, params=params, timeout=request_timeout(CAT_API_BATCH_TIMEOUT)) as response:
+                check_status(response.status)
+                if response.status == 200:
+                    data = await response.json()
+                    for item in data:
+                        cat_url = item["url"]
+                        images.append(cat_url)
+                        if remember:
+                            cat_cache.append(cat_url)
+                    logger.info(f"Получено {len(images)} изображений котов")
+                else:
+                    logger.error(f"The Cat API вернул статус: {response.status}")
+    except UpstreamUnavailableError as e:
+        logger.warning(str(e))
+    except aiohttp.ClientError as e:
+        logger.error(f"Ошибка сети при запросе к The Cat API: {e}")
+    except Exception as e:
+        logger.error(f"Неожиданная ошибка при запросе к The Cat API: {e}")
+    
+    return images
+
+
+def get_cached_cat_images() -> List[str]:
+    """Получить изображения котов из кэша"""
+    return list(cat_cache)
+
+
+async def fetch_image(url: str, timeout: float, max_bytes: int = MAX_IMAGE_BYTES) -> Optional[bytes]:
+    """
+    Скачать изображение одним запросом с потоковым чтением в буфер
+    
+    Args:
+        url: URL изображения
+        timeout: Таймаут запроса, сек
+        max_bytes: Максимальный размер изображения
+    
+    Returns:
+        Optional[bytes]: Байты изображения или None (не картинка, ошибка, превышен размер)
+    """
+    session = http_client.session
+    async with session.get(url, timeout=request_timeout(timeout)) as response:
+        check_status(response.status)
+        if response.status != 200:
+            logger.warning(f"Не удалось скачать изображение: статус {response.status}")
+            return None
+        content_type = response.headers.get('content-type', '')
+        if 'image' not in content_type:
+            logger.warning(f"Ответ не является изображением: {content_type}")
+            return None
+        if response.content_length and response.content_length > max_bytes:
+            logger.warning(f"Изображение слишком большое: {response.content_length} байт")
+            return None
+        
+        buffer = bytearray()
+        async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+            buffer.extend(chunk)
+            if len(buffer) > max_bytes:
+                # Не дочитываем тело: соединение закроется вместе с ответом
+                logger.warning(f"Изображение превысило лимит {max_bytes} байт")
+                return None
+        return bytes(buffer)
+
+
+def build_memegen_url(image_url: str, top_text: str, bottom_text: str) -> str:
+    """Собрать URL мема memegen.link с кастомным фоном (по документации)"""
+    def clean_memegen_text(text):
+        return (text.replace(" ", "_")
+                    .replace("?", "~q")
+                    .replace("&", "~a")
+                    .replace("%", "~p")
+                    .replace("#", "~h")
+                    .replace("/", "~s")
+                    .replace("\\", "~b")
+                    .replace("<", "~l")
+                    .replace(">", "~g")
+                    .replace('"', "''"))
+    clean_top = clean_memegen_text(top_text)
+    clean_bottom = clean_memegen_text(bottom_text)
+    return f"{MEMEGEN_BASE_URL}/custom/{clean_top}/{clean_bottom}.png?background={quote(image_url)}"
+
+
+async def generate_meme_with_memegen(image_url: str, top_text: str, bottom_text: str) -> Optional[Dict[str, Any]]:
+    """
+    Генерировать мем через memegen.link с кастомным фоном
+    
+    Готовое изображение скачивается один раз: те же байты проверяются
+    и затем загружаются в Telegram, повторных запросов к memegen нет.
+    
+    Returns:
+        Optional[dict]: {"url": URL мема, "data": байты мема} или None
+    """
+    meme_url = build_memegen_url(image_url, top_text, bottom_text)
+    
+    async def request() -> Optional[bytes]:
+        async with memegen_upstream.slot():
+            return await fetch_image(meme_url, MEMEGEN_TIMEOUT)
+    
+    try:
+        # При медленном ответе отправляется дублирующий запрос
+        meme_bytes = await memegen_upstream.hedged(request)
+        if meme_bytes:
+            logger.info(f"Мем создан через memegen.link: {meme_url}, размер: {len(meme_bytes)} байт")
+            return {"url": meme_url, "data": meme_bytes}
+    except UpstreamUnavailableError as e:
+        logger.warning(str(e))
+    except Exception as e:
+        logger.error(f"Ошибка при генерации мема через memegen.link: {e}")
+    return None
+
+
+async def download_meme_as_bytes(meme_url: str) -> Optional[bytes]:
+    """Скачать мем как байты для Telegram"""
+    started = time.monotonic()
+    try:
+        with span("image_download"):
+            image_data = await fetch_image(meme_url, MEME_DOWNLOAD_TIMEOUT)
+        UPSTREAM_LATENCY.observe(time.monotonic() - started, "image_download", "ok" if image_data else "error")
+        if image_data:
+            logger.info(f"Мем скачан как байты, размер: {len(image_data)} байт")
+            return image_data
+    except Exception as e:
+        UPSTREAM_LATENCY.observe(time.monotonic() - started, "image_download", "error")
+        logger.error(f"Ошибка при скачивании мема: {e}")
+    return None
+
+
+async def test_apis() -> dict:
+    """Тестирование доступности API"""
+    results = {
+        "cat_api": False,
+        "memegen": False
+    }
+    
+    session = http_client.session
+    
+    # Тест The Cat API
+    try:
+        async with session.get(CAT_API_URL, timeout=request_timeout(API_TEST_TIMEOUT)) as response:
+            results["cat_api"] = response.status == 200
+    except:
+        pass
+    
+    # Тест Memegen.link
+    try:
+        test_url = f"{MEMEGEN_BASE_URL}/drake/test/api.png"
+        async with session.get(test_url, timeout=request_timeout(API_TEST_TIMEOUT)) as response:
+            results["memegen"] = response.status == 200
+    except:
+        pass
+    
+    return results
+
+
+async def render_meme_locally(image_url: str, top_text: str, bottom_text: str) -> Optional[bytes]:
+    """Скачать фон и нарисовать мем локально (Pillow)"""
+    try:
+        background = await download_meme_as_bytes(image_url)
+        if not background:
+            return None
+        # Декодирование, подписи и кодирование выполняются в пуле процессов
+        with span("render_local", background_bytes=len(background)):
+            meme_bytes = await image_workers.render_meme(background, top_text, bottom_text)
+        logger.info(f"Мем нарисован локально, размер: {len(meme_bytes)} байт")
+        return meme_bytes
+    except Exception as e:
+        logger.error(f"Ошибка при локальной генерации мема: {e}")
+    return None
+
+
+async def generate_working_meme(image_url: str, top_text: str, bottom_text: str) -> Optional[Dict[str, Any]]:
+    """
+    Сгенерировать мем движком из настройки MEME_RENDERER
+    
+    Args:
+        image_url: URL фонового изображения
+        top_text: Верхняя подпись
+        bottom_text: Нижняя подпись
+    
+    Returns:
+        Optional[dict]: {"url": URL мема или None, "data": байты мема или None}
+    """
+    if MEME_RENDERER in ("local", "local_fallback"):
+        meme_bytes = await render_meme_locally(image_url, top_text, bottom_text)
+        if meme_bytes:
+            return {"url": None, "data": meme_bytes}
+        if MEME_RENDERER == "local":
+            return None
+        logger.warning("Локальная генерация не удалась, используем memegen.link")
+    
+    return await generate_meme_with_memegen(image_url, top_text, bottom_text)
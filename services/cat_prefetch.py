@@ -0,0 +1,194 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Optional, List
+from config.settings import (
+    CAT_PREFETCH_LOW_WATERMARK,
+    CAT_PREFETCH_HIGH_WATERMARK,
+    CAT_PREFETCH_BATCH_SIZE,
+    CAT_PREFETCH_CONCURRENCY,
+    CAT_PREFETCH_RETRY_DELAY,
+    SEEN_CATS_MAX_SKIPS
+)
+from services.api_client import get_multiple_cat_images, get_random_cat_image, cat_cache
+from services.seen_cats import seen_cats
+
+logger = logging.getLogger('cat_meme_bot')
+
+
+class CatPrefetcher:
+    """Фоновый буфер готовых URL котов для мгновенной выдачи в обработчиках"""
+
+    def __init__(
+        self,
+        low_watermark: int = CAT_PREFETCH_LOW_WATERMARK,
+        high_watermark: int = CAT_PREFETCH_HIGH_WATERMARK,
+        batch_size: int = CAT_PREFETCH_BATCH_SIZE,
+        concurrency: int = CAT_PREFETCH_CONCURRENCY
+    ):
+        """
+        Инициализация буфера
+
+        Args:
+            low_watermark: При падении буфера ниже этого порога запускается дозагрузка
+            high_watermark: Дозагрузка идёт до этого размера буфера
+            batch_size: Сколько котов запрашивать одним вызовом (limit=N)
+            concurrency: Сколько пакетных запросов выполнять одновременно
+        """
+        self.low_watermark = low_watermark
+        self.high_watermark = max(high_watermark, low_watermark + 1)
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+
+        self._buffer: deque = deque()
+        self._buffered = set()  # Для отсева дубликатов внутри буфера
+        self._refill_needed: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Счётчики для мониторинга
+        self.hits = 0
+        self.misses = 0
+        self.fetched = 0
+
+    def _trigger_refill(self):
+        """Разбудить фоновую задачу дозагрузки"""
+        if self._refill_needed is not None:
+            self._refill_needed.set()
+
+    def pop(self, user_id: Optional[int] = None) -> Optional[str]:
+        """
+        Мгновенно взять кота из буфера
+
+        Args:
+            user_id: ID пользователя; котов, которых он недавно видел,
+                     пропускаем (они остаются в буфере для других)
+
+        Returns:
+            Optional[str]: URL изображения или None, если буфер пуст
+                           или все просмотренные коты уже видены
+        """
+        cat_url = None
+        for _ in range(min(len(self._buffer), SEEN_CATS_MAX_SKIPS + 1)):
+            candidate = self._buffer.popleft()
+            if user_id is None or not seen_cats.seen(user_id, candidate):
+                cat_url = candidate
+                break
+            self._buffer.append(candidate)
+
+        if cat_url is None:
+            self.misses += 1
+            self._trigger_refill()
+            return None
+
+        self._buffered.discard(cat_url)
+        self.hits += 1
+        # Показанный кот становится "текущим" для создания мема
+        cat_cache.append(cat_url)
+
+        if len(self._buffer) < self.low_watermark:
+            self._trigger_refill()
+        return cat_url
+
+    async def get_cat(self, user_id: Optional[int] = None) -> Optional[str]:
+        """
+        Взять кота из буфера, а при пустом буфере запросить его у API напрямую
+
+        Args:
+            user_id: ID пользователя; выданный кот запоминается как просмотренный
+
+        Returns:
+            Optional[str]: URL изображения или None, если API недоступно
+        """
+        cat_url = self.pop(user_id) or await get_random_cat_image()
+        if cat_url and user_id is not None:
+            seen_cats.mark(user_id, cat_url)
+        return cat_url
+
+    def _push(self, urls: List[str]) -> int:
+        """Добавить новые URL в буфер, не превышая верхний порог"""
+        added = 0
+        for cat_url in urls:
+            if len(self._buffer) >= self.high_watermark:
+                break
+            if cat_url in self._buffered:
+                continue
+            self._buffer.append(cat_url)
+            self._buffered.add(cat_url)
+            added += 1
+        self.fetched += added
+        return added
+
+    async def _refill(self) -> int:
+        """Дозагрузить буфер до верхнего порога пакетными запросами"""
+        deficit = self.high_watermark - len(self._buffer)
+        if deficit <= 0:
+            return 0
+
+        batches = min(self.concurrency, -(-deficit // self.batch_size))
+        results = await asyncio.gather(
+            *(get_multiple_cat_images(self.batch_size, remember=False) for _ in range(batches)),
+            return_exceptions=True
+        )
+
+        added = 0
+        for result in results:
+            if isinstance(result, list):
+                added += self._push(result)
+        return added
+
+    async def _run(self):
+        """Фоновый цикл: ждём сигнала и дозаполняем буфер"""
+        while True:
+            await self._refill_needed.wait()
+            self._refill_needed.clear()
+
+            while len(self._buffer) < self.high_watermark:
+                added = await self._refill()
+                if added == 0:
+                    # API недоступно или вернуло одни дубликаты — не долбим его в цикле
+                    logger.warning("Не удалось пополнить буфер котов, повтор позже")
+                    await asyncio.sleep(CAT_PREFETCH_RETRY_DELAY)
+                    break
+
+            if len(self._buffer) < self.low_watermark:
+                self._refill_needed.set()
+
+    async def start(self):
+        """Запустить фоновую дозагрузку (вызывается при запуске бота)"""
+        if self._task is not None:
+            return
+        self._refill_needed = asyncio.Event()
+        self._refill_needed.set()
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Предзагрузка котов запущена: пороги {self.low_watermark}/{self.high_watermark}, "
+            f"пакет {self.batch_size}, параллельно {self.concurrency}"
+        )
+
+    async def stop(self):
+        """Остановить фоновую дозагрузку"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._refill_needed = None
+        logger.info("Предзагрузка котов остановлена")
+
+    def stats(self) -> dict:
+        """Статистика буфера для мониторинга"""
+        total = self.hits + self.misses
+        return {
+            "buffered": len(self._buffer),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "fetched": self.fetched
+        }
+
+
+# Глобальный буфер котов
+cat_prefetcher = CatPrefetcher()
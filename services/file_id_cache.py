@@ -0,0 +1,260 @@
+import asyncio
+import json
+import os
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Union
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, InputFile, InputMediaPhoto, InlineKeyboardMarkup
+from config.settings import FILE_ID_CACHE_FILE, FILE_ID_CACHE_SIZE, FILE_ID_CACHE_FLUSH_INTERVAL
+from services.storage_service import resolve_storage_path
+
+logger = logging.getLogger('cat_meme_bot')
+
+
+class FileIdCache:
+    """
+    Постоянный кэш URL → file_id для уже отправленных фото
+
+    Повторная отправка по file_id не заставляет Telegram заново скачивать
+    изображение с исходного сервера. Размер ограничен, при переполнении
+    вытесняются давно не использованные записи.
+    """
+
+    def __init__(
+        self,
+        path: str = FILE_ID_CACHE_FILE,
+        max_size: int = FILE_ID_CACHE_SIZE,
+        flush_interval: float = FILE_ID_CACHE_FLUSH_INTERVAL
+    ):
+        """
+        Инициализация кэша
+
+        Args:
+            path: Файл для сохранения кэша между перезапусками
+            max_size: Максимальное количество записей
+            flush_interval: Период сохранения на диск, сек
+        """
+        self.path = resolve_storage_path(path)
+        self.max_size = max(1, max_size)
+        self.flush_interval = flush_interval
+
+        self._entries: OrderedDict = OrderedDict(self._load())
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self) -> dict:
+        """Прочитать сохранённый кэш (порядок записей — от старых к новым)"""
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Ошибка при загрузке кэша file_id: {e}")
+            return {}
+
+    def get(self, url: str) -> Optional[str]:
+        """Получить file_id по URL"""
+        file_id = self._entries.get(url)
+        if file_id is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(url)
+        self.hits += 1
+        return file_id
+
+    def put(self, url: str, file_id: str):
+        """Запомнить file_id для URL"""
+        if self._entries.get(url) == file_id:
+            self._entries.move_to_end(url)
+            return
+        self._entries[url] = file_id
+        self._entries.move_to_end(url)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        self._dirty = True
+
+    def discard(self, url: str):
+        """Забыть file_id (например, если Telegram его больше не принимает)"""
+        if self._entries.pop(url, None) is not None:
+            self._dirty = True
+
+    def remember(self, url: str, message: Optional[Message]):
+        """Запомнить file_id самого большого размера фото из отправленного сообщения"""
+        if not url or not url.startswith("http"):
+            # Загруженные пользователем фото и так хранятся как file_id
+            return
+        if message is not None and message.photo:
+            self.put(url, message.photo[-1].file_id)
+
+    def _write(self, snapshot: dict):
+        """Атомарно записать кэш в файл (выполняется в отдельном потоке)"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+    async def flush(self):
+        """Сохранить кэш на диск, если он изменился"""
+        if not self._dirty:
+            return
+        self._dirty = False
+        try:
+            await asyncio.to_thread(self._write, dict(self._entries))
+        except Exception as e:
+            self._dirty = True
+            logger.error(f"Ошибка при сохранении кэша file_id: {e}")
+
+    async def _flush_loop(self):
+        """Периодическое сохранение на диск"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self):
+        """Запустить периодическое сохранение"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+            logger.info(f"Кэш file_id загружен: {len(self._entries)} записей")
+
+    async def close(self):
+        """Остановить периодическое сохранение и сохранить кэш"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        """Статистика кэша для мониторинга"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0
+        }
+
+
+# Глобальный кэш file_id
+file_id_cache = FileIdCache()
+
+# Фрагменты ошибок Telegram, относящихся к самому файлу (file_id устарел или недоступен)
+_FILE_ERROR_MARKERS = (
+    "wrong file identifier",
+    "wrong remote file identifier",
+    "file reference",
+    "failed to get http url content",
+    "wrong type of the web page content",
+    "file_id"
+)
+
+
+# Фабрика файла для загрузки, когда у картинки нет URL (мем нарисован локально)
+PhotoUpload = Callable[[], Awaitable[Union[InputFile, str]]]
+
+
+def _is_file_error(error: TelegramBadRequest) -> bool:
+    """Ошибка относится к file_id, а не к сообщению (например, «message can't be edited»)"""
+    text = str(error).lower()
+    return any(marker in text for marker in _FILE_ERROR_MARKERS)
+
+
+async def answer_photo_cached(
+    message: Message,
+    url: Optional[str],
+    file_id: Optional[str] = None,
+    upload: Optional[PhotoUpload] = None,
+    **kwargs
+) -> Message:
+    """
+    Отправить фото, по возможности используя сохранённый file_id
+
+    Args:
+        message: Сообщение, в чат которого отправляется фото
+        url: Исходный URL изображения (None, если картинка есть только в Telegram)
+        file_id: Уже известный file_id (например, сохранённый в избранном)
+        upload: Откуда взять файл вместо url (url тогда только ключ кэша file_id)
+        **kwargs: Остальные параметры answer_photo (caption, reply_markup...)
+
+    Returns:
+        Message: Отправленное сообщение
+    """
+    cached_id = file_id or (file_id_cache.get(url) if url else None)
+    if cached_id:
+        try:
+            return await message.answer_photo(photo=cached_id, **kwargs)
+        except TelegramBadRequest as e:
+            if not url or not _is_file_error(e):
+                raise
+            logger.warning(f"file_id для {url} отклонён Telegram, отправляем по URL: {e}")
+            file_id_cache.discard(url)
+
+    photo = await upload() if upload else url
+    sent = await message.answer_photo(photo=photo, **kwargs)
+    file_id_cache.remember(url, sent)
+    return sent
+
+
+async def edit_photo_cached(
+    message: Message,
+    url: Optional[str],
+    file_id: Optional[str] = None,
+    caption: Optional[str] = None,
+    reply_markup: Optional[InlineKeyboardMarkup] = None,
+    upload: Optional[PhotoUpload] = None
+) -> Union[Message, bool]:
+    """
+    Заменить фото и подпись в уже отправленном сообщении, по возможности по file_id
+
+    Args:
+        message: Сообщение бота с фото, которое редактируется
+        url: Исходный URL изображения (None, если картинка есть только в Telegram)
+        file_id: Уже известный file_id (например, сохранённый в избранном)
+        caption: Новая подпись
+        reply_markup: Новая клавиатура
+        upload: Откуда взять файл вместо url (url тогда только ключ кэша file_id)
+
+    Returns:
+        Отредактированное сообщение (или True, если Telegram вернул только признак успеха)
+
+    Raises:
+        TelegramBadRequest: Сообщение нельзя отредактировать
+    """
+    async def edit(media: Union[InputFile, str]):
+        try:
+            return await message.edit_media(
+                media=InputMediaPhoto(media=media, caption=caption),
+                reply_markup=reply_markup
+            )
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                # Показан тот же мем — сообщение уже в нужном виде
+                return message
+            raise
+
+    cached_id = file_id or (file_id_cache.get(url) if url else None)
+    if cached_id:
+        try:
+            return await edit(cached_id)
+        except TelegramBadRequest as e:
+            if not url or not _is_file_error(e):
+                raise
+            logger.warning(f"file_id для {url} отклонён Telegram при редактировании, используем URL: {e}")
+            file_id_cache.discard(url)
+
+    edited = await edit(await upload() if upload else url)
+    if isinstance(edited, Message):
+        file_id_cache.remember(url, edited)
+    return edited
@@ -0,0 +1,272 @@
+import asyncio
+import json
+import sqlite3
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Mapping, Optional, Tuple
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from config.settings import (
+    FSM_BACKEND,
+    FSM_DB_FILE,
+    FSM_IDLE_TTL,
+    FSM_DISK_TTL,
+    FSM_MEMORY_BYTES,
+    FSM_SWEEP_INTERVAL
+)
+from services.storage_service import resolve_storage_path
+
+logger = logging.getLogger('cat_meme_bot')
+
+# Примерный расход памяти на запись без учёта данных
+_RECORD_OVERHEAD = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_fsm_updated_at ON fsm (updated_at);
+"""
+
+
+class _Record:
+    """Состояние и данные FSM одного пользователя в памяти"""
+
+    __slots__ = ("state", "data", "touched", "size")
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any]):
+        self.state = state
+        self.data = data
+        self.touched = time.monotonic()
+        self.size = _RECORD_OVERHEAD + len(json.dumps(data, ensure_ascii=False, default=str)) + len(state or "")
+
+
+class BoundedFSMStorage(BaseStorage):
+    """
+    Хранилище FSM с ограниченной памятью и необязательной базой на диске
+
+    В памяти держатся только недавно активные пользователи: записи,
+    простаивающие дольше idle_ttl, выгружаются фоновой задачей, а при
+    превышении бюджета вытесняются давно не использованные. С базой
+    каждое изменение сразу записывается на диск (write-through), поэтому
+    выгруженная запись при следующем обращении читается из базы, а
+    состояние переживает перезапуск. Без базы выгруженное состояние теряется.
+    """
+
+    def __init__(
+        self,
+        db_path: str = FSM_DB_FILE if FSM_BACKEND == "sqlite" else "",
+        idle_ttl: float = FSM_IDLE_TTL,
+        disk_ttl: float = FSM_DISK_TTL,
+        memory_bytes: int = FSM_MEMORY_BYTES,
+        sweep_interval: float = FSM_SWEEP_INTERVAL
+    ):
+        """
+        Инициализация хранилища
+
+        Args:
+            db_path: Путь к базе SQLite (пустая строка — только память)
+            idle_ttl: Простой, после которого запись выгружается из памяти, сек
+            disk_ttl: Простой, после которого запись удаляется из базы, сек (0 — не удалять)
+            memory_bytes: Бюджет памяти на записи, байт
+            sweep_interval: Период фоновой очистки, сек
+        """
+        self.db_path = resolve_storage_path(db_path) if db_path else None
+        self.idle_ttl = idle_ttl
+        self.disk_ttl = disk_ttl
+        self.memory_bytes = memory_bytes
+        self.sweep_interval = sweep_interval
+
+        self._key_builder = DefaultKeyBuilder(with_bot_id=True, with_business_connection_id=True, with_destiny=True)
+        self._records: OrderedDict = OrderedDict()  # ключ -> _Record, от давно не использованных к свежим
+        self._memory_used = 0
+        self._task: Optional[asyncio.Task] = None
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        if self.db_path is not None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            # Один поток — одно соединение: SQLite-соединение нельзя делить между потоками
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-sqlite")
+
+        self.disk_reads = 0
+        self.evicted = 0
+
+    async def _run(self, func, *args):
+        """Выполнить функцию в потоке базы данных"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Получить соединение (создаётся лениво в потоке базы)"""
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+            logger.info(f"Открыта база состояний FSM: {self.db_path}")
+        return self._conn
+
+    def _db_load(self, key: str) -> Optional[Tuple[Optional[str], Dict[str, Any]]]:
+        """Прочитать запись из базы (выполняется в потоке базы)"""
+        row = self._connection().execute("SELECT state, data FROM fsm WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def _db_save(self, key: str, state: Optional[str], data: Dict[str, Any]):
+        """Записать или удалить запись в базе (выполняется в потоке базы)"""
+        conn = self._connection()
+        with conn:
+            if state is None and not data:
+                conn.execute("DELETE FROM fsm WHERE key = ?", (key,))
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO fsm (key, state, data, updated_at) VALUES (?, ?, ?, ?)",
+                    (key, state, json.dumps(data, ensure_ascii=False), time.time())
+                )
+
+    def _db_expire(self, max_age: float) -> int:
+        """Удалить из базы записи, не менявшиеся дольше max_age (выполняется в потоке базы)"""
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute("DELETE FROM fsm WHERE updated_at < ?", (time.time() - max_age,))
+        return cursor.rowcount
+
+    def _remember(self, key: str, record: _Record):
+        """Положить запись в память, вытесняя давно не использованные сверх бюджета"""
+        old = self._records.pop(key, None)
+        if old is not None:
+            self._memory_used -= old.size
+        self._records[key] = record
+        self._memory_used += record.size
+        while self._memory_used > self.memory_bytes and len(self._records) > 1:
+            _, evicted = self._records.popitem(last=False)
+            self._memory_used -= evicted.size
+            self.evicted += 1
+
+    async def _get_record(self, key: StorageKey) -> _Record:
+        """Найти запись в памяти, при промахе — в базе"""
+        str_key = self._key_builder.build(key)
+        record = self._records.get(str_key)
+        if record is not None:
+            record.touched = time.monotonic()
+            self._records.move_to_end(str_key)
+            return record
+
+        loaded = None
+        if self._executor is not None:
+            self.disk_reads += 1
+            loaded = await self._run(self._db_load, str_key)
+            # Пока шло чтение, запись могла появиться в памяти
+            record = self._records.get(str_key)
+            if record is not None:
+                return record
+
+        # Пустая запись тоже запоминается, чтобы не ходить в базу на каждое обновление
+        record = _Record(*loaded) if loaded else _Record(None, {})
+        self._remember(str_key, record)
+        return record
+
+    async def _save(self, key: StorageKey, state: Optional[str], data: Dict[str, Any]):
+        """Обновить запись в памяти и сразу записать её на диск"""
+        str_key = self._key_builder.build(key)
+        self._remember(str_key, _Record(state, data))
+        if self._executor is not None:
+            await self._run(self._db_save, str_key, state, data)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        """Установить состояние"""
+        record = await self._get_record(key)
+        new_state = state.state if isinstance(state, State) else state
+        await self._save(key, new_state, record.data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        """Получить состояние"""
+        return (await self._get_record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        """Заменить данные"""
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        record = await self._get_record(key)
+        await self._save(key, record.state, data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        """Получить копию данных"""
+        return (await self._get_record(key)).data.copy()
+
+    def _sweep_memory(self) -> int:
+        """Выгрузить из памяти записи, простаивающие дольше idle_ttl"""
+        deadline = time.monotonic() - self.idle_ttl
+        dropped = 0
+        # Записи упорядочены по последнему обращению, поэтому достаточно идти с начала
+        while self._records:
+            record = next(iter(self._records.values()))
+            if record.touched > deadline:
+                break
+            self._records.popitem(last=False)
+            self._memory_used -= record.size
+            dropped += 1
+        return dropped
+
+    async def _sweep_loop(self):
+        """Периодическая очистка памяти и базы"""
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            dropped = self._sweep_memory()
+            expired = 0
+            if self._executor is not None and self.disk_ttl > 0:
+                try:
+                    expired = await self._run(self._db_expire, self.disk_ttl)
+                except Exception as e:
+                    logger.error(f"Ошибка при очистке базы состояний FSM: {e}")
+            if dropped or expired:
+                logger.info(f"Очистка FSM: выгружено из памяти {dropped}, удалено из базы {expired}")
+
+    async def start(self):
+        """Открыть базу и запустить фоновую очистку"""
+        if self._executor is not None:
+            await self._run(self._connection)
+        if self._task is None:
+            self._task = asyncio.create_task(self._sweep_loop())
+
+    async def close(self) -> None:
+        """Остановить очистку и закрыть базу (повторный вызов безопасен)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self._executor is not None:
+            def _close():
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+
+            executor, self._executor = self._executor, None
+            await asyncio.get_running_loop().run_in_executor(executor, _close)
+            executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        """Статистика хранилища для мониторинга"""
+        return {
+            "records": len(self._records),
+            "memory_bytes": self._memory_used,
+            "disk_reads": self.disk_reads,
+            "evicted": self.evicted
+        }
+
+
+# Глобальное хранилище состояний FSM
+fsm_storage = BoundedFSMStorage()
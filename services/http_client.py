@@ -0,0 +1,68 @@
+import aiohttp
+import logging
+from typing import Optional
+from config.settings import (
+    HTTP_POOL_LIMIT,
+    HTTP_POOL_LIMIT_PER_HOST,
+    HTTP_DNS_CACHE_TTL,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_CONNECT_TIMEOUT
+)
+
+logger = logging.getLogger('cat_meme_bot')
+
+
+def request_timeout(total: Optional[float]) -> aiohttp.ClientTimeout:
+    """Таймаут отдельного запроса с общим ограничением на подключение"""
+    return aiohttp.ClientTimeout(total=total, connect=HTTP_CONNECT_TIMEOUT)
+
+
+class HttpClient:
+    """Долгоживущая HTTP-сессия с общим пулом соединений для всех внешних API"""
+
+    def __init__(self):
+        """Инициализация клиента (сессия создаётся в start)"""
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        """Создать сессию с keep-alive пулом и DNS-кэшем"""
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            use_dns_cache=True,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT
+        )
+        # Общий таймаут задаётся в каждом запросе через request_timeout
+        return aiohttp.ClientSession(connector=connector, timeout=request_timeout(None))
+
+    async def start(self):
+        """Открыть сессию (вызывается при запуске бота)"""
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+            logger.info(
+                f"HTTP-клиент запущен: пул {HTTP_POOL_LIMIT}, "
+                f"на хост {HTTP_POOL_LIMIT_PER_HOST}, DNS-кэш {HTTP_DNS_CACHE_TTL} сек"
+            )
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """
+        Получить общую сессию
+
+        Если start() ещё не вызывался (например, в скриптах), сессия создаётся лениво.
+        """
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+        return self._session
+
+    async def close(self):
+        """Закрыть сессию и все соединения пула"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("HTTP-клиент остановлен")
+        self._session = None
+
+
+# Глобальный экземпляр HTTP-клиента
+http_client = HttpClient()
@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Optional
+from config.settings import IMAGE_WORKERS, IMAGE_QUEUE_SIZE, IMAGE_JOB_TIMEOUT
+
+logger = logging.getLogger('cat_meme_bot')
+
+
+class ImageQueueFullError(Exception):
+    """Очередь заданий пула изображений переполнена"""
+
+
+def _warmup() -> int:
+    """Заранее импортировать Pillow в процессе-обработчике"""
+    import services.meme_renderer  # noqa: F401
+    return os.getpid()
+
+
+def _render_meme_job(shm_name: str, size: int, top_text: str, bottom_text: str) -> bytes:
+    """
+    Задание для процесса: декодировать фон, нарисовать подписи, уменьшить и закодировать
+
+    Фон передаётся через разделяемую память, а не через pickle в канал процесса.
+    """
+    from services.meme_renderer import render_meme
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        return render_meme(shm.buf[:size], top_text, bottom_text)
+    finally:
+        shm.close()
+
+
+class ImageWorkerPool:
+    """
+    Пул процессов для CPU-тяжёлой работы с изображениями
+
+    Работа с Pillow не выполняется в цикле событий бота. Количество заданий
+    в работе и в очереди ограничено: при переполнении новое задание сразу
+    отклоняется, а не копится в памяти.
+    """
+
+    def __init__(
+        self,
+        workers: int = IMAGE_WORKERS,
+        queue_size: int = IMAGE_QUEUE_SIZE,
+        job_timeout: float = IMAGE_JOB_TIMEOUT
+    ):
+        """
+        Инициализация пула (процессы запускаются в start)
+
+        Args:
+            workers: Количество процессов (0 — по числу ядер)
+            queue_size: Сколько заданий может ждать сверх занятых процессов
+            job_timeout: Таймаут одного задания, сек
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = max(0, queue_size)
+        self.job_timeout = job_timeout
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots = asyncio.Semaphore(self.workers + self.queue_size)
+
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.restarts = 0
+
+    @property
+    def running(self) -> bool:
+        """Пул запущен"""
+        return self._executor is not None
+
+    async def start(self):
+        """Запустить процессы и прогреть их"""
+        if self._executor is not None:
+            return
+        self._executor = self._create_executor()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._executor, _warmup) for _ in range(self.workers)))
+        logger.info(f"Пул обработки изображений запущен: {self.workers} процессов, очередь {self.queue_size}")
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        """
+        Создать пул процессов
+
+        spawn безопаснее fork для процесса с запущенным циклом событий и потоками.
+        Процесс spawn заново импортирует главный модуль (bot.py), поэтому у него
+        не должно быть побочных эффектов при импорте.
+        """
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def _restart(self, broken: ProcessPoolExecutor):
+        """Заменить сломанный пул новым (если его ещё не заменило другое задание)"""
+        if self._executor is not broken:
+            return
+        self.restarts += 1
+        logger.error("Процесс обработки изображений аварийно завершился, пул перезапускается")
+        self._executor = self._create_executor()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    async def close(self):
+        """Дождаться текущих заданий и остановить процессы"""
+        if self._executor is None:
+            return
+        executor, self._executor = self._executor, None
+        await asyncio.to_thread(executor.shutdown, True, cancel_futures=True)
+        logger.info("Пул обработки изображений остановлен")
+
+    async def render_meme(self, image_data: bytes, top_text: str, bottom_text: str) -> bytes:
+        """
+        Нарисовать мем в отдельном процессе
+
+        Args:
+            image_data: Байты фонового изображения
+            top_text: Верхняя подпись
+            bottom_text: Нижняя подпись
+
+        Returns:
+            bytes: Закодированное изображение мема
+
+        Raises:
+            ImageQueueFullError: Очередь заданий переполнена
+            asyncio.TimeoutError: Задание не уложилось в таймаут
+            BrokenProcessPool: Процесс упал и после перезапуска пула
+        """
+        if self._executor is None:
+            # Пул не запущен (например, в скриптах) — рисуем в потоке
+            from services.meme_renderer import render_meme
+            return await asyncio.to_thread(render_meme, image_data, top_text, bottom_text)
+
+        try:
+            return await self._render_in_pool(image_data, top_text, bottom_text)
+        except BrokenProcessPool:
+            # Процесс упал (например, не хватило памяти на большой картинке):
+            # без перезапуска пула все следующие задания падали бы так же
+            pass
+        return await self._render_in_pool(image_data, top_text, bottom_text)
+
+    async def _render_in_pool(self, image_data: bytes, top_text: str, bottom_text: str) -> bytes:
+        """Отправить задание в пул и дождаться результата (сломанный пул перезапускается)"""
+        if self._slots.locked():
+            self.rejected += 1
+            raise ImageQueueFullError("Очередь обработки изображений переполнена")
+
+        # Слот и разделяемая память освобождаются, только когда процесс закончил
+        # задание (или оно отменено в очереди), а не когда мы перестали его ждать:
+        # иначе при таймаутах пул принимал бы задания сверх лимита
+        await self._slots.acquire()
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        shm = None
+        try:
+            shm = shared_memory.SharedMemory(create=True, size=max(1, len(image_data)))
+            shm.buf[:len(image_data)] = image_data
+            job = executor.submit(
+                _render_meme_job, shm.name, len(image_data), top_text, bottom_text
+            )
+        except BaseException as e:
+            self._finish_job(shm)
+            if isinstance(e, BrokenProcessPool):
+                self._restart(executor)
+            raise
+        job.add_done_callback(lambda _: self._on_job_done(loop, shm))
+
+        try:
+            # При таймауте ожидание отменяется; задание из очереди будет снято,
+            # а уже запущенное доработает и освободит слот само
+            result = await asyncio.wait_for(asyncio.wrap_future(job), timeout=self.job_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise
+        self.completed += 1
+        return result
+
+    def _on_job_done(self, loop: asyncio.AbstractEventLoop, shm: shared_memory.SharedMemory):
+        """Задание завершено (вызывается в служебном потоке пула)"""
+        try:
+            loop.call_soon_threadsafe(self._finish_job, shm)
+        except RuntimeError:
+            # Цикл событий уже закрыт — освобождаем хотя бы память
+            self._release_memory(shm)
+
+    def _finish_job(self, shm: Optional[shared_memory.SharedMemory]):
+        """Освободить разделяемую память и слот задания"""
+        self._release_memory(shm)
+        self._slots.release()
+
+    @staticmethod
+    def _release_memory(shm: Optional[shared_memory.SharedMemory]):
+        """Закрыть и удалить блок разделяемой памяти"""
+        if shm is None:
+            return
+        shm.close()
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        """Статистика пула для мониторинга"""
+        return {
+            "workers": self.workers,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "restarts": self.restarts
+        }
+
+
+# Глобальный пул обработки изображений
+image_workers = ImageWorkerPool()
@@ -0,0 +1,354 @@
+import asyncio
+import json
+import os
+import logging
+from typing import Dict, Any, Optional, List, Tuple
+from pathlib import Path
+from config.settings import (
+    FAVORITES_JOURNAL_FILE,
+    FAVORITES_SNAPSHOT_FILE,
+    FAVORITES_JOURNAL_COMPACT_BYTES,
+    FAVORITES_JOURNAL_BATCH
+)
+from services.storage_service import FAVORITES_FILE, resolve_storage_path
+from services.memory_storage import InMemoryFavoritesStorage, _meme_key
+
+logger = logging.getLogger('cat_meme_bot')
+
+
+class JournalFavoritesStorage(InMemoryFavoritesStorage):
+    """
+    Хранилище избранного на журнале операций
+
+    Данные живут в памяти, а каждая операция (add/remove/clear) дописывается
+    в конец журнала. Фоновая задача собирает накопившиеся операции в пакет
+    и записывает его одним fsync; к памяти операции применяются только после
+    успешной записи и в порядке журнала, поэтому память всегда совпадает
+    с повтором журнала. Когда журнал вырастает больше порога,
+    он переименовывается, текущее состояние сохраняется снимком, а старый
+    журнал удаляется. Каждая запись имеет порядковый номер, поэтому при
+    восстановлении операции, уже вошедшие в снимок, пропускаются.
+    """
+
+    def __init__(
+        self,
+        journal_path: str = FAVORITES_JOURNAL_FILE,
+        snapshot_path: str = FAVORITES_SNAPSHOT_FILE,
+        compact_bytes: int = FAVORITES_JOURNAL_COMPACT_BYTES,
+        batch_size: int = FAVORITES_JOURNAL_BATCH,
+        legacy_path: Path = FAVORITES_FILE
+    ):
+        """
+        Инициализация хранилища: загрузка снимка и повтор журнала
+
+        Args:
+            journal_path: Путь к журналу операций
+            snapshot_path: Путь к снимку состояния
+            compact_bytes: Размер журнала, после которого запускается компактификация
+            batch_size: Максимум операций в одной групповой записи
+            legacy_path: JSON-файл старого хранилища для первого запуска
+        """
+        self.journal_path = resolve_storage_path(journal_path)
+        self.old_journal_path = self.journal_path.with_name(self.journal_path.name + ".old")
+        self.legacy_path = Path(legacy_path)
+        self.compact_bytes = compact_bytes
+        self.batch_size = max(1, batch_size)
+
+        self._seq = 0  # Номер последней операции, поставленной в журнал
+        self._applied_seq = 0  # Номер последней операции, применённой к памяти
+        self._snapshot_seq = 0  # Номер последней операции, вошедшей в снимок
+        self._migrated = False
+        self._snapshot_broken = False  # Снимок не прочитался: перезаписывать его нельзя
+
+        super().__init__(resolve_storage_path(snapshot_path))
+
+        replayed = 0
+        for path in (self.old_journal_path, self.journal_path):
+            replayed += self._replay(path)
+        self._applied_seq = self._seq
+        logger.info(f"Журнал избранного восстановлен: повторено {replayed} операций")
+
+        if self._migrated:
+            # Фиксируем перенесённые из JSON данные снимком, чтобы не зависеть от старого файла
+            self._write_snapshot({"seq": self._seq, "users": dict(self._data)})
+
+        self._journal_size = self.journal_path.stat().st_size if self.journal_path.exists() else 0
+        self._journal_file = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._compaction_task: Optional[asyncio.Task] = None
+
+    def _load_file(self) -> Dict[str, Any]:
+        """Загрузить снимок, а при его отсутствии — данные старого JSON-хранилища"""
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    snapshot = json.load(f)
+                self._seq = self._snapshot_seq = snapshot.get("seq", 0)
+                return snapshot.get("users", {})
+            except (OSError, json.JSONDecodeError, AttributeError) as e:
+                # Без снимка в памяти только операции из журнала; если записать такое
+                # состояние новым снимком, избранное остальных пользователей пропадёт
+                self._snapshot_broken = True
+                logger.error(
+                    f"Снимок избранного {self.path} не прочитан ({e}): загружены только операции "
+                    f"из журнала, компактификация отключена до восстановления снимка"
+                )
+                return {}
+
+        if not self.journal_path.exists() and self.legacy_path.exists():
+            try:
+                with open(self.legacy_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    self._migrated = True
+                    logger.info(f"Избранное перенесено из {self.legacy_path}")
+                    return data
+            except (OSError, json.JSONDecodeError) as e:
+                logger.error(f"Ошибка при загрузке данных: {e}")
+        return {}
+
+    def _set_favorites(self, user_key: str, favorites: List[Dict[str, str]]):
+        """Заменить список пользователя (запись на диск идёт через журнал)"""
+        user_data = dict(self._data.get(user_key, {}))
+        user_data["favorites"] = favorites
+        self._data[user_key] = user_data
+
+    def _apply_record(self, record: Dict[str, Any]) -> bool:
+        """Применить запись журнала к состоянию в памяти"""
+        op = record["op"]
+        user_key = record["u"]
+        if op == "add":
+            return self._apply_add(user_key, record["m"])
+        if op == "remove":
+            return self._apply_remove(user_key, record["i"])
+        if op == "clear":
+            return self._apply_clear(user_key)
+        return False
+
+    def _replay(self, path: Path) -> int:
+        """Повторить операции из журнала, обрезав недописанный хвост"""
+        if not path.exists():
+            return 0
+
+        replayed = 0
+        valid_size = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("недописанная запись")
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Журнал {path.name} обрезан после {valid_size} байт")
+                    break
+                valid_size += len(line)
+                if record["s"] <= self._snapshot_seq:
+                    continue
+                self._apply_record(record)
+                self._seq = max(self._seq, record["s"])
+                replayed += 1
+
+        if valid_size < path.stat().st_size:
+            # Запись прервалась на середине — отбрасываем её, чтобы новые операции шли после целых строк
+            with open(path, 'r+b') as f:
+                f.truncate(valid_size)
+        return replayed
+
+    def _apply_written(self, record: Dict[str, Any]) -> bool:
+        """Применить к памяти операцию, уже записанную в журнал"""
+        applied = self._apply_record(record)
+        self._applied_seq = record["s"]
+        return applied
+
+    async def _append(self, record: Dict[str, Any]) -> bool:
+        """
+        Записать операцию в журнал (групповой записью) и применить её к памяти
+
+        Returns:
+            bool: True если операция записана и изменила данные
+        """
+        self._seq += 1
+        record["s"] = self._seq
+        line = (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n").encode('utf-8')
+
+        if self._queue is None:
+            # Фоновая запись не запущена (например, в скриптах) — пишем сразу
+            try:
+                await asyncio.to_thread(self._write_batch, line)
+                self._journal_size += len(line)
+            except Exception as e:
+                logger.error(f"Ошибка при записи журнала избранного: {e}")
+                return False
+            return self._apply_written(record)
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((line, record, future))
+        return await future
+
+    def _write_batch(self, data: bytes):
+        """Дописать пакет в журнал одним fsync (выполняется в отдельном потоке)"""
+        if self._journal_file is None:
+            self._journal_file = open(self.journal_path, 'ab')
+        self._journal_file.write(data)
+        self._journal_file.flush()
+        os.fsync(self._journal_file.fileno())
+
+    async def _writer_loop(self):
+        """Групповая запись: всё, что накопилось в очереди, уходит одним пакетом"""
+        stopping = False
+        while not stopping:
+            batch: List[Tuple[bytes, Dict[str, Any], asyncio.Future]] = []
+            item = await self._queue.get()
+            while True:
+                if item is None:
+                    stopping = True
+                else:
+                    batch.append(item)
+                if len(batch) >= self.batch_size or self._queue.empty():
+                    break
+                item = self._queue.get_nowait()
+
+            if not batch:
+                continue
+
+            data = b"".join(line for line, _, _ in batch)
+            try:
+                await asyncio.to_thread(self._write_batch, data)
+                self._journal_size += len(data)
+                ok = True
+            except Exception as e:
+                logger.error(f"Ошибка при записи журнала избранного: {e}")
+                ok = False
+
+            # Применяем сразу и по порядку, до снимка: память и снимок не содержат
+            # операций, которых нет в журнале
+            for _, record, future in batch:
+                result = self._apply_written(record) if ok else False
+                if not future.done():
+                    future.set_result(result)
+
+            if (ok and self._journal_size >= self.compact_bytes and self._compaction_task is None
+                    and not self._snapshot_broken):
+                await self._start_compaction()
+
+    def _rotate_journal(self):
+        """Переименовать текущий журнал, чтобы новые операции шли в новый файл"""
+        if self._journal_file is not None:
+            self._journal_file.close()
+            self._journal_file = None
+        if self.journal_path.exists():
+            os.replace(self.journal_path, self.old_journal_path)
+
+    async def _start_compaction(self):
+        """Зафиксировать состояние и запустить запись снимка в фоне"""
+        # Снимок и номер берутся синхронно: всё с номером <= seq уже есть в памяти,
+        # а операции из очереди попадут в новый журнал и повторятся поверх снимка
+        seq = self._applied_seq
+        snapshot = {"seq": seq, "users": dict(self._data)}
+
+        # Если предыдущий старый журнал ещё не удалён, новый снимок покроет и его
+        if not self.old_journal_path.exists():
+            await asyncio.to_thread(self._rotate_journal)
+        # Счётчик сбрасывается и без переименования: иначе при неудачных снимках
+        # компактификация запускалась бы после каждого пакета
+        self._journal_size = 0
+
+        self._compaction_task = asyncio.create_task(self._compact(snapshot))
+
+    async def _compact(self, snapshot: Dict[str, Any]):
+        """Записать снимок и удалить старый журнал"""
+        try:
+            if await asyncio.to_thread(self._write_snapshot, snapshot):
+                self._snapshot_seq = snapshot["seq"]
+                await asyncio.to_thread(self.old_journal_path.unlink, True)
+                logger.info(f"Журнал избранного компактифицирован до операции {snapshot['seq']}")
+        except Exception as e:
+            logger.error(f"Ошибка при компактификации журнала избранного: {e}")
+        finally:
+            self._compaction_task = None
+
+    async def add_favorite(self, user_id: int, meme_data: Dict[str, str]) -> bool:
+        """
+        Добавить мем в избранное пользователя
+
+        Args:
+            user_id: ID пользователя
+            meme_data: Данные мема {"url": "...", "top": "...", "bottom": "..."}
+
+        Returns:
+            bool: True если успешно добавлено
+        """
+        user_key = str(user_id)
+        if _meme_key(meme_data) in self._index.get(user_key, ()):
+            logger.info(f"Мем уже в избранном пользователя {user_id}")
+            return False
+
+        if await self._append({"op": "add", "u": user_key, "m": meme_data}):
+            logger.info(f"Мем добавлен в избранное пользователя {user_id}")
+            return True
+        return False
+
+    async def remove_favorite(self, user_id: int, meme_index: int) -> bool:
+        """
+        Удалить мем из избранного по индексу
+
+        Args:
+            user_id: ID пользователя
+            meme_index: Индекс мема в списке избранного
+
+        Returns:
+            bool: True если успешно удалено
+        """
+        user_key = str(user_id)
+        if not (0 <= meme_index < len(self._data.get(user_key, {}).get("favorites", []))):
+            return False
+
+        if await self._append({"op": "remove", "u": user_key, "i": meme_index}):
+            logger.info(f"Мем удален из избранного пользователя {user_id}")
+            return True
+        return False
+
+    async def clear_favorites(self, user_id: int) -> bool:
+        """
+        Очистить все избранные мемы пользователя
+
+        Args:
+            user_id: ID пользователя
+
+        Returns:
+            bool: True если успешно очищено
+        """
+        user_key = str(user_id)
+        if user_key not in self._data:
+            return False
+
+        if await self._append({"op": "clear", "u": user_key}):
+            logger.info(f"Избранное очищено для пользователя {user_id}")
+            return True
+        return False
+
+    async def flush(self) -> bool:
+        """Журнал пишется сразу при каждой операции, отдельный сброс не нужен"""
+        return True
+
+    async def start(self):
+        """Запустить фоновую групповую запись журнала"""
+        if self._writer_task is None:
+            self._queue = asyncio.Queue()
+            self._writer_task = asyncio.create_task(self._writer_loop())
+
+    async def close(self):
+        """Дописать очередь, дождаться компактификации и закрыть журнал"""
+        if self._writer_task is not None:
+            await self._queue.put(None)
+            await self._writer_task
+            self._writer_task = None
+            self._queue = None
+
+        if self._compaction_task is not None:
+            await self._compaction_task
+
+        if self._journal_file is not None:
+            self._journal_file.close()
+            self._journal_file = None
@@ -0,0 +1,541 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterable, Optional
+from config.settings import (
+    FAVORITES_FLUSH_INTERVAL,
+    MEME_BLOBS_DB_FILE,
+    MEME_BLOBS_CACHE_SIZE,
+    MEME_BLOBS_GC_INTERVAL,
+    MEME_BLOBS_GC_GRACE
+)
+from services.storage_service import resolve_storage_path
+from services.tracing import span
+
+logger = logging.getLogger('cat_meme_bot')
+
+# Ссылка на мем в записи избранного: "meme:<ключ>"
+REF_PREFIX = "meme:"
+
+# Поля записи избранного, которые остаются у пользователя, а не в общем мему
+_PER_USER_FIELDS = ("created_at",)
+
+# Удалений за один проход сборщика (чтобы не держать блокировку базы долго)
+_GC_BATCH = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memes (
+    key TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    refcount INTEGER NOT NULL,
+    released_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_memes_released ON memes (released_at) WHERE refcount <= 0;
+"""
+
+
+def meme_key(meme_data: Dict[str, Any]) -> str:
+    """Ключ мема: хэш тройки (url, top, bottom)"""
+    triple = [meme_data.get("url") or "", meme_data.get("top") or "", meme_data.get("bottom") or ""]
+    raw = json.dumps(triple, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()[:32]
+
+
+def _ref_key(record: Dict[str, Any]) -> Optional[str]:
+    """Ключ мема из записи избранного (None — запись старого формата)"""
+    url = record.get("url") or ""
+    if url.startswith(REF_PREFIX):
+        return url[len(REF_PREFIX):]
+    return None
+
+
+class MemeBlobStore:
+    """
+    Общее для всех пользователей хранилище мемов с подсчётом ссылок
+
+    Каждый уникальный мем (url, подписи, file_id и прочие поля) хранится один
+    раз в SQLite, а избранное пользователей ссылается на него по ключу.
+    Мем без ссылок удаляется фоновым сборщиком не сразу, а через grace
+    секунд: повторно добавленный мем сохранит свой file_id. Горячие мемы
+    кэшируются в памяти (LRU).
+
+    Ссылка учитывается до записи в избранное, а освобождается только после
+    того, как бэкенд сохранил удаление на диск (DeduplicatedFavoritesStorage).
+    Поэтому после сбоя счётчик может оказаться только завышенным: мем
+    останется в базе лишним, но не будет удалён, пока на него ссылается
+    избранное.
+    """
+
+    def __init__(
+        self,
+        db_path: str = MEME_BLOBS_DB_FILE,
+        cache_size: int = MEME_BLOBS_CACHE_SIZE,
+        gc_interval: float = MEME_BLOBS_GC_INTERVAL,
+        gc_grace: float = MEME_BLOBS_GC_GRACE
+    ):
+        """
+        Инициализация хранилища
+
+        Args:
+            db_path: Путь к файлу базы мемов
+            cache_size: Максимум мемов в кэше памяти
+            gc_interval: Период фоновой сборки мусора, сек
+            gc_grace: Сколько хранить мем без ссылок, сек
+        """
+        self.db_path = resolve_storage_path(db_path)
+        self.cache_size = max(1, cache_size)
+        self.gc_interval = gc_interval
+        self.gc_grace = gc_grace
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="meme-blobs")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._task = None
+        self.hits = 0
+        self.misses = 0
+        self.collected = 0
+
+    async def _run(self, func, *args):
+        """Выполнить функцию в потоке базы"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Получить соединение (создаётся лениво в потоке базы)"""
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+            logger.info(f"Открыта база мемов: {self.db_path}")
+        return self._conn
+
+    def _remember(self, key: str, meme: Dict[str, Any]):
+        """Положить мем в кэш памяти"""
+        self._cache[key] = meme
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _acquire(self, key: str, meme: Dict[str, Any]) -> Dict[str, Any]:
+        """Добавить ссылку на мем (выполняется в потоке базы)"""
+        conn = self._connection()
+        with conn:
+            row = conn.execute("SELECT data FROM memes WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                stored = meme
+                conn.execute(
+                    "INSERT INTO memes (key, data, refcount, released_at) VALUES (?, ?, 1, NULL)",
+                    (key, json.dumps(stored, ensure_ascii=False))
+                )
+                return stored
+
+            # Дополняем мем новыми полями (например, file_id), известные не перезаписываем
+            stored = json.loads(row[0])
+            missing = {k: v for k, v in meme.items() if v and not stored.get(k)}
+            if missing:
+                stored.update(missing)
+                conn.execute(
+                    "UPDATE memes SET data = ?, refcount = MAX(refcount, 0) + 1, released_at = NULL WHERE key = ?",
+                    (json.dumps(stored, ensure_ascii=False), key)
+                )
+            else:
+                conn.execute(
+                    "UPDATE memes SET refcount = MAX(refcount, 0) + 1, released_at = NULL WHERE key = ?",
+                    (key,)
+                )
+            return stored
+
+    async def acquire(self, key: str, meme: Dict[str, Any]):
+        """
+        Добавить ссылку на мем, создав его при первом добавлении
+
+        Args:
+            key: Ключ мема (meme_key)
+            meme: Общие поля мема
+        """
+        with span("meme_blobs.acquire"):
+            stored = await self._run(self._acquire, key, meme)
+        self._remember(key, stored)
+
+    def _release(self, keys: List[str]):
+        """Убрать ссылки на мемы (выполняется в потоке базы)"""
+        conn = self._connection()
+        now = time.time()
+        with conn:
+            conn.executemany(
+                "UPDATE memes SET refcount = refcount - 1, "
+                "released_at = CASE WHEN refcount <= 1 THEN ? ELSE NULL END WHERE key = ?",
+                [(now, key) for key in keys]
+            )
+
+    async def release(self, keys: Iterable[str]):
+        """
+        Убрать ссылки на мемы; мемы без ссылок удалит сборщик
+
+        Args:
+            keys: Ключи мемов (по одному на удалённую ссылку)
+        """
+        keys = list(keys)
+        if keys:
+            await self._run(self._release, keys)
+
+    def _load(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Прочитать мемы по ключам (выполняется в потоке базы)"""
+        conn = self._connection()
+        found = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = conn.execute(
+                f"SELECT key, data FROM memes WHERE key IN ({','.join('?' * len(chunk))})",
+                chunk
+            ).fetchall()
+            found.update((key, json.loads(data)) for key, data in rows)
+        return found
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Получить мемы по ключам (сначала из кэша памяти)
+
+        Args:
+            keys: Ключи мемов
+
+        Returns:
+            Dict: Ключ -> общие поля мема (отсутствующие ключи пропускаются)
+        """
+        found = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            meme = self._cache.get(key)
+            if meme is None:
+                missing.append(key)
+            else:
+                self._cache.move_to_end(key)
+                found[key] = meme
+        self.hits += len(found)
+        self.misses += len(missing)
+
+        if missing:
+            with span("meme_blobs.load", keys=len(missing)):
+                loaded = await self._run(self._load, missing)
+            for key, meme in loaded.items():
+                self._remember(key, meme)
+            found.update(loaded)
+        return found
+
+    def _collect(self) -> List[str]:
+        """Удалить мемы без ссылок старше grace (выполняется в потоке базы)"""
+        conn = self._connection()
+        deadline = time.time() - self.gc_grace
+        removed = []
+        while True:
+            with conn:
+                rows = conn.execute(
+                    "SELECT key FROM memes WHERE refcount <= 0 AND released_at <= ? LIMIT ?",
+                    (deadline, _GC_BATCH)
+                ).fetchall()
+                keys = [row[0] for row in rows]
+                conn.executemany(
+                    "DELETE FROM memes WHERE key = ? AND refcount <= 0", [(key,) for key in keys]
+                )
+            removed.extend(keys)
+            if len(keys) < _GC_BATCH:
+                return removed
+
+    async def collect_garbage(self) -> int:
+        """
+        Удалить мемы, на которые давно никто не ссылается
+
+        Returns:
+            int: Количество удалённых мемов
+        """
+        removed = await self._run(self._collect)
+        for key in removed:
+            self._cache.pop(key, None)
+        self.collected += len(removed)
+        if removed:
+            logger.info(f"Сборщик мемов удалил {len(removed)} мемов без ссылок")
+        return len(removed)
+
+    async def _gc_loop(self):
+        """Периодическая сборка мусора"""
+        while True:
+            await asyncio.sleep(self.gc_interval)
+            try:
+                await self.collect_garbage()
+            except Exception as e:
+                logger.error(f"Ошибка сборки мусора мемов: {e}")
+
+    async def start(self):
+        """Открыть базу и запустить фоновую сборку мусора"""
+        await self._run(self._connection)
+        if self._task is None:
+            self._task = asyncio.create_task(self._gc_loop())
+
+    async def close(self):
+        """Остановить сборщик и закрыть базу"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        def _close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+        await self._run(_close)
+
+    def stats(self) -> dict:
+        """Статистика кэша мемов для мониторинга"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "collected": self.collected
+        }
+
+
+class DeduplicatedFavoritesStorage:
+    """
+    Избранное со ссылками на общие мемы
+
+    Обёртка над любым бэкендом избранного: в бэкенд записывается только
+    компактная ссылка {"url": "meme:<ключ>", "created_at": ...}, а сам мем —
+    один раз в MemeBlobStore. Объём хранилища растёт с числом уникальных
+    мемов, а не с числом добавлений в избранное. Записи старого формата
+    (без ссылки) читаются как есть и учитываются при проверке дубликатов.
+
+    Ссылки удалённых мемов освобождаются фоновой задачей только после
+    успешного flush бэкенда (memory сохраняет изменения с задержкой): иначе
+    после сбоя в избранном осталась бы ссылка на мем, который сборщик уже
+    удалил.
+    """
+
+    # Полосы блокировок: изменения одного пользователя выполняются по очереди,
+    # иначе удаление по индексу могло бы освободить ссылку на чужой мем
+    _LOCK_STRIPES = 64
+
+    def __init__(self, storage, blobs: MemeBlobStore, release_interval: float = FAVORITES_FLUSH_INTERVAL):
+        """
+        Инициализация
+
+        Args:
+            storage: Бэкенд избранного, в котором хранятся ссылки
+            blobs: Общее хранилище мемов
+            release_interval: Период освобождения ссылок удалённых мемов, сек
+        """
+        self.storage = storage
+        self.blobs = blobs
+        self.release_interval = release_interval
+        self._locks = [asyncio.Lock() for _ in range(self._LOCK_STRIPES)]
+        # Ключи мемов, ссылки на которые удалены, но удаление ещё может быть не на диске
+        self._pending_release: List[str] = []
+        self._task = None
+
+    def __getattr__(self, name):
+        # Остальные методы бэкенда (например, flush) доступны без изменений
+        return getattr(self.storage, name)
+
+    def _lock(self, user_id: int) -> asyncio.Lock:
+        return self._locks[user_id % self._LOCK_STRIPES]
+
+    async def _resolve(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Заменить ссылки на сами мемы (ссылки на отсутствующие мемы пропускаются)"""
+        keys = [key for key in map(_ref_key, records) if key]
+        if not keys:
+            return records
+        memes = await self.blobs.get_many(keys)
+
+        resolved = []
+        for record in records:
+            key = _ref_key(record)
+            if key is None:
+                resolved.append(record)
+                continue
+            meme = memes.get(key)
+            if meme is None:
+                logger.warning(f"Мем {key} не найден в общем хранилище")
+                continue
+            resolved.append({**meme, **{k: record[k] for k in _PER_USER_FIELDS if k in record}})
+        return resolved
+
+    def _release_later(self, keys: Iterable[str]):
+        """Отложить освобождение ссылок до сохранения бэкенда на диск"""
+        self._pending_release.extend(keys)
+
+    async def release_pending(self) -> bool:
+        """
+        Сохранить бэкенд на диск и освободить отложенные ссылки
+
+        Returns:
+            bool: True если ссылки освобождены (или освобождать нечего)
+        """
+        if not self._pending_release:
+            return True
+        keys, self._pending_release = self._pending_release, []
+        try:
+            flush = getattr(self.storage, "flush", None)
+            if flush is None or await flush():
+                await self.blobs.release(keys)
+                return True
+        except Exception as e:
+            logger.error(f"Ошибка при освобождении ссылок на мемы: {e}")
+        # Удаление не сохранено — попробуем в следующий раз
+        self._pending_release[:0] = keys
+        return False
+
+    async def _release_loop(self):
+        """Периодическое освобождение отложенных ссылок"""
+        while True:
+            await asyncio.sleep(self.release_interval)
+            await self.release_pending()
+
+    async def start(self):
+        """Запустить общее хранилище мемов, бэкенд и освобождение ссылок"""
+        await self.blobs.start()
+        await self.storage.start()
+        if self._task is None:
+            self._task = asyncio.create_task(self._release_loop())
+
+    async def close(self):
+        """Остановить бэкенд, освободить ссылки и закрыть общее хранилище мемов"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.storage.close()
+        await self.release_pending()
+        await self.blobs.close()
+
+    async def add_favorite(self, user_id: int, meme_data: Dict[str, str]) -> bool:
+        """
+        Добавить мем в избранное пользователя
+
+        Args:
+            user_id: ID пользователя
+            meme_data: Данные мема {"url": "...", "top": "...", "bottom": "..."}
+
+        Returns:
+            bool: True если успешно добавлено
+        """
+        key = meme_key(meme_data)
+        shared = {k: v for k, v in meme_data.items() if k not in _PER_USER_FIELDS}
+        record = {"url": REF_PREFIX + key, **{k: meme_data[k] for k in _PER_USER_FIELDS if k in meme_data}}
+
+        try:
+            async with self._lock(user_id):
+                # Тот же мем мог быть добавлен до включения ссылок (запись старого формата)
+                if await self.storage.has_favorite(user_id, meme_data):
+                    return False
+
+                # Бэкенд при переполнении молча удалит самый старый мем — запоминаем его ссылку
+                count = await self.storage.get_favorites_count(user_id)
+                oldest = await self.storage.get_favorite(user_id, 0) if count >= self.storage.max_favorites else None
+
+                # Ссылка учитывается до записи: при сбое счётчик будет завышен, а не занижен
+                await self.blobs.acquire(key, shared)
+                if not await self.storage.add_favorite(user_id, record):
+                    await self.blobs.release([key])
+                    return False
+
+                # Количество не выросло — самый старый мем вытеснен
+                oldest_key = _ref_key(oldest) if oldest else None
+                if oldest_key and await self.storage.get_favorites_count(user_id) <= count:
+                    self._release_later([oldest_key])
+                return True
+        except Exception as e:
+            logger.error(f"Ошибка при добавлении в общее хранилище мемов: {e}")
+        return False
+
+    async def get_favorites(self, user_id: int) -> List[Dict[str, str]]:
+        """Получить список избранных мемов пользователя"""
+        return await self._resolve(await self.storage.get_favorites(user_id))
+
+    async def get_favorites_page(self, user_id: int, offset: int, limit: int) -> List[Dict[str, str]]:
+        """Получить часть списка избранного"""
+        return await self._resolve(await self.storage.get_favorites_page(user_id, offset, limit))
+
+    async def get_favorite(self, user_id: int, meme_index: int) -> Optional[Dict[str, str]]:
+        """Получить один мем из избранного по индексу (None, если мема нет в общем хранилище)"""
+        record = await self.storage.get_favorite(user_id, meme_index)
+        if record is None:
+            return None
+        resolved = await self._resolve([record])
+        return resolved[0] if resolved else None
+
+    async def has_favorite(self, user_id: int, meme_data: Dict[str, str]) -> bool:
+        """Есть ли мем в избранном пользователя (ссылкой или записью старого формата)"""
+        record = {"url": REF_PREFIX + meme_key(meme_data)}
+        return (
+            await self.storage.has_favorite(user_id, record) or
+            await self.storage.has_favorite(user_id, meme_data)
+        )
+
+    async def get_favorites_count(self, user_id: int) -> int:
+        """Получить количество избранных мемов пользователя"""
+        return await self.storage.get_favorites_count(user_id)
+
+    async def remove_favorite(self, user_id: int, meme_index: int) -> bool:
+        """
+        Удалить мем из избранного по индексу и освободить ссылку на него
+
+        Args:
+            user_id: ID пользователя
+            meme_index: Индекс мема в списке избранного
+
+        Returns:
+            bool: True если успешно удалено
+        """
+        try:
+            async with self._lock(user_id):
+                record = await self.storage.get_favorite(user_id, meme_index)
+                if not await self.storage.remove_favorite(user_id, meme_index):
+                    return False
+                key = _ref_key(record) if record else None
+                if key:
+                    self._release_later([key])
+                return True
+        except Exception as e:
+            logger.error(f"Ошибка при освобождении ссылки на мем: {e}")
+        return False
+
+    async def clear_favorites(self, user_id: int) -> bool:
+        """
+        Очистить избранное пользователя и освободить все его ссылки
+
+        Args:
+            user_id: ID пользователя
+
+        Returns:
+            bool: True если успешно очищено
+        """
+        try:
+            async with self._lock(user_id):
+                records = await self.storage.get_favorites(user_id)
+                if not await self.storage.clear_favorites(user_id):
+                    return False
+                self._release_later(key for key in map(_ref_key, records) if key)
+                return True
+        except Exception as e:
+            logger.error(f"Ошибка при освобождении ссылок на мемы: {e}")
+        return False
+
+
+# Глобальное хранилище мемов
+meme_blobs = MemeBlobStore()
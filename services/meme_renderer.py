@@ -0,0 +1,195 @@
+import io
+import logging
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+from typing import List, Tuple, Union
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+from config.settings import MEME_RENDER_FORMAT, MEME_RENDER_MAX_SIDE, MEME_FONT_PATH
+
+logger = logging.getLogger('cat_meme_bot')
+
+# Шрифты с кириллицей, которые ищутся, если MEME_FONT_PATH не задан
+FONT_CANDIDATES = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans-Bold.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans-Bold.ttf",
+    "C:/Windows/Fonts/impact.ttf",
+    "C:/Windows/Fonts/arialbd.ttf",
+    "/System/Library/Fonts/Supplemental/Impact.ttf",
+    "/Library/Fonts/Impact.ttf"
+]
+
+# Доля ширины картинки, которую может занимать подпись
+TEXT_WIDTH_RATIO = 0.92
+# Доля высоты картинки на одну подпись (верхнюю или нижнюю)
+TEXT_HEIGHT_RATIO = 0.28
+MIN_FONT_SIZE = 12
+
+
+class _BufferReader(io.RawIOBase):
+    """Файловый объект поверх memoryview: Pillow читает фон кусками без полной копии"""
+
+    def __init__(self, buffer: memoryview):
+        self._buffer = buffer
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        chunk = self._buffer[self._position:self._position + len(target)]
+        target[:len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._buffer)}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+
+@lru_cache(maxsize=1)
+def _font_path() -> str:
+    """Найти TTF-шрифт для подписей (пустая строка — встроенный шрифт Pillow)"""
+    for candidate in [MEME_FONT_PATH, *FONT_CANDIDATES]:
+        if candidate and Path(candidate).exists():
+            logger.info(f"Шрифт для мемов: {candidate}")
+            return candidate
+    logger.warning("TTF-шрифт не найден, используется встроенный шрифт Pillow (только латиница)")
+    return ""
+
+
+@lru_cache(maxsize=1)
+def has_cyrillic_font() -> bool:
+    """
+    Есть ли у найденного шрифта кириллические глифы
+
+    У встроенного шрифта Pillow их нет: все буквы кириллицы рисуются
+    одинаковыми прямоугольниками, это и проверяется.
+    """
+    font = _load_font(32)
+
+    def glyph(char: str) -> bytes:
+        image = Image.new("L", (48, 48))
+        ImageDraw.Draw(image).text((4, 4), char, font=font, fill=255)
+        return image.tobytes()
+
+    return glyph("Ж") != glyph("Щ")
+
+
+@lru_cache(maxsize=64)
+def _load_font(size: int) -> ImageFont.FreeTypeFont:
+    """Загрузить шрифт нужного размера"""
+    path = _font_path()
+    if path:
+        return ImageFont.truetype(path, size)
+    return ImageFont.load_default(size)
+
+
+def _wrap_text(draw: ImageDraw.ImageDraw, text: str, font, max_width: float) -> List[str]:
+    """Разбить подпись на строки по ширине"""
+    lines: List[str] = []
+    current = ""
+    for word in text.split():
+        candidate = f"{current} {word}".strip()
+        if not current or draw.textlength(candidate, font=font) <= max_width:
+            current = candidate
+        else:
+            lines.append(current)
+            current = word
+    if current:
+        lines.append(current)
+    return lines
+
+
+def _fit_text(draw: ImageDraw.ImageDraw, text: str, size: Tuple[int, int]):
+    """Подобрать размер шрифта, при котором подпись влезает в отведённую область"""
+    width, height = size
+    max_width = width * TEXT_WIDTH_RATIO
+    max_height = height * TEXT_HEIGHT_RATIO
+
+    font_size = max(MIN_FONT_SIZE, width // 8)
+    while True:
+        font = _load_font(font_size)
+        lines = _wrap_text(draw, text, font, max_width)
+        line_height = font_size * 1.15
+        fits = (
+            len(lines) * line_height <= max_height
+            and all(draw.textlength(line, font=font) <= max_width for line in lines)
+        )
+        if fits or font_size <= MIN_FONT_SIZE:
+            return font, lines, line_height
+        font_size = max(MIN_FONT_SIZE, int(font_size * 0.9))
+
+
+def _draw_caption(draw: ImageDraw.ImageDraw, text: str, size: Tuple[int, int], at_top: bool):
+    """Нарисовать классическую подпись: белые заглавные буквы с чёрной обводкой"""
+    text = " ".join(text.split()).upper()
+    if not text:
+        return
+
+    width, height = size
+    font, lines, line_height = _fit_text(draw, text, size)
+    stroke = max(1, int(line_height / 15))
+    margin = height * 0.03
+
+    if at_top:
+        y = margin
+    else:
+        y = height - margin - len(lines) * line_height
+
+    for line in lines:
+        line_width = draw.textlength(line, font=font)
+        draw.text(
+            ((width - line_width) / 2, y),
+            line,
+            font=font,
+            fill="white",
+            stroke_width=stroke,
+            stroke_fill="black"
+        )
+        y += line_height
+
+
+def render_meme(
+    image_data: Union[bytes, memoryview],
+    top_text: str,
+    bottom_text: str,
+    image_format: str = MEME_RENDER_FORMAT,
+    max_side: int = MEME_RENDER_MAX_SIDE
+) -> bytes:
+    """
+    Нарисовать подписи на фоновом изображении
+
+    Args:
+        image_data: Байты фонового изображения (memoryview читается без копирования)
+        top_text: Верхняя подпись
+        bottom_text: Нижняя подпись
+        image_format: Формат результата ("JPEG" или "PNG")
+        max_side: Максимальный размер стороны результата, px
+
+    Returns:
+        bytes: Закодированное изображение мема
+    """
+    stream = _BufferReader(image_data) if isinstance(image_data, memoryview) else BytesIO(image_data)
+    with Image.open(stream) as source:
+        image = ImageOps.exif_transpose(source).convert("RGB")
+    image.thumbnail((max_side, max_side))
+
+    draw = ImageDraw.Draw(image)
+    _draw_caption(draw, top_text, image.size, at_top=True)
+    _draw_caption(draw, bottom_text, image.size, at_top=False)
+
+    output = BytesIO()
+    if image_format == "PNG":
+        image.save(output, format="PNG", optimize=True)
+    else:
+        image.save(output, format="JPEG", quality=90)
+    return output.getvalue()
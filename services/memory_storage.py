@@ -0,0 +1,314 @@
+import asyncio
+import json
+import os
+import logging
+from typing import List, Dict, Any, Optional, Set, Tuple
+from pathlib import Path
+from config.settings import FAVORITES_FLUSH_INTERVAL, FAVORITES_FLUSH_THRESHOLD
+from services.storage_service import FavoritesStorage, FAVORITES_FILE, MAX_FAVORITES
+
+logger = logging.getLogger('cat_meme_bot')
+
+
+def _meme_key(meme_data: Dict[str, str]) -> Tuple[Any, Any, Any]:
+    """Ключ мема для проверки дубликатов"""
+    return (meme_data.get("url"), meme_data.get("top"), meme_data.get("bottom"))
+
+
+class InMemoryFavoritesStorage(FavoritesStorage):
+    """
+    Хранилище избранного в памяти с отложенной записью на диск
+
+    Файл читается один раз при создании. Изменения помечают пользователя
+    как "грязного", а фоновая задача сбрасывает данные на диск по таймеру
+    или при накоплении изменений. Записи пользователя не изменяются на месте:
+    при каждом изменении создаётся новый список, поэтому снимок для записи
+    можно сериализовать в отдельном потоке.
+    """
+
+    max_favorites = MAX_FAVORITES
+
+    def __init__(
+        self,
+        path: Path = FAVORITES_FILE,
+        flush_interval: float = FAVORITES_FLUSH_INTERVAL,
+        flush_threshold: int = FAVORITES_FLUSH_THRESHOLD
+    ):
+        """
+        Инициализация хранилища
+
+        Args:
+            path: Путь к JSON-файлу с избранным
+            flush_interval: Период фонового сброса на диск, сек
+            flush_threshold: Число изменённых пользователей для внеочередного сброса
+        """
+        self.path = Path(path)
+        self.flush_interval = flush_interval
+        self.flush_threshold = max(1, flush_threshold)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._data: Dict[str, Dict[str, Any]] = self._load_file()
+        self._index: Dict[str, Set[Tuple[Any, Any, Any]]] = {
+            user_key: {_meme_key(meme) for meme in user_data.get("favorites", [])}
+            for user_key, user_data in self._data.items()
+        }
+        self._dirty: Set[str] = set()
+
+        self._flush_lock = asyncio.Lock()
+        self._flush_requested = asyncio.Event()
+        self._stopping = False
+        self._task = None
+
+        logger.info(f"Избранное загружено в память: {len(self._data)} пользователей")
+
+    def _load_file(self) -> Dict[str, Any]:
+        """Однократно прочитать файл хранилища"""
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Ошибка при загрузке данных: {e}")
+            return {}
+
+    def _set_favorites(self, user_key: str, favorites: List[Dict[str, str]]):
+        """Заменить список пользователя новым и пометить его изменённым"""
+        user_data = dict(self._data.get(user_key, {}))
+        user_data["favorites"] = favorites
+        self._data[user_key] = user_data
+        self._dirty.add(user_key)
+
+        if len(self._dirty) >= self.flush_threshold:
+            self._flush_requested.set()
+
+    def _apply_add(self, user_key: str, meme_data: Dict[str, str]) -> bool:
+        """Добавить мем в память, False если это дубликат"""
+        index = self._index.setdefault(user_key, set())
+        key = _meme_key(meme_data)
+
+        if key in index:
+            return False
+
+        favorites = list(self._data.get(user_key, {}).get("favorites", []))
+        favorites.append(meme_data)
+        index.add(key)
+
+        # Ограничиваем количество избранных
+        if len(favorites) > self.max_favorites:
+            removed_meme = favorites.pop(0)  # Удаляем самый старый
+            index.discard(_meme_key(removed_meme))
+
+        self._set_favorites(user_key, favorites)
+        return True
+
+    def _apply_remove(self, user_key: str, meme_index: int) -> bool:
+        """Удалить мем из памяти по индексу"""
+        favorites = self._data.get(user_key, {}).get("favorites", [])
+
+        if not (0 <= meme_index < len(favorites)):
+            return False
+
+        favorites = list(favorites)
+        removed_meme = favorites.pop(meme_index)
+        self._index.get(user_key, set()).discard(_meme_key(removed_meme))
+        self._set_favorites(user_key, favorites)
+        return True
+
+    def _apply_clear(self, user_key: str) -> bool:
+        """Очистить избранное пользователя в памяти"""
+        if user_key not in self._data:
+            return False
+
+        self._index[user_key] = set()
+        self._set_favorites(user_key, [])
+        return True
+
+    async def add_favorite(self, user_id: int, meme_data: Dict[str, str]) -> bool:
+        """
+        Добавить мем в избранное пользователя
+
+        Args:
+            user_id: ID пользователя
+            meme_data: Данные мема {"url": "...", "top": "...", "bottom": "..."}
+
+        Returns:
+            bool: True если успешно добавлено
+        """
+        if not self._apply_add(str(user_id), meme_data):
+            logger.info(f"Мем уже в избранном пользователя {user_id}")
+            return False
+
+        logger.info(f"Мем добавлен в избранное пользователя {user_id}")
+        return True
+
+    async def get_favorites(self, user_id: int) -> List[Dict[str, str]]:
+        """
+        Получить список избранных мемов пользователя
+
+        Args:
+            user_id: ID пользователя
+
+        Returns:
+            List: Список мемов пользователя
+        """
+        user_data = self._data.get(str(user_id))
+        if not user_data:
+            return []
+        favorites = user_data.get("favorites", [])
+        logger.info(f"Получено {len(favorites)} избранных мемов пользователя {user_id}")
+        return list(favorites)
+
+    async def get_favorites_page(self, user_id: int, offset: int, limit: int) -> List[Dict[str, str]]:
+        """
+        Получить часть списка избранного (копируется только страница)
+
+        Args:
+            user_id: ID пользователя
+            offset: Индекс первого мема
+            limit: Максимум мемов на странице
+
+        Returns:
+            List: Мемы с индексами [offset, offset + limit)
+        """
+        if offset < 0 or limit <= 0:
+            return []
+        favorites = self._data.get(str(user_id), {}).get("favorites", [])
+        return favorites[offset:offset + limit]
+
+    async def get_favorite(self, user_id: int, meme_index: int) -> Optional[Dict[str, str]]:
+        """
+        Получить один мем из избранного по индексу
+
+        Args:
+            user_id: ID пользователя
+            meme_index: Индекс мема в списке избранного
+
+        Returns:
+            Optional[Dict]: Мем или None, если индекс вне списка
+        """
+        favorites = self._data.get(str(user_id), {}).get("favorites", [])
+        if 0 <= meme_index < len(favorites):
+            return favorites[meme_index]
+        return None
+
+    async def has_favorite(self, user_id: int, meme_data: Dict[str, str]) -> bool:
+        """
+        Есть ли мем в избранном пользователя (по индексу дубликатов)
+
+        Args:
+            user_id: ID пользователя
+            meme_data: Данные мема {"url": "...", "top": "...", "bottom": "..."}
+
+        Returns:
+            bool: True если такой мем уже в избранном
+        """
+        return _meme_key(meme_data) in self._index.get(str(user_id), ())
+
+    async def remove_favorite(self, user_id: int, meme_index: int) -> bool:
+        """
+        Удалить мем из избранного по индексу
+
+        Args:
+            user_id: ID пользователя
+            meme_index: Индекс мема в списке избранного
+
+        Returns:
+            bool: True если успешно удалено
+        """
+        if not self._apply_remove(str(user_id), meme_index):
+            return False
+
+        logger.info(f"Мем удален из избранного пользователя {user_id}")
+        return True
+
+    async def get_favorites_count(self, user_id: int) -> int:
+        """
+        Получить количество избранных мемов пользователя
+
+        Args:
+            user_id: ID пользователя
+
+        Returns:
+            int: Количество избранных мемов
+        """
+        return len(self._data.get(str(user_id), {}).get("favorites", []))
+
+    async def clear_favorites(self, user_id: int) -> bool:
+        """
+        Очистить все избранные мемы пользователя
+
+        Args:
+            user_id: ID пользователя
+
+        Returns:
+            bool: True если успешно очищено
+        """
+        if not self._apply_clear(str(user_id)):
+            return False
+
+        logger.info(f"Избранное очищено для пользователя {user_id}")
+        return True
+
+    def _write_snapshot(self, snapshot: Dict[str, Any]) -> bool:
+        """Атомарно записать снимок в файл (выполняется в отдельном потоке)"""
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении данных: {e}")
+            return False
+
+    async def flush(self) -> bool:
+        """
+        Сбросить изменения на диск
+
+        Returns:
+            bool: True если данные сохранены или сохранять нечего
+        """
+        async with self._flush_lock:
+            if not self._dirty:
+                return True
+
+            dirty = self._dirty
+            self._dirty = set()
+            # Поверхностной копии достаточно: списки пользователей не изменяются на месте
+            snapshot = dict(self._data)
+
+            if await asyncio.to_thread(self._write_snapshot, snapshot):
+                logger.info(f"Избранное сохранено на диск: изменено {len(dirty)} пользователей")
+                return True
+
+            self._dirty |= dirty
+            return False
+
+    async def _flush_loop(self):
+        """Фоновый сброс по таймеру или по порогу изменений"""
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            await self.flush()
+
+    async def start(self):
+        """Запустить фоновую запись на диск"""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        """Остановить фоновую запись и выполнить финальный сброс"""
+        if self._task is not None:
+            self._stopping = True
+            self._flush_requested.set()
+            await self._task
+            self._task = None
+        await self.flush()
@@ -0,0 +1,320 @@
+import functools
+import logging
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from aiohttp import web
+from config.settings import METRICS_HOST, METRICS_PORT, FAVORITES_DEDUP
+from services.tracing import span
+
+logger = logging.getLogger('cat_meme_bot')
+
+# Границы корзин гистограмм задержек, сек
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    """Экранировать значение метки для текстового формата Prometheus"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    """Собрать {name="value",...}"""
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    """Общая часть метрик: имя, описание, тип и имена меток"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _samples(self) -> Iterable[str]:
+        return ()
+
+    def render(self) -> List[str]:
+        """Строки метрики в текстовом формате Prometheus"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    """Монотонно растущий счётчик"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        """Увеличить счётчик для набора меток"""
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> Iterable[str]:
+        for labels, value in self._values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+class Gauge(Counter):
+    """Значение, которое может расти и убывать"""
+
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1):
+        """Уменьшить значение"""
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value: float):
+        """Установить значение"""
+        self._values[labels] = value
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными корзинами"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, list] = {}  # метки -> [счётчики корзин..., сумма, количество]
+
+    def observe(self, value: float, *labels):
+        """Учесть одно наблюдение"""
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 2)
+        # Счётчики корзин не накопительные: накопление делается при выдаче.
+        # Значения выше последней границы попадают только в +Inf (= количество)
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def _samples(self) -> Iterable[str]:
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                bucket_labels = _labels(self.labelnames, labels, f'le="{bound}"')
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            bucket_labels = _labels(self.labelnames, labels, 'le="+Inf"')
+            yield f"{self.name}_bucket{bucket_labels} {series[-1]}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-2]}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}"
+
+
+class CallbackMetric(_Metric):
+    """Метрика, значения которой собираются функцией в момент запроса /metrics"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        kind: str,
+        labelnames: Tuple[str, ...],
+        collect: Callable[[], Iterable[Tuple[Tuple, float]]]
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.collect = collect
+
+    def _samples(self) -> Iterable[str]:
+        try:
+            samples = list(self.collect())
+        except Exception as e:
+            logger.error(f"Ошибка при сборе метрики {self.name}: {e}")
+            return
+        for labels, value in samples:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+class MetricsRegistry:
+    """Набор метрик бота"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        """Добавить метрику"""
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# Обработчики обновлений
+HANDLER_LATENCY = registry.register(Histogram(
+    "bot_handler_duration_seconds", "Время работы обработчика", ("handler",)
+))
+HANDLER_ERRORS = registry.register(Counter(
+    "bot_handler_errors_total", "Исключения в обработчиках", ("handler",)
+))
+HANDLERS_IN_FLIGHT = registry.register(Gauge(
+    "bot_handlers_in_flight", "Обработчики, выполняющиеся прямо сейчас"
+))
+
+# Внешние API
+UPSTREAM_LATENCY = registry.register(Histogram(
+    "bot_upstream_duration_seconds", "Время запроса к внешнему API", ("upstream", "outcome")
+))
+UPSTREAM_REJECTED = registry.register(Counter(
+    "bot_upstream_rejected_total", "Запросы, отклонённые лимитом или выключателем", ("upstream",)
+))
+
+# Хранилище избранного
+STORAGE_LATENCY = registry.register(Histogram(
+    "bot_storage_duration_seconds", "Время операции хранилища избранного", ("operation",)
+))
+STORAGE_ERRORS = registry.register(Counter(
+    "bot_storage_errors_total", "Исключения в операциях хранилища избранного", ("operation",)
+))
+
+
+def _collect_upstreams():
+    """Состояние внешних API для метрик"""
+    from services.upstream import cat_api_upstream, memegen_upstream
+    for upstream in (cat_api_upstream, memegen_upstream):
+        stats = upstream.stats()
+        yield (upstream.name, "in_flight"), stats["active"]
+        yield (upstream.name, "waiting"), stats["waiting"]
+        yield (upstream.name, "breaker_open"), 0 if upstream.healthy else 1
+
+
+def _cache_stats() -> Dict[str, dict]:
+    """Статистика кэшей бота"""
+    from services.render_cache import render_cache
+    from services.file_id_cache import file_id_cache
+    from services.cat_prefetch import cat_prefetcher
+    stats = {
+        "render": render_cache.stats(),
+        "file_id": file_id_cache.stats(),
+        "cat_prefetch": cat_prefetcher.stats()
+    }
+    if FAVORITES_DEDUP:
+        from services.meme_blobs import meme_blobs
+        stats["meme_blobs"] = meme_blobs.stats()
+    return stats
+
+
+def _collect_cache_counters(field: str):
+    """Попадания или промахи кэшей"""
+    return lambda: (((name,), stats[field]) for name, stats in _cache_stats().items())
+
+
+def _collect_cache_ratio():
+    """Доля попаданий кэшей"""
+    return (((name,), stats["hit_ratio"]) for name, stats in _cache_stats().items())
+
+
+registry.register(CallbackMetric(
+    "bot_upstream_state", "Запросы в работе и в очереди, состояние выключателя", "gauge",
+    ("upstream", "kind"), _collect_upstreams
+))
+registry.register(CallbackMetric(
+    "bot_cache_hits_total", "Попадания в кэши", "counter", ("cache",), _collect_cache_counters("hits")
+))
+registry.register(CallbackMetric(
+    "bot_cache_misses_total", "Промахи кэшей", "counter", ("cache",), _collect_cache_counters("misses")
+))
+registry.register(CallbackMetric(
+    "bot_cache_hit_ratio", "Доля попаданий в кэши", "gauge", ("cache",), _collect_cache_ratio
+))
+
+
+def instrument_storage(storage, operations: Iterable[str]):
+    """
+    Замерять время операций хранилища избранного
+
+    Методы экземпляра подменяются обёртками, поэтому работает для любого бэкенда.
+    Каждая операция также записывается спаном в трассу обновления.
+
+    Args:
+        storage: Экземпляр хранилища
+        operations: Имена асинхронных методов для замера
+
+    Returns:
+        То же хранилище
+    """
+    for operation in operations:
+        method = getattr(storage, operation)
+
+        @functools.wraps(method)
+        async def timed(*args, _method=method, _operation=operation, **kwargs):
+            started = time.perf_counter()
+            try:
+                with span(f"storage.{_operation}"):
+                    return await _method(*args, **kwargs)
+            except Exception:
+                STORAGE_ERRORS.inc(_operation)
+                raise
+            finally:
+                STORAGE_LATENCY.observe(time.perf_counter() - started, _operation)
+
+        setattr(storage, operation, timed)
+    return storage
+
+
+async def _metrics_handler(request: web.Request) -> web.Response:
+    """GET /metrics"""
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+
+class MetricsServer:
+    """HTTP-сервер с метриками для Prometheus"""
+
+    def __init__(self, host: str = METRICS_HOST, port: int = METRICS_PORT):
+        """
+        Инициализация сервера
+
+        Args:
+            host: Адрес, на котором слушает сервер
+            port: Порт (0 — сервер не запускается)
+        """
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self):
+        """Запустить сервер"""
+        if not self.port or self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", _metrics_handler)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host=self.host, port=self.port).start()
+        logger.info(f"Метрики доступны на http://{self.host}:{self.port}/metrics")
+
+    async def close(self):
+        """Остановить сервер"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+# Глобальный сервер метрик
+metrics_server = MetricsServer()
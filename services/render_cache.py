@@ -0,0 +1,291 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+from config.settings import (
+    RENDER_CACHE_TTL,
+    RENDER_CACHE_MEMORY_BYTES,
+    RENDER_CACHE_DIR,
+    RENDER_CACHE_DISK_BYTES
+)
+from services.storage_service import resolve_storage_path
+from services.single_flight import SingleFlight
+
+logger = logging.getLogger('cat_meme_bot')
+
+# Примерный расход памяти на запись без учёта байтов картинки
+_ENTRY_OVERHEAD = 256
+
+# Ссылка на мем, нарисованный локально (URL у него нет): "render:<ключ>"
+RENDER_REF_PREFIX = "render:"
+
+
+def _normalize_text(text: Optional[str]) -> str:
+    """Нормализовать подпись: схлопнуть пробелы по краям и внутри"""
+    return " ".join((text or "").split())
+
+
+def make_render_key(image_url: str, top_text: str, bottom_text: str) -> str:
+    """
+    Ключ мема по содержимому
+
+    Args:
+        image_url: URL фонового изображения
+        top_text: Верхняя подпись
+        bottom_text: Нижняя подпись
+
+    Returns:
+        str: sha256 нормализованной тройки (фон, верх, низ)
+    """
+    raw = "\x1f".join((image_url or "", _normalize_text(top_text), _normalize_text(bottom_text)))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def make_render_ref(key: str) -> str:
+    """Стабильная ссылка на готовый мем по ключу из make_render_key (вместо URL)"""
+    return RENDER_REF_PREFIX + key
+
+
+def render_ref_key(url: Optional[str]) -> Optional[str]:
+    """Ключ мема из ссылки make_render_ref (None — это обычный URL)"""
+    if url and url.startswith(RENDER_REF_PREFIX):
+        return url[len(RENDER_REF_PREFIX):]
+    return None
+
+
+def _entry_size(entry: Dict[str, Any]) -> int:
+    """Сколько байт запись занимает в бюджете"""
+    data = entry.get("data")
+    return _ENTRY_OVERHEAD + (len(data) if data else 0)
+
+
+class RenderCache:
+    """
+    Кэш готовых мемов: URL, байты картинки и file_id Telegram
+
+    Два уровня: в памяти (LRU с бюджетом в байтах) и необязательный
+    каталог на диске со своим бюджетом. Записи старше TTL не выдаются.
+    """
+
+    def __init__(
+        self,
+        ttl: float = RENDER_CACHE_TTL,
+        memory_bytes: int = RENDER_CACHE_MEMORY_BYTES,
+        disk_dir: str = RENDER_CACHE_DIR,
+        disk_bytes: int = RENDER_CACHE_DISK_BYTES
+    ):
+        """
+        Инициализация кэша
+
+        Args:
+            ttl: Время жизни записи, сек
+            memory_bytes: Бюджет уровня в памяти, байт
+            disk_dir: Каталог дискового уровня (пустая строка — без диска)
+            disk_bytes: Бюджет дискового уровня, байт
+        """
+        self.ttl = ttl
+        self.memory_bytes = memory_bytes
+        self.disk_dir = resolve_storage_path(disk_dir) if disk_dir else None
+        self.disk_bytes = disk_bytes
+
+        self._memory: OrderedDict = OrderedDict()
+        self._memory_used = 0
+        self._disk_index: OrderedDict = OrderedDict()  # key -> размер файлов, от старых к новым
+        self._disk_used = 0
+
+        if self.disk_dir is not None:
+            self._scan_disk()
+
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def _scan_disk(self):
+        """Построить индекс дискового уровня по уже лежащим файлам"""
+        self.disk_dir.mkdir(parents=True, exist_ok=True)
+        found = []
+        for meta_path in self.disk_dir.glob("*.json"):
+            key = meta_path.stem
+            size = meta_path.stat().st_size
+            data_path = meta_path.with_suffix(".bin")
+            if data_path.exists():
+                size += data_path.stat().st_size
+            found.append((meta_path.stat().st_mtime, key, size))
+        for _, key, size in sorted(found):
+            self._disk_index[key] = size
+            self._disk_used += size
+
+    def _expired(self, entry: Dict[str, Any]) -> bool:
+        """Запись старше TTL"""
+        return time.time() - entry.get("created_at", 0) > self.ttl
+
+    def _memory_put(self, key: str, entry: Dict[str, Any]):
+        """Положить запись в память, вытесняя старые сверх бюджета"""
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_used -= _entry_size(old)
+        self._memory[key] = entry
+        self._memory_used += _entry_size(entry)
+        while self._memory_used > self.memory_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= _entry_size(evicted)
+
+    def _memory_drop(self, key: str):
+        """Убрать запись из памяти"""
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_used -= _entry_size(old)
+
+    def _disk_read(self, key: str) -> Optional[Dict[str, Any]]:
+        """Прочитать запись с диска (выполняется в отдельном потоке)"""
+        meta_path = self.disk_dir / f"{key}.json"
+        data_path = self.disk_dir / f"{key}.bin"
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            if data_path.exists():
+                entry["data"] = data_path.read_bytes()
+            return entry
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def _disk_write(self, key: str, entry: Dict[str, Any]) -> int:
+        """Записать запись на диск (выполняется в отдельном потоке), вернуть её размер"""
+        meta = {k: v for k, v in entry.items() if k != "data"}
+        meta_path = self.disk_dir / f"{key}.json"
+        size = 0
+        data = entry.get("data")
+        if data:
+            data_path = self.disk_dir / f"{key}.bin"
+            tmp_path = data_path.with_suffix(".bin.tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, data_path)
+            size += len(data)
+        tmp_path = meta_path.with_suffix(".json.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, meta_path)
+        return size + meta_path.stat().st_size
+
+    def _disk_remove(self, key: str):
+        """Удалить файлы записи (выполняется в отдельном потоке)"""
+        for suffix in (".json", ".bin"):
+            try:
+                (self.disk_dir / f"{key}{suffix}").unlink()
+            except FileNotFoundError:
+                pass
+
+    async def _disk_store(self, key: str, entry: Dict[str, Any]):
+        """Сохранить запись на диск и уложиться в дисковый бюджет"""
+        try:
+            size = await asyncio.to_thread(self._disk_write, key, entry)
+        except OSError as e:
+            logger.error(f"Ошибка записи кэша мемов на диск: {e}")
+            return
+
+        self._disk_used -= self._disk_index.pop(key, 0)
+        self._disk_index[key] = size
+        self._disk_used += size
+
+        evicted = []
+        while self._disk_used > self.disk_bytes and len(self._disk_index) > 1:
+            old_key, old_size = self._disk_index.popitem(last=False)
+            self._disk_used -= old_size
+            evicted.append(old_key)
+        for old_key in evicted:
+            await asyncio.to_thread(self._disk_remove, old_key)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Найти готовый мем
+
+        Args:
+            key: Ключ из make_render_key
+
+        Returns:
+            Optional[dict]: {"url", "data", "file_id", "size", "created_at"} или None
+        """
+        entry = self._memory.get(key)
+        if entry is not None and self._expired(entry):
+            self._memory_drop(key)
+            entry = None
+
+        if entry is None and self.disk_dir is not None and key in self._disk_index:
+            entry = await asyncio.to_thread(self._disk_read, key)
+            if entry is None or self._expired(entry):
+                self._disk_used -= self._disk_index.pop(key, 0)
+                await asyncio.to_thread(self._disk_remove, key)
+                entry = None
+            else:
+                self._disk_index.move_to_end(key)
+                self._memory_put(key, entry)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._memory.move_to_end(key)
+        self.hits += 1
+        self.bytes_saved += entry.get("size") or 0
+        return entry
+
+    async def put(
+        self,
+        key: str,
+        url: Optional[str] = None,
+        data: Optional[bytes] = None,
+        file_id: Optional[str] = None
+    ):
+        """
+        Сохранить или дополнить запись о готовом меме
+
+        Args:
+            key: Ключ из make_render_key
+            url: URL готового мема
+            data: Байты картинки
+            file_id: file_id Telegram после отправки
+        """
+        existing = self._memory.get(key)
+        if existing is not None and self._expired(existing):
+            existing = None
+        entry = dict(existing or {})
+        changed = not entry
+        for field, value in (("url", url), ("data", data), ("file_id", file_id)):
+            if value and entry.get(field) != value:
+                entry[field] = value
+                changed = True
+        if data:
+            entry["size"] = len(data)
+        entry.setdefault("created_at", time.time())
+
+        if not changed:
+            return
+
+        self._memory_put(key, entry)
+        if self.disk_dir is not None:
+            await self._disk_store(key, entry)
+
+    def stats(self) -> dict:
+        """Статистика кэша для мониторинга"""
+        total = self.hits + self.misses
+        return {
+            "memory_items": len(self._memory),
+            "memory_bytes": self._memory_used,
+            "disk_items": len(self._disk_index),
+            "disk_bytes": self._disk_used,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "bytes_saved": self.bytes_saved
+        }
+
+
+# Глобальный кэш готовых мемов
+render_cache = RenderCache()
+
+# Генерации мемов, выполняющиеся прямо сейчас (по ключу make_render_key)
+meme_flights = SingleFlight()
@@ -0,0 +1,193 @@
+import hashlib
+import logging
+import random
+import time
+from collections import OrderedDict
+from typing import List, Optional
+from config.settings import (
+    SEEN_CATS_BITS,
+    SEEN_CATS_HASHES,
+    SEEN_CATS_CAPACITY,
+    SEEN_CATS_TTL,
+    SEEN_CATS_MAX_USERS
+)
+
+logger = logging.getLogger('cat_meme_bot')
+
+
+def cat_image_id(url: str) -> str:
+    """ID изображения кота: имя файла без расширения (.../images/bpc.jpg -> bpc)"""
+    name = url.rsplit("/", 1)[-1]
+    return name.split(".", 1)[0] or url
+
+
+class _UserFilter:
+    """
+    Два поколения фильтра Блума одного пользователя в одном bytearray
+
+    Новые ID пишутся в текущее поколение, проверка идёт по обоим. Когда
+    текущее поколение заполнено или старше ttl / 2, предыдущее очищается
+    и становится текущим: кот считается увиденным от ttl / 2 до ttl.
+    """
+
+    __slots__ = ("bits", "current", "count", "started")
+
+    def __init__(self, size: int, now: float):
+        self.bits = bytearray(2 * size)
+        self.current = 0
+        self.count = 0
+        self.started = now
+
+
+class SeenCats:
+    """
+    Недавно показанные пользователю коты (вероятностно)
+
+    На пользователя хранится SEEN_CATS_BITS бит на каждое из двух поколений,
+    независимо от числа просмотров. Ложные срабатывания возможны (редкий кот
+    будет пропущен зря), пропуски — нет. Фильтры хранятся только для
+    SEEN_CATS_MAX_USERS недавно активных пользователей, самые давние
+    вытесняются, поэтому память ограничена при любом числе пользователей.
+    """
+
+    def __init__(
+        self,
+        bits: int = SEEN_CATS_BITS,
+        hashes: int = SEEN_CATS_HASHES,
+        capacity: int = SEEN_CATS_CAPACITY,
+        ttl: float = SEEN_CATS_TTL,
+        max_users: int = SEEN_CATS_MAX_USERS
+    ):
+        """
+        Инициализация
+
+        Args:
+            bits: Размер одного поколения фильтра, бит (округляется до байта)
+            hashes: Количество хэш-функций
+            capacity: Котов в поколении до его смены
+            ttl: Сколько кот считается увиденным (не меньше ttl / 2), сек
+            max_users: Максимум пользователей с фильтрами (LRU)
+        """
+        self.size = max(1, (bits + 7) // 8)
+        self.bits = self.size * 8
+        self.hashes = max(1, hashes)
+        self.capacity = max(1, capacity)
+        self.generation_ttl = ttl / 2
+        self.max_users = max(1, max_users)
+        self._filters: "OrderedDict[int, _UserFilter]" = OrderedDict()
+
+        # Счётчики для мониторинга
+        self.checks = 0
+        self.skipped = 0
+        self.evicted = 0
+
+    def _positions(self, image_id: str) -> List[int]:
+        """Номера бит ID (двойное хэширование)"""
+        digest = hashlib.blake2b(image_id.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def _filter(self, user_id: int, create: bool) -> Optional[_UserFilter]:
+        """Фильтр пользователя с учётом устаревания поколений"""
+        now = time.monotonic()
+        user_filter = self._filters.get(user_id)
+        if user_filter is None:
+            if not create:
+                return None
+            user_filter = _UserFilter(self.size, now)
+            self._filters[user_id] = user_filter
+            if len(self._filters) > self.max_users:
+                self._filters.popitem(last=False)
+                self.evicted += 1
+        else:
+            self._filters.move_to_end(user_id)
+
+        elapsed = now - user_filter.started
+        if elapsed >= 2 * self.generation_ttl:
+            # Оба поколения устарели
+            user_filter.bits[:] = bytes(2 * self.size)
+            user_filter.count = 0
+            user_filter.started = now
+        elif elapsed >= self.generation_ttl or user_filter.count >= self.capacity:
+            self._rotate(user_filter, now)
+        return user_filter
+
+    def _rotate(self, user_filter: _UserFilter, now: float):
+        """Сменить поколение: самое старое очищается и становится текущим"""
+        user_filter.current ^= 1
+        offset = user_filter.current * self.size
+        user_filter.bits[offset:offset + self.size] = bytes(self.size)
+        user_filter.count = 0
+        user_filter.started = now
+
+    def seen(self, user_id: int, url: str) -> bool:
+        """
+        Показывали ли пользователю этого кота недавно
+
+        Args:
+            user_id: ID пользователя
+            url: URL изображения
+
+        Returns:
+            bool: True — вероятно показывали, False — точно нет
+        """
+        self.checks += 1
+        user_filter = self._filter(user_id, create=False)
+        if user_filter is None:
+            return False
+
+        bits = user_filter.bits
+        for offset in (0, self.size):
+            if all(bits[offset + (p >> 3)] & (1 << (p & 7)) for p in self._positions(cat_image_id(url))):
+                self.skipped += 1
+                return True
+        return False
+
+    def mark(self, user_id: int, url: str):
+        """
+        Запомнить, что кот показан пользователю
+
+        Args:
+            user_id: ID пользователя
+            url: URL изображения
+        """
+        user_filter = self._filter(user_id, create=True)
+        offset = user_filter.current * self.size
+        for p in self._positions(cat_image_id(url)):
+            user_filter.bits[offset + (p >> 3)] |= 1 << (p & 7)
+        user_filter.count += 1
+
+    def choose(self, user_id: Optional[int], urls: List[str]) -> str:
+        """
+        Выбрать случайного кота, которого пользователь ещё не видел
+
+        Если видел всех — выбирается любой. Выбранный кот запоминается.
+
+        Args:
+            user_id: ID пользователя (None — без учёта просмотренных)
+            urls: Кандидаты
+
+        Returns:
+            str: URL выбранного кота
+        """
+        if user_id is None:
+            return random.choice(urls)
+        unseen = [url for url in urls if not self.seen(user_id, url)]
+        cat_url = random.choice(unseen or urls)
+        self.mark(user_id, cat_url)
+        return cat_url
+
+    def stats(self) -> dict:
+        """Статистика для мониторинга"""
+        return {
+            "users": len(self._filters),
+            "bytes": len(self._filters) * 2 * self.size,
+            "checks": self.checks,
+            "skipped": self.skipped,
+            "evicted": self.evicted
+        }
+
+
+# Глобальный фильтр просмотренных котов
+seen_cats = SeenCats()
@@ -0,0 +1,59 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger('cat_meme_bot')
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых одновременных запросов
+
+    Пока запрос с некоторым ключом выполняется, повторные вызовы с тем же
+    ключом не запускают новый, а ждут результат первого. Запрос выполняется
+    отдельной задачей под asyncio.shield: если один из ожидающих отменён
+    (пользователь ушёл, обработчик прерван), остальные получают результат.
+    """
+
+    def __init__(self):
+        """Инициализация"""
+        self._flights: Dict[str, asyncio.Future] = {}
+        self.started = 0
+        self.shared = 0
+
+    def _forget(self, key: str, flight: asyncio.Future):
+        """Убрать завершённый запрос (если его ещё не заменили новым)"""
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.cancelled() and flight.exception() is not None:
+            # Исключение прочитано здесь, чтобы не было предупреждения, если все ожидающие ушли
+            logger.debug(f"Объединённый запрос {key} завершился ошибкой: {flight.exception()}")
+
+    async def do(self, key: str, request: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Выполнить запрос или присоединиться к уже выполняющемуся
+
+        Args:
+            key: Ключ запроса
+            request: Функция, создающая запрос (вызывается только первым)
+
+        Returns:
+            Результат запроса (общий для всех ожидающих)
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = asyncio.ensure_future(request())
+            self._flights[key] = flight
+            flight.add_done_callback(lambda done: self._forget(key, done))
+            self.started += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(flight)
+
+    def stats(self) -> dict:
+        """Статистика для мониторинга"""
+        return {
+            "in_flight": len(self._flights),
+            "started": self.started,
+            "shared": self.shared
+        }
@@ -0,0 +1,405 @@
+import asyncio
+import json
+import sqlite3
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+from pathlib import Path
+from config.settings import FAVORITES_DB_FILE
+from services.storage_service import FavoritesStorage, FAVORITES_FILE, MAX_FAVORITES, resolve_storage_path
+
+logger = logging.getLogger('cat_meme_bot')
+
+# Поля мема, хранящиеся в отдельных колонках; остальные сохраняются в extra как JSON
+_COLUMNS = ("url", "top", "bottom", "created_at")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS favorites (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    top TEXT NOT NULL DEFAULT '',
+    bottom TEXT NOT NULL DEFAULT '',
+    created_at TEXT NOT NULL DEFAULT '',
+    extra TEXT,
+    UNIQUE (user_id, url, top, bottom)
+);
+CREATE INDEX IF NOT EXISTS idx_favorites_user_position ON favorites (user_id, position);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+-- Счётчики избранного поддерживаются триггерами, чтобы не считать COUNT(*) по индексу
+CREATE TABLE IF NOT EXISTS favorite_counts (
+    user_id INTEGER PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS favorites_count_insert AFTER INSERT ON favorites BEGIN
+    INSERT INTO favorite_counts (user_id, count) VALUES (NEW.user_id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET count = count + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS favorites_count_delete AFTER DELETE ON favorites BEGIN
+    UPDATE favorite_counts SET count = count - 1 WHERE user_id = OLD.user_id;
+END;
+"""
+
+_SELECT_MEMES = "SELECT url, top, bottom, created_at, extra FROM favorites "
+
+
+def _to_row(meme_data: Dict[str, Any]) -> Tuple[str, str, str, str, Optional[str]]:
+    """Разложить словарь мема по колонкам таблицы"""
+    extra = {k: v for k, v in meme_data.items() if k not in _COLUMNS}
+    return (
+        meme_data.get("url") or "",
+        meme_data.get("top") or "",
+        meme_data.get("bottom") or "",
+        meme_data.get("created_at") or "",
+        json.dumps(extra, ensure_ascii=False) if extra else None
+    )
+
+
+def _from_row(row: sqlite3.Row) -> Dict[str, Any]:
+    """Собрать словарь мема из строки таблицы"""
+    meme = {
+        "url": row["url"],
+        "top": row["top"],
+        "bottom": row["bottom"],
+        "created_at": row["created_at"]
+    }
+    if row["extra"]:
+        meme.update(json.loads(row["extra"]))
+    return meme
+
+
+class SQLiteFavoritesStorage(FavoritesStorage):
+    """
+    Хранилище избранного в SQLite
+
+    Все запросы выполняются в одном выделенном потоке со своим соединением,
+    поэтому обработчики не блокируют цикл событий на диске. Дубликаты
+    отсекаются уникальным ограничением, а выборки идут по индексу (user_id, position).
+
+    Позиции после удалений идут с пропусками, поэтому мем по номеру в списке
+    (страница, get_favorite, remove_favorite) находится через OFFSET: SQLite
+    проходит индекс до нужного номера, это O(номера), но без чтения всего
+    списка в Python.
+    """
+
+    max_favorites = MAX_FAVORITES
+
+    def __init__(self, db_path: str = FAVORITES_DB_FILE, json_path: Path = FAVORITES_FILE):
+        """
+        Инициализация хранилища
+
+        Args:
+            db_path: Путь к файлу базы данных
+            json_path: JSON-файл старого хранилища для однократной миграции
+        """
+        self.db_path = resolve_storage_path(db_path)
+        self.json_path = Path(json_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Один поток — одно соединение: SQLite-соединение нельзя делить между потоками
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="favorites-sqlite")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    async def _run(self, func, *args):
+        """Выполнить функцию в потоке базы данных"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Получить соединение (создаётся лениво в потоке базы)"""
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._build_counts(conn)
+            self._conn = conn
+            logger.info(f"Открыта база избранного: {self.db_path}")
+        return self._conn
+
+    @staticmethod
+    def _build_counts(conn: sqlite3.Connection):
+        """Однократно заполнить счётчики для базы, созданной до их появления"""
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'counts_built'").fetchone():
+            return
+        with conn:
+            conn.execute("DELETE FROM favorite_counts")
+            conn.execute(
+                "INSERT INTO favorite_counts (user_id, count) "
+                "SELECT user_id, COUNT(*) FROM favorites GROUP BY user_id"
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('counts_built', '1')")
+
+    def _migrate_from_json(self) -> int:
+        """Однократно перенести данные из JSON-хранилища"""
+        conn = self._connection()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return 0
+
+        migrated = 0
+        if self.json_path.exists():
+            try:
+                with open(self.json_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.error(f"Не удалось прочитать JSON для миграции: {e}")
+                data = {}
+
+            with conn:
+                for user_key, user_data in (data or {}).items():
+                    favorites = (user_data or {}).get("favorites", [])
+                    for position, meme in enumerate(favorites[-self.max_favorites:]):
+                        cursor = conn.execute(
+                            "INSERT OR IGNORE INTO favorites "
+                            "(user_id, position, url, top, bottom, created_at, extra) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (int(user_key), position, *_to_row(meme))
+                        )
+                        migrated += cursor.rowcount
+
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', '1')")
+        logger.info(f"Миграция избранного из JSON завершена: перенесено {migrated} мемов")
+        return migrated
+
+    async def start(self):
+        """Открыть базу и при первом запуске перенести данные из JSON"""
+        await self._run(self._migrate_from_json)
+
+    async def close(self):
+        """Закрыть соединение и поток базы"""
+        def _close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+        await self._run(_close)
+        self._executor.shutdown(wait=True)
+
+    def _add_favorite(self, user_id: int, meme_data: Dict[str, Any]) -> bool:
+        """Добавить мем (выполняется в потоке базы)"""
+        conn = self._connection()
+        with conn:
+            row = conn.execute(
+                "SELECT COALESCE(MAX(position), -1) + 1 FROM favorites WHERE user_id = ?",
+                (user_id,)
+            ).fetchone()
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO favorites "
+                "(user_id, position, url, top, bottom, created_at, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, row[0], *_to_row(meme_data))
+            )
+            if cursor.rowcount == 0:
+                return False
+
+            # Ограничиваем количество избранных: удаляем самые старые
+            if self._count(user_id) <= self.max_favorites:
+                return True
+            conn.execute(
+                "DELETE FROM favorites WHERE id IN ("
+                "SELECT id FROM favorites WHERE user_id = ? "
+                "ORDER BY position DESC LIMIT -1 OFFSET ?)",
+                (user_id, self.max_favorites)
+            )
+        return True
+
+    async def add_favorite(self, user_id: int, meme_data: Dict[str, str]) -> bool:
+        """
+        Добавить мем в избранное пользователя
+
+        Args:
+            user_id: ID пользователя
+            meme_data: Данные мема {"url": "...", "top": "...", "bottom": "..."}
+
+        Returns:
+            bool: True если успешно добавлено
+        """
+        try:
+            if await self._run(self._add_favorite, user_id, meme_data):
+                logger.info(f"Мем добавлен в избранное пользователя {user_id}")
+                return True
+            logger.info(f"Мем уже в избранном пользователя {user_id}")
+        except Exception as e:
+            logger.error(f"Ошибка при добавлении в избранное: {e}")
+        return False
+
+    def _get_favorites(self, user_id: int) -> List[Dict[str, Any]]:
+        """Выбрать мемы пользователя (выполняется в потоке базы)"""
+        rows = self._connection().execute(
+            _SELECT_MEMES + "WHERE user_id = ? ORDER BY position",
+            (user_id,)
+        ).fetchall()
+        return [_from_row(row) for row in rows]
+
+    async def get_favorites(self, user_id: int) -> List[Dict[str, str]]:
+        """
+        Получить список избранных мемов пользователя
+
+        Args:
+            user_id: ID пользователя
+
+        Returns:
+            List: Список мемов пользователя
+        """
+        try:
+            favorites = await self._run(self._get_favorites, user_id)
+            logger.info(f"Получено {len(favorites)} избранных мемов пользователя {user_id}")
+            return favorites
+        except Exception as e:
+            logger.error(f"Ошибка при получении избранного: {e}")
+        return []
+
+    def _get_page(self, user_id: int, offset: int, limit: int) -> List[Dict[str, Any]]:
+        """Выбрать страницу мемов: OFFSET проходит индекс (user_id, position) (выполняется в потоке базы)"""
+        rows = self._connection().execute(
+            _SELECT_MEMES + "WHERE user_id = ? ORDER BY position LIMIT ? OFFSET ?",
+            (user_id, limit, offset)
+        ).fetchall()
+        return [_from_row(row) for row in rows]
+
+    async def get_favorites_page(self, user_id: int, offset: int, limit: int) -> List[Dict[str, str]]:
+        """
+        Получить часть списка избранного
+
+        Args:
+            user_id: ID пользователя
+            offset: Индекс первого мема
+            limit: Максимум мемов на странице
+
+        Returns:
+            List: Мемы с индексами [offset, offset + limit)
+        """
+        if offset < 0 or limit <= 0:
+            return []
+        try:
+            return await self._run(self._get_page, user_id, offset, limit)
+        except Exception as e:
+            logger.error(f"Ошибка при получении страницы избранного: {e}")
+        return []
+
+    async def get_favorite(self, user_id: int, meme_index: int) -> Optional[Dict[str, str]]:
+        """
+        Получить один мем из избранного по индексу
+
+        Args:
+            user_id: ID пользователя
+            meme_index: Индекс мема в списке избранного
+
+        Returns:
+            Optional[Dict]: Мем или None, если индекс вне списка
+        """
+        page = await self.get_favorites_page(user_id, meme_index, 1)
+        return page[0] if page else None
+
+    def _has_favorite(self, user_id: int, meme_data: Dict[str, Any]) -> bool:
+        """Найти мем по уникальному индексу (выполняется в потоке базы)"""
+        url, top, bottom = _to_row(meme_data)[:3]
+        row = self._connection().execute(
+            "SELECT 1 FROM favorites WHERE user_id = ? AND url = ? AND top = ? AND bottom = ?",
+            (user_id, url, top, bottom)
+        ).fetchone()
+        return row is not None
+
+    async def has_favorite(self, user_id: int, meme_data: Dict[str, str]) -> bool:
+        """
+        Есть ли мем в избранном пользователя (сравниваются url и подписи)
+
+        Args:
+            user_id: ID пользователя
+            meme_data: Данные мема {"url": "...", "top": "...", "bottom": "..."}
+
+        Returns:
+            bool: True если такой мем уже в избранном
+        """
+        return await self._run(self._has_favorite, user_id, meme_data)
+
+    def _remove_favorite(self, user_id: int, meme_index: int) -> bool:
+        """Удалить мем по индексу (выполняется в потоке базы)"""
+        if meme_index < 0:
+            return False
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute(
+                "DELETE FROM favorites WHERE id = ("
+                "SELECT id FROM favorites WHERE user_id = ? "
+                "ORDER BY position LIMIT 1 OFFSET ?)",
+                (user_id, meme_index)
+            )
+        return cursor.rowcount > 0
+
+    async def remove_favorite(self, user_id: int, meme_index: int) -> bool:
+        """
+        Удалить мем из избранного по индексу
+
+        Args:
+            user_id: ID пользователя
+            meme_index: Индекс мема в списке избранного
+
+        Returns:
+            bool: True если успешно удалено
+        """
+        try:
+            if await self._run(self._remove_favorite, user_id, meme_index):
+                logger.info(f"Мем удален из избранного пользователя {user_id}")
+                return True
+        except Exception as e:
+            logger.error(f"Ошибка при удалении из избранного: {e}")
+        return False
+
+    def _count(self, user_id: int) -> int:
+        """Прочитать счётчик мемов пользователя (выполняется в потоке базы)"""
+        row = self._connection().execute(
+            "SELECT count FROM favorite_counts WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    async def get_favorites_count(self, user_id: int) -> int:
+        """
+        Получить количество избранных мемов пользователя
+
+        Args:
+            user_id: ID пользователя
+
+        Returns:
+            int: Количество избранных мемов
+        """
+        try:
+            return await self._run(self._count, user_id)
+        except Exception as e:
+            logger.error(f"Ошибка при подсчёте избранного: {e}")
+        return 0
+
+    def _clear_favorites(self, user_id: int) -> bool:
+        """Удалить все мемы пользователя, False для неизвестного пользователя (выполняется в потоке базы)"""
+        conn = self._connection()
+        with conn:
+            # Строка счётчика остаётся и после удаления всех мемов — как пользователь в JSON-файле
+            known = conn.execute(
+                "SELECT 1 FROM favorite_counts WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            conn.execute("DELETE FROM favorites WHERE user_id = ?", (user_id,))
+        return known is not None
+
+    async def clear_favorites(self, user_id: int) -> bool:
+        """
+        Очистить все избранные мемы пользователя
+
+        Args:
+            user_id: ID пользователя
+
+        Returns:
+            bool: True если успешно очищено
+        """
+        try:
+            if await self._run(self._clear_favorites, user_id):
+                logger.info(f"Избранное очищено для пользователя {user_id}")
+                return True
+        except Exception as e:
+            logger.error(f"Ошибка при очистке избранного: {e}")
+        return False
@@ -1,189 +1,372 @@
-import json
-import os
-import logging
-from typing import List, Dict, Optional, Any
-from pathlib import Path
-
-logger = logging.getLogger('cat_meme_bot')
-
-# Путь к файлу хранилища
-STORAGE_DIR = Path(__file__).parent.parent / "storage"
-FAVORITES_FILE = STORAGE_DIR / "favorites_storage.json"
-
-class FavoritesStorage:
-    """Класс для работы с локальным хранилищем избранных мемов"""
-    
-    def __init__(self):
-        """Инициализация хранилища"""
-        # Создаем директорию если не существует
-        STORAGE_DIR.mkdir(exist_ok=True)
-        self._ensure_storage_file()
-    
-    def _ensure_storage_file(self):
-        """Убеждаемся что файл хранилища существует"""
-        if not FAVORITES_FILE.exists():
-            with open(FAVORITES_FILE, 'w', encoding='utf-8') as f:
-                json.dump({}, f, ensure_ascii=False, indent=2)
-            logger.info(f"Создан файл хранилища: {FAVORITES_FILE}")
-    
-    def _load_data(self) -> Dict[str, Any]:
-        """Загрузить данные из файла"""
-        try:
-            with open(FAVORITES_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            return data
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            logger.error(f"Ошибка при загрузке данных: {e}")
-            return {}
-    
-    def _save_data(self, data: Dict[str, Any]) -> bool:
-        """Сохранить данные в файл"""
-        try:
-            with open(FAVORITES_FILE, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            return True
-        except Exception as e:
-            logger.error(f"Ошибка при сохранении данных: {e}")
-            return False
-    
-    def add_favorite(self, user_id: int, meme_data: Dict[str, str]) -> bool:
-        """
-        Добавить мем в избранное пользователя
-        
-        Args:
-            user_id: ID пользователя
-            meme_data: Данные мема {"url": "...", "top": "...", "bottom": "..."}
-        
-        Returns:
-            bool: True если успешно добавлено
-        """
-        try:
-            data = self._load_data()
-            user_key = str(user_id)
-            
-            # Инициализируем пользователя если не существует
-            if user_key not in data:
-                data[user_key] = {"favorites": []}
-            
-            # Проверяем что мем еще не в избранном
-            favorites = data[user_key]["favorites"]
-            for existing_meme in favorites:
-                if (existing_meme.get("url") == meme_data.get("url") and 
-                    existing_meme.get("top") == meme_data.get("top") and
-                    existing_meme.get("bottom") == meme_data.get("bottom")):
-                    logger.info(f"Мем уже в избранном пользователя {user_id}")
-                    return False
-            
-            # Добавляем мем
-            favorites.append(meme_data)
-            
-            # Ограничиваем количество избранных (максимум 50)
-            if len(favorites) > 50:
-                favorites.pop(0)  # Удаляем самый старый
-            
-            # Сохраняем
-            if self._save_data(data):
-                logger.info(f"Мем добавлен в избранное пользователя {user_id}")
-                return True
-            
-        except Exception as e:
-            logger.error(f"Ошибка при добавлении в избранное: {e}")
-        
-        return False
-    
-    def get_favorites(self, user_id: int) -> List[Dict[str, str]]:
-        """
-        Получить список избранных мемов пользователя
-        
-        Args:
-            user_id: ID пользователя
-        
-        Returns:
-            List: Список мемов пользователя
-        """
-        try:
-            data = self._load_data()
-            user_key = str(user_id)
-            
-            if user_key in data and "favorites" in data[user_key]:
-                favorites = data[user_key]["favorites"]
-                logger.info(f"Получено {len(favorites)} избранных мемов пользователя {user_id}")
-                return favorites
-            
-        except Exception as e:
-            logger.error(f"Ошибка при получении избранного: {e}")
-        
-        return []
-    
-    def remove_favorite(self, user_id: int, meme_index: int) -> bool:
-        """
-        Удалить мем из избранного по индексу
-        
-        Args:
-            user_id: ID пользователя
-            meme_index: Индекс мема в списке избранного
-        
-        Returns:
-            bool: True если успешно удалено
-        """
-        try:
-            data = self._load_data()
-            user_key = str(user_id)
-            
-            if user_key in data and "favorites" in data[user_key]:
-                favorites = data[user_key]["favorites"]
-                
-                if 0 <= meme_index < len(favorites):
-                    removed_meme = favorites.pop(meme_index)
-                    
-                    if self._save_data(data):
-                        logger.info(f"Мем удален из избранного пользователя {user_id}")
-                        return True
-            
-        except Exception as e:
-            logger.error(f"Ошибка при удалении из избранного: {e}")
-        
-        return False
-    
-    def get_favorites_count(self, user_id: int) -> int:
-        """
-        Получить количество избранных мемов пользователя
-        
-        Args:
-            user_id: ID пользователя
-        
-        Returns:
-            int: Количество избранных мемов
-        """
-        favorites = self.get_favorites(user_id)
-        return len(favorites)
-    
-    def clear_favorites(self, user_id: int) -> bool:
-        """
-        Очистить все избранные мемы пользователя
-        
-        Args:
-            user_id: ID пользователя
-        
-        Returns:
-            bool: True если успешно очищено
-        """
-        try:
-            data = self._load_data()
-            user_key = str(user_id)
-            
-            if user_key in data:
-                data[user_key]["favorites"] = []
-                
-                if self._save_data(data):
-                    logger.info(f"Избранное очищено для пользователя {user_id}")
-                    return True
-            
-        except Exception as e:
-            logger.error(f"Ошибка при очистке избранного: {e}")
-        
-        return False
-
-
-# Глобальный экземпляр хранилища
-favorites_storage = FavoritesStorage()
+import asyncio
+import json
+import os
+import logging
+from typing import List, Dict, Optional, Any
+from pathlib import Path
+from config.settings import (
+    FAVORITES_BACKEND,
+    FAVORITES_JSON_FILE,
+    FAVORITES_MAX_PER_USER,
+    FAVORITES_JSON_MAX_PER_USER,
+    FAVORITES_DEDUP
+)
+from services.metrics import instrument_storage
+
+logger = logging.getLogger('cat_meme_bot')
+
+# Каталог хранилища по умолчанию
+STORAGE_DIR = Path(__file__).parent.parent / "storage"
+
+# Максимальное количество избранных мемов у пользователя (бэкенды с постраничным чтением)
+MAX_FAVORITES = FAVORITES_MAX_PER_USER
+
+
+def resolve_storage_path(path: str) -> Path:
+    """Относительный путь из настроек считается от корня проекта"""
+    resolved = Path(path)
+    if not resolved.is_absolute():
+        resolved = STORAGE_DIR.parent / resolved
+    return resolved
+
+
+# Путь к файлу хранилища
+FAVORITES_FILE = resolve_storage_path(FAVORITES_JSON_FILE)
+
+
+class FavoritesStorage:
+    """Класс для работы с локальным хранилищем избранных мемов"""
+    
+    # Весь файл читается на каждую операцию, поэтому лимит остаётся небольшим
+    max_favorites = FAVORITES_JSON_MAX_PER_USER
+    
+    def __init__(self, path: Path = FAVORITES_FILE):
+        """
+        Инициализация хранилища
+        
+        Args:
+            path: Путь к JSON-файлу с избранным
+        """
+        self.path = Path(path)
+        # Создаем директорию если не существует
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._ensure_storage_file()
+        # Операции чтения-изменения-записи файла не должны перемежаться
+        self._lock = asyncio.Lock()
+    
+    async def start(self):
+        """Запуск фоновых задач хранилища (у файлового хранилища их нет)"""
+        pass
+    
+    async def close(self):
+        """Остановка хранилища с сохранением несохранённых данных"""
+        pass
+    
+    def _ensure_storage_file(self):
+        """Убеждаемся что файл хранилища существует"""
+        if not self.path.exists():
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump({}, f, ensure_ascii=False, indent=2)
+            logger.info(f"Создан файл хранилища: {self.path}")
+    
+    def _load_data(self) -> Dict[str, Any]:
+        """Загрузить данные из файла"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            logger.error(f"Ошибка при загрузке данных: {e}")
+            return {}
+    
+    def _save_data(self, data: Dict[str, Any]) -> bool:
+        """Сохранить данные в файл"""
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении данных: {e}")
+            return False
+    
+    async def add_favorite(self, user_id: int, meme_data: Dict[str, str]) -> bool:
+        """
+        Добавить мем в избранное пользователя
+        
+        Args:
+            user_id: ID пользователя
+            meme_data: Данные мема {"url": "...", "top": "...", "bottom": "..."}
+        
+        Returns:
+            bool: True если успешно добавлено
+        """
+        try:
+            async with self._lock:
+                return await asyncio.to_thread(self._add_favorite, user_id, meme_data)
+        except Exception as e:
+            logger.error(f"Ошибка при добавлении в избранное: {e}")
+        
+        return False
+    
+    def _add_favorite(self, user_id: int, meme_data: Dict[str, str]) -> bool:
+        """Добавить мем в избранное (синхронная часть, выполняется в потоке)"""
+        try:
+            data = self._load_data()
+            user_key = str(user_id)
+            
+            # Инициализируем пользователя если не существует
+            if user_key not in data:
+                data[user_key] = {"favorites": []}
+            
+            # Проверяем что мем еще не в избранном
+            favorites = data[user_key]["favorites"]
+            for existing_meme in favorites:
+                if (existing_meme.get("url") == meme_data.get("url") and 
+                    existing_meme.get("top") == meme_data.get("top") and
+                    existing_meme.get("bottom") == meme_data.get("bottom")):
+                    logger.info(f"Мем уже в избранном пользователя {user_id}")
+                    return False
+            
+            # Добавляем мем
+            favorites.append(meme_data)
+            
+            # Ограничиваем количество избранных
+            if len(favorites) > self.max_favorites:
+                favorites.pop(0)  # Удаляем самый старый
+            
+            # Сохраняем
+            if self._save_data(data):
+                logger.info(f"Мем добавлен в избранное пользователя {user_id}")
+                return True
+            
+        except Exception as e:
+            logger.error(f"Ошибка при добавлении в избранное: {e}")
+        
+        return False
+    
+    async def get_favorites(self, user_id: int) -> List[Dict[str, str]]:
+        """
+        Получить список избранных мемов пользователя
+        
+        Args:
+            user_id: ID пользователя
+        
+        Returns:
+            List: Список мемов пользователя
+        """
+        try:
+            async with self._lock:
+                data = await asyncio.to_thread(self._load_data)
+            user_key = str(user_id)
+            
+            if user_key in data and "favorites" in data[user_key]:
+                favorites = data[user_key]["favorites"]
+                logger.info(f"Получено {len(favorites)} избранных мемов пользователя {user_id}")
+                return favorites
+            
+        except Exception as e:
+            logger.error(f"Ошибка при получении избранного: {e}")
+        
+        return []
+    
+    async def get_favorites_page(self, user_id: int, offset: int, limit: int) -> List[Dict[str, str]]:
+        """
+        Получить часть списка избранного
+        
+        JSON-хранилищу всё равно приходится читать весь файл; бэкенды
+        memory, journal и sqlite отдают страницу без копирования всего списка.
+        
+        Args:
+            user_id: ID пользователя
+            offset: Индекс первого мема
+            limit: Максимум мемов на странице
+        
+        Returns:
+            List: Мемы с индексами [offset, offset + limit)
+        """
+        if offset < 0 or limit <= 0:
+            return []
+        favorites = await self.get_favorites(user_id)
+        return favorites[offset:offset + limit]
+    
+    async def get_favorite(self, user_id: int, meme_index: int) -> Optional[Dict[str, str]]:
+        """
+        Получить один мем из избранного по индексу
+        
+        Args:
+            user_id: ID пользователя
+            meme_index: Индекс мема в списке избранного
+        
+        Returns:
+            Optional[Dict]: Мем или None, если индекс вне списка
+        """
+        page = await self.get_favorites_page(user_id, meme_index, 1)
+        return page[0] if page else None
+    
+    async def has_favorite(self, user_id: int, meme_data: Dict[str, str]) -> bool:
+        """
+        Есть ли мем в избранном пользователя (сравниваются url и подписи)
+        
+        Args:
+            user_id: ID пользователя
+            meme_data: Данные мема {"url": "...", "top": "...", "bottom": "..."}
+        
+        Returns:
+            bool: True если такой мем уже в избранном
+        """
+        favorites = await self.get_favorites(user_id)
+        return any(
+            existing_meme.get("url") == meme_data.get("url") and
+            existing_meme.get("top") == meme_data.get("top") and
+            existing_meme.get("bottom") == meme_data.get("bottom")
+            for existing_meme in favorites
+        )
+    
+    async def remove_favorite(self, user_id: int, meme_index: int) -> bool:
+        """
+        Удалить мем из избранного по индексу
+        
+        Args:
+            user_id: ID пользователя
+            meme_index: Индекс мема в списке избранного
+        
+        Returns:
+            bool: True если успешно удалено
+        """
+        try:
+            async with self._lock:
+                return await asyncio.to_thread(self._remove_favorite, user_id, meme_index)
+        except Exception as e:
+            logger.error(f"Ошибка при удалении из избранного: {e}")
+        
+        return False
+    
+    def _remove_favorite(self, user_id: int, meme_index: int) -> bool:
+        """Удалить мем по индексу (синхронная часть, выполняется в потоке)"""
+        try:
+            data = self._load_data()
+            user_key = str(user_id)
+            
+            if user_key in data and "favorites" in data[user_key]:
+                favorites = data[user_key]["favorites"]
+                
+                if 0 <= meme_index < len(favorites):
+                    removed_meme = favorites.pop(meme_index)
+                    
+                    if self._save_data(data):
+                        logger.info(f"Мем удален из избранного пользователя {user_id}")
+                        return True
+            
+        except Exception as e:
+            logger.error(f"Ошибка при удалении из избранного: {e}")
+        
+        return False
+    
+    async def get_favorites_count(self, user_id: int) -> int:
+        """
+        Получить количество избранных мемов пользователя
+        
+        Args:
+            user_id: ID пользователя
+        
+        Returns:
+            int: Количество избранных мемов
+        """
+        favorites = await self.get_favorites(user_id)
+        return len(favorites)
+    
+    async def clear_favorites(self, user_id: int) -> bool:
+        """
+        Очистить все избранные мемы пользователя
+        
+        Args:
+            user_id: ID пользователя
+        
+        Returns:
+            bool: True если успешно очищено
+        """
+        try:
+            async with self._lock:
+                return await asyncio.to_thread(self._clear_favorites, user_id)
+        except Exception as e:
+            logger.error(f"Ошибка при очистке избранного: {e}")
+        
+        return False
+    
+    def _clear_favorites(self, user_id: int) -> bool:
+        """Очистить избранное (синхронная часть, выполняется в потоке)"""
+        try:
+            data = self._load_data()
+            user_key = str(user_id)
+            
+            if user_key in data:
+                data[user_key]["favorites"] = []
+                
+                if self._save_data(data):
+                    logger.info(f"Избранное очищено для пользователя {user_id}")
+                    return True
+            
+        except Exception as e:
+            logger.error(f"Ошибка при очистке избранного: {e}")
+        
+        return False
+
+
+def create_favorites_storage(backend: str = FAVORITES_BACKEND) -> FavoritesStorage:
+    """
+    Создать хранилище избранного по названию бэкенда
+    
+    Args:
+        backend: "json" — файл читается и пишется на каждую операцию,
+                 "memory" — данные в памяти с отложенной записью на диск,
+                 "sqlite" — база SQLite в режиме WAL,
+                 "journal" — журнал операций с групповой записью и компактификацией
+    
+    Returns:
+        FavoritesStorage: Экземпляр хранилища
+    """
+    if backend == "memory":
+        from services.memory_storage import InMemoryFavoritesStorage
+        return InMemoryFavoritesStorage()
+    
+    if backend == "sqlite":
+        from services.sqlite_storage import SQLiteFavoritesStorage
+        return SQLiteFavoritesStorage()
+    
+    if backend == "journal":
+        from services.journal_storage import JournalFavoritesStorage
+        return JournalFavoritesStorage()
+    
+    if backend != "json":
+        logger.warning(f"Неизвестный бэкенд избранного '{backend}', используется json")
+    return FavoritesStorage()
+
+
+# Операции хранилища, время которых попадает в метрики
+STORAGE_OPERATIONS = (
+    "add_favorite",
+    "get_favorites",
+    "get_favorites_page",
+    "get_favorite",
+    "remove_favorite",
+    "get_favorites_count",
+    "clear_favorites"
+)
+
+
+def create_deduplicated_storage(storage: FavoritesStorage):
+    """
+    Хранить мемы один раз для всех пользователей, а в бэкенде — только ссылки на них
+    
+    Бэкенду json это не помогает: файл по-прежнему читается целиком на каждую
+    операцию (в том числе при раскрытии ссылок), уменьшается только его размер.
+    """
+    from services.meme_blobs import DeduplicatedFavoritesStorage, meme_blobs
+    return DeduplicatedFavoritesStorage(storage, meme_blobs)
+
+
+# Глобальный экземпляр хранилища
+_storage = create_favorites_storage()
+if FAVORITES_DEDUP:
+    _storage = create_deduplicated_storage(_storage)
+favorites_storage = instrument_storage(_storage, STORAGE_OPERATIONS)
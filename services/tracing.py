@@ -0,0 +1,215 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from config.settings import (
+    TRACE_FILE,
+    TRACE_SAMPLE_RATE,
+    TRACE_SLOW_THRESHOLD,
+    TRACE_MAX_SPANS,
+    TRACE_MAX_BYTES
+)
+
+logger = logging.getLogger('cat_meme_bot')
+
+# Трасса обрабатываемого обновления; задачи, созданные из обработчика, наследуют её
+_current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("trace", default=None)
+
+_PID = os.getpid()
+
+
+def _now_us() -> int:
+    """Текущее время в микросекундах (единица времени формата Chrome Trace)"""
+    return time.perf_counter_ns() // 1000
+
+
+class Trace:
+    """Спаны одного обновления"""
+
+    __slots__ = ("trace_id", "name", "started", "events", "dropped")
+
+    def __init__(self, trace_id: int, name: str):
+        self.trace_id = trace_id
+        self.name = name
+        self.started = _now_us()
+        self.events: List[dict] = []
+        self.dropped = 0
+
+    def add(self, name: str, started: int, args: dict):
+        """Записать завершённый спан"""
+        if len(self.events) >= TRACE_MAX_SPANS:
+            self.dropped += 1
+            return
+        self.events.append({
+            "name": name, "ph": "X", "ts": started, "dur": _now_us() - started,
+            "pid": _PID, "tid": self.trace_id, "args": args
+        })
+
+
+class _Span:
+    """Контекстный менеджер спана: время блока записывается в текущую трассу"""
+
+    __slots__ = ("trace", "name", "args", "started")
+
+    def __init__(self, trace: Trace, name: str, args: dict):
+        self.trace = trace
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.started = _now_us()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.trace.add(self.name, self.started, self.args)
+        return False
+
+
+class _NullSpan:
+    """Спан вне трассы: ничего не делает"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str, **args):
+    """
+    Замерить блок кода внутри трассы текущего обновления
+
+    Вне обновления (фоновые задачи, запуск бота) ничего не записывается.
+
+    Args:
+        name: Имя спана
+        **args: Дополнительные поля спана
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return _NULL_SPAN
+    return _Span(trace, name, args)
+
+
+class Tracer:
+    """
+    Трассировка обновлений в файл формата Chrome Trace Event
+
+    Трасса собирается для каждого обновления, а решение о сохранении
+    принимается в конце: медленнее slow_threshold — сохраняется всегда,
+    остальные — с вероятностью sample_rate. Файл открывается в
+    chrome://tracing или ui.perfetto.dev, каждое обновление — отдельная строка.
+    """
+
+    def __init__(
+        self,
+        path: str = TRACE_FILE,
+        sample_rate: float = TRACE_SAMPLE_RATE,
+        slow_threshold: float = TRACE_SLOW_THRESHOLD,
+        max_bytes: int = TRACE_MAX_BYTES
+    ):
+        """
+        Инициализация
+
+        Args:
+            path: Файл трасс, относительный путь — от корня проекта (пустая строка — трассировка выключена)
+            sample_rate: Доля сохраняемых обычных обновлений
+            slow_threshold: Обновления дольше этого времени сохраняются всегда, сек
+            max_bytes: Размер файла, после которого он переименовывается в .1
+        """
+        self.path = path
+        self.sample_rate = sample_rate
+        self.slow_threshold_us = int(slow_threshold * 1_000_000)
+        self.max_bytes = max_bytes
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.traced = 0
+        self.kept = 0
+
+    @property
+    def enabled(self) -> bool:
+        """Трассировка включена (задан файл трасс)"""
+        return bool(self.path)
+
+    def begin(self, trace_id: int, name: str) -> Optional[contextvars.Token]:
+        """Начать трассу обновления в текущем контексте"""
+        if not self.enabled:
+            return None
+        return _current_trace.set(Trace(trace_id, name))
+
+    def end(self, token: Optional[contextvars.Token], **args):
+        """Завершить трассу обновления и, если она попала в выборку, сохранить"""
+        if token is None:
+            return
+        trace = _current_trace.get()
+        _current_trace.reset(token)
+        self.traced += 1
+
+        duration = _now_us() - trace.started
+        if duration < self.slow_threshold_us and random.random() >= self.sample_rate:
+            return
+        self.kept += 1
+
+        if trace.dropped:
+            args["dropped_spans"] = trace.dropped
+        events = [
+            {"name": "thread_name", "ph": "M", "pid": _PID, "tid": trace.trace_id, "args": {"name": trace.name}},
+            {
+                "name": trace.name, "ph": "X", "ts": trace.started, "dur": duration,
+                "pid": _PID, "tid": trace.trace_id, "args": args
+            }
+        ]
+        events.extend(trace.events)
+        lines = "".join(json.dumps(event, ensure_ascii=False) + ",\n" for event in events)
+
+        if self._executor is None:
+            # Путь разрешается здесь, а не при импорте: storage_service импортирует
+            # метрики, а те — трассировку
+            from services.storage_service import resolve_storage_path
+            self.path = str(resolve_storage_path(self.path))
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tracer")
+        self._executor.submit(self._write, lines)
+
+    def _write(self, lines: str):
+        """Дописать события в файл (выполняется в отдельном потоке)"""
+        try:
+            with self._lock:
+                size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+                if size and size + len(lines) > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+                    size = 0
+                with open(self.path, "a", encoding="utf-8") as f:
+                    # Формат JSON Array: закрывающая скобка и запятая в конце необязательны
+                    if size == 0:
+                        f.write("[\n")
+                    f.write(lines)
+        except OSError as e:
+            logger.error(f"Ошибка при записи трассы: {e}")
+
+    async def close(self):
+        """Дождаться записи сохранённых трасс"""
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.get_running_loop().run_in_executor(None, executor.shutdown)
+
+    def stats(self) -> dict:
+        """Статистика для мониторинга"""
+        return {"traced": self.traced, "kept": self.kept}
+
+
+# Глобальный трассировщик
+tracer = Tracer()
@@ -0,0 +1,279 @@
+import asyncio
+import time
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Optional, TypeVar
+from config.settings import (
+    CAT_API_MAX_CONCURRENCY,
+    CAT_API_MAX_WAITING,
+    MEMEGEN_MAX_CONCURRENCY,
+    MEMEGEN_MAX_WAITING,
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RECOVERY_TIME,
+    HEDGE_ENABLED,
+    HEDGE_BUDGET,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_MIN_DELAY,
+    HEDGE_WINDOW
+)
+from services.metrics import UPSTREAM_LATENCY, UPSTREAM_REJECTED
+from services.tracing import span
+
+logger = logging.getLogger('cat_meme_bot')
+
+# Состояния автоматического выключателя
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Сколько дублей можно накопить в бюджет про запас
+_HEDGE_BURST = 10.0
+
+T = TypeVar("T")
+
+
+class UpstreamUnavailableError(Exception):
+    """Запрос не допущен: выключатель разомкнут или очередь переполнена"""
+
+
+class UpstreamError(Exception):
+    """Ответ сервиса считается отказом (5xx, 429)"""
+
+
+def check_status(status: int):
+    """Считать ответы 5xx и 429 отказом сервиса"""
+    if status >= 500 or status == 429:
+        raise UpstreamError(f"HTTP {status}")
+
+
+class Upstream:
+    """
+    Допуск запросов к внешнему сервису
+
+    Одновременно выполняется не больше max_concurrency запросов, ещё
+    max_waiting могут ждать своей очереди, остальные сразу отклоняются.
+    После failure_threshold отказов подряд выключатель размыкается и все
+    запросы отклоняются без обращения к сервису. Через recovery_time
+    пропускается один пробный запрос: при успехе выключатель замыкается,
+    при ошибке снова размыкается.
+
+    Для запросов через hedged: если ответа нет дольше наблюдаемого p95,
+    отправляется второй такой же запрос и берётся первый успешный ответ.
+    Доля дублей ограничена бюджетом hedge_budget.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        max_waiting: int,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        recovery_time: float = BREAKER_RECOVERY_TIME,
+        hedge_enabled: bool = HEDGE_ENABLED,
+        hedge_budget: float = HEDGE_BUDGET
+    ):
+        """
+        Инициализация
+
+        Args:
+            name: Имя сервиса для логов и /test
+            max_concurrency: Максимум одновременных запросов
+            max_waiting: Максимум запросов, ожидающих в очереди
+            failure_threshold: Отказов подряд до размыкания
+            recovery_time: Пауза до пробного запроса, сек
+            hedge_enabled: Отправлять ли дублирующие запросы
+            hedge_budget: Доля дублирующих запросов от общего числа
+        """
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_waiting = max(0, max_waiting)
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_time = recovery_time
+
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._active = 0
+        self._waiting = 0
+
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+        self.hedge_enabled = hedge_enabled
+        self.hedge_budget = hedge_budget
+        self._latencies = deque(maxlen=HEDGE_WINDOW)
+        self._hedge_tokens = 0.0
+
+        self.rejected = 0
+        self.failures_total = 0
+        self.hedge_calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    @property
+    def healthy(self) -> bool:
+        """Выключатель замкнут — сервис считается работающим"""
+        return self.state == CLOSED
+
+    def _admit(self) -> bool:
+        """Решение выключателя: пропустить ли запрос (и не пробный ли он)"""
+        if self.state == CLOSED:
+            return False
+        if self.state == OPEN and time.monotonic() - self._opened_at >= self.recovery_time:
+            self.state = HALF_OPEN
+            logger.info(f"{self.name}: пробный запрос после паузы")
+        if self.state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        raise UpstreamUnavailableError(f"{self.name}: сервис недоступен (выключатель разомкнут)")
+
+    def _record_success(self):
+        """Успешный запрос замыкает выключатель"""
+        if self.state != CLOSED:
+            logger.info(f"{self.name}: сервис восстановился, выключатель замкнут")
+        self.state = CLOSED
+        self._failures = 0
+
+    def _record_failure(self):
+        """Отказ: после порога подряд (или неудачной пробы) выключатель размыкается"""
+        self._failures += 1
+        self.failures_total += 1
+        if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != OPEN:
+                logger.warning(f"{self.name}: {self._failures} отказов подряд, выключатель разомкнут")
+            self.state = OPEN
+            self._opened_at = time.monotonic()
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Выполнить запрос к сервису с учётом лимитов и выключателя
+
+        Исключение внутри блока (кроме отмены) считается отказом сервиса.
+
+        Raises:
+            UpstreamUnavailableError: Выключатель разомкнут или очередь переполнена
+        """
+        try:
+            probe = self._admit()
+        except UpstreamUnavailableError:
+            self.rejected += 1
+            UPSTREAM_REJECTED.inc(self.name)
+            raise
+
+        try:
+            if self._active >= self.max_concurrency and self._waiting >= self.max_waiting:
+                self.rejected += 1
+                UPSTREAM_REJECTED.inc(self.name)
+                raise UpstreamUnavailableError(f"{self.name}: очередь запросов переполнена")
+
+            self._waiting += 1
+            try:
+                if self._semaphore.locked():
+                    with span(f"{self.name}: очередь"):
+                        await self._semaphore.acquire()
+                else:
+                    await self._semaphore.acquire()
+            finally:
+                self._waiting -= 1
+
+            self._active += 1
+            started = time.monotonic()
+            try:
+                with span(self.name, probe=probe):
+                    yield
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self._record_failure()
+                UPSTREAM_LATENCY.observe(time.monotonic() - started, self.name, "error")
+                raise
+            else:
+                self._record_success()
+                elapsed = time.monotonic() - started
+                self._latencies.append(elapsed)
+                UPSTREAM_LATENCY.observe(elapsed, self.name, "ok")
+            finally:
+                self._active -= 1
+                self._semaphore.release()
+        finally:
+            if probe:
+                self._probe_in_flight = False
+
+    def p95(self) -> Optional[float]:
+        """95-й перцентиль задержки успешных запросов (None — мало замеров)"""
+        if len(self._latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def _take_hedge_token(self) -> bool:
+        """Потратить бюджет на дублирующий запрос"""
+        if self._hedge_tokens >= 1:
+            self._hedge_tokens -= 1
+            return True
+        return False
+
+    async def hedged(self, request: Callable[[], Awaitable[T]]) -> T:
+        """
+        Выполнить запрос, при задержке дольше p95 отправив дубль
+
+        Ответ считается неудачным, если запрос выбросил исключение или
+        вернул пустое значение; тогда ждём второй запрос, если он есть.
+
+        Args:
+            request: Функция, создающая запрос (вызывается до двух раз)
+
+        Returns:
+            Первый успешный результат или результат последнего запроса
+        """
+        delay = self.p95() if self.hedge_enabled else None
+        if delay is None:
+            return await request()
+
+        self.hedge_calls += 1
+        self._hedge_tokens = min(_HEDGE_BURST, self._hedge_tokens + self.hedge_budget)
+
+        primary = asyncio.ensure_future(request())
+        done, _ = await asyncio.wait({primary}, timeout=max(delay, HEDGE_MIN_DELAY))
+        if done or not self._take_hedge_token():
+            return await primary
+
+        self.hedges += 1
+        hedge = asyncio.ensure_future(request())
+        pending = {primary, hedge}
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if not task.exception() and task.result()), None)
+                if winner is not None:
+                    if winner is hedge:
+                        self.hedge_wins += 1
+                    return winner.result()
+                if not pending:
+                    # Оба запроса неудачны — отдаём результат (или исключение) последнего
+                    return next(iter(done)).result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        """Состояние для мониторинга"""
+        p95 = self.p95()
+        return {
+            "state": self.state,
+            "active": self._active,
+            "waiting": self._waiting,
+            "rejected": self.rejected,
+            "failures": self.failures_total,
+            "p95": p95,
+            "hedge_rate": self.hedges / self.hedge_calls if self.hedge_calls else 0.0,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins
+        }
+
+
+# Внешние сервисы бота
+cat_api_upstream = Upstream("The Cat API", CAT_API_MAX_CONCURRENCY, CAT_API_MAX_WAITING)
+memegen_upstream = Upstream("memegen.link", MEMEGEN_MAX_CONCURRENCY, MEMEGEN_MAX_WAITING)
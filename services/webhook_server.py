@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import signal
+from typing import Optional, Set
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from config.settings import (
+    WEBHOOK_BASE_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_MAX_CONNECTIONS,
+    WEBHOOK_DRAIN_TIMEOUT
+)
+
+logger = logging.getLogger('cat_meme_bot')
+
+
+class DrainingRequestHandler(SimpleRequestHandler):
+    """
+    Обработчик вебхука с корректной остановкой
+
+    Обновление передаётся в диспетчер в фоне, а Telegram сразу получает ответ.
+    После начала остановки новые обновления отклоняются с 503 (Telegram
+    повторит их позже, в том числе на другой экземпляр за балансировщиком),
+    а уже принятые дорабатываются.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: Optional[str] = None):
+        """
+        Инициализация обработчика
+
+        Args:
+            dispatcher: Диспетчер, в который передаются обновления
+            bot: Бот
+            secret_token: Секретный токен вебхука (None — без проверки)
+        """
+        super().__init__(dispatcher=dispatcher, bot=bot, secret_token=secret_token or None)
+        self.draining = False
+        self.received = 0
+        # Свой набор задач, а не внутренний у aiogram: его ждёт drain()
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """Принять обновление и обработать его в фоне, если сервер не останавливается"""
+        if self.draining:
+            return web.Response(status=503, text="Shutting down")
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), bot):
+            return web.Response(status=401, text="Unauthorized")
+
+        self.received += 1
+        update = await request.json(loads=bot.session.json_loads)
+        task = asyncio.create_task(self._feed_update(bot, update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def _feed_update(self, bot: Bot, update: dict):
+        """Передать обновление в диспетчер (ответ обработчика отправляется отдельным запросом)"""
+        result = await self.dispatcher.feed_raw_update(bot=bot, update=update, **self.data)
+        if isinstance(result, TelegramMethod):
+            await self.dispatcher.silent_call_request(bot=bot, result=result)
+
+    async def close(self):
+        """Сессию бота закрывает main(), а не сервер"""
+
+    async def drain(self, timeout: float) -> int:
+        """
+        Перестать принимать обновления и дождаться уже принятых
+
+        Returns:
+            int: Сколько обработок не уложилось в таймаут
+        """
+        self.draining = True
+        pending = set(self._tasks)
+        if not pending:
+            return 0
+        logger.info(f"Ожидание обработки {len(pending)} обновлений...")
+        _, not_done = await asyncio.wait(pending, timeout=timeout)
+        for task in not_done:
+            task.cancel()
+        return len(not_done)
+
+
+async def _health(request: web.Request) -> web.Response:
+    """Проверка живости для балансировщика"""
+    return web.Response(text="ok")
+
+
+def _install_stop_signals(stop_event: asyncio.Event):
+    """Остановить сервер по SIGINT/SIGTERM (где это поддерживается)"""
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: остаётся KeyboardInterrupt
+            pass
+
+
+async def run_webhook(
+    dp: Dispatcher,
+    bot: Bot,
+    host: str = WEBHOOK_HOST,
+    port: int = WEBHOOK_PORT,
+    path: str = WEBHOOK_PATH,
+    secret: str = WEBHOOK_SECRET,
+    base_url: str = WEBHOOK_BASE_URL,
+    max_connections: int = WEBHOOK_MAX_CONNECTIONS,
+    drain_timeout: float = WEBHOOK_DRAIN_TIMEOUT,
+    stop_event: Optional[asyncio.Event] = None
+):
+    """
+    Получать обновления через встроенный HTTP-сервер до сигнала остановки
+
+    Args:
+        dp: Диспетчер
+        bot: Бот
+        host: Адрес, на котором слушает сервер
+        port: Порт сервера
+        path: Путь, на который Telegram присылает обновления
+        secret: Секретный токен вебхука (пустая строка — без проверки)
+        base_url: Публичный адрес для setWebhook (пустая строка — не регистрировать)
+        max_connections: Параметр setWebhook: сколько одновременных соединений откроет
+            Telegram (сам сервер число запросов не ограничивает)
+        drain_timeout: Сколько ждать обработки принятых обновлений при остановке, сек
+        stop_event: Событие остановки (по умолчанию — SIGINT/SIGTERM)
+    """
+    if stop_event is None:
+        stop_event = asyncio.Event()
+        _install_stop_signals(stop_event)
+
+    handler = DrainingRequestHandler(dp, bot, secret_token=secret)
+    app = web.Application()
+    handler.register(app, path=path)
+    app.router.add_get("/health", _health)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host=host, port=port)
+    await site.start()
+    logger.info(f"Вебхук-сервер слушает {host}:{port}{path}")
+
+    if base_url:
+        await bot.set_webhook(
+            url=base_url.rstrip("/") + path,
+            secret_token=secret or None,
+            max_connections=max_connections,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+        logger.info(f"Вебхук зарегистрирован в Telegram: {base_url.rstrip('/')}{path}")
+
+    try:
+        await stop_event.wait()
+    finally:
+        logger.info("Остановка вебхук-сервера...")
+        # Вебхук в Telegram не удаляем: за балансировщиком могут работать другие экземпляры
+        unfinished = await handler.drain(drain_timeout)
+        if unfinished:
+            logger.warning(f"Не дождались обработки {unfinished} обновлений")
+        await runner.cleanup()
+        logger.info(f"Вебхук-сервер остановлен, принято обновлений: {handler.received}")
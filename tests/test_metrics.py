@@ -0,0 +1,32 @@
+from services.metrics import Histogram
+
+
+def _exported(histogram: Histogram) -> dict:
+    samples = {}
+    for line in histogram._samples():
+        name, value = line.rsplit(" ", 1)
+        samples[name] = float(value)
+    return samples
+
+
+def test_histogram_value_on_bucket_bound():
+    histogram = Histogram("t", "test", buckets=(0.1, 1.0))
+    histogram.observe(1.0)
+
+    samples = _exported(histogram)
+    assert samples['t_bucket{le="0.1"}'] == 0
+    assert samples['t_bucket{le="1.0"}'] == 1
+    assert samples['t_bucket{le="+Inf"}'] == 1
+    assert samples["t_sum"] == 1.0
+    assert samples["t_count"] == 1
+
+
+def test_histogram_value_above_top_bucket():
+    histogram = Histogram("t", "test", buckets=(0.1, 1.0))
+    histogram.observe(5.0)
+
+    samples = _exported(histogram)
+    assert samples['t_bucket{le="1.0"}'] == 0
+    assert samples['t_bucket{le="+Inf"}'] == 1
+    assert samples["t_sum"] == 5.0
+    assert samples["t_count"] == 1
@@ -1 +1 @@
-# TODO: функции форматирования
+# TODO: функции форматирования
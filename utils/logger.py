@@ -1,28 +1,153 @@
-import logging
-from config.settings import LOG_LEVEL, LOG_FILE
-
-
-def setup_logger():
-    """Настройка логирования для бота"""
-    logging.basicConfig(
-        level=getattr(logging, LOG_LEVEL),
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(LOG_FILE, encoding='utf-8'),
-            logging.StreamHandler()
-        ]
-    )
-    
-    return logging.getLogger('cat_meme_bot')
-
-
-def log_command(user_id: int, username: str, command: str):
-    """Логирование выполненной команды"""
-    logger = logging.getLogger('cat_meme_bot')
-    logger.info(f"User {user_id} (@{username}) executed command: {command}")
-
-
-def log_callback(user_id: int, username: str, callback_data: str):
-    """Логирование нажатия inline-кнопки"""
-    logger = logging.getLogger('cat_meme_bot')
-    logger.info(f"User {user_id} (@{username}) pressed button: {callback_data}")
+import atexit
+import copy
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import shutil
+from config.settings import (
+    LOG_LEVEL,
+    LOG_FILE,
+    LOG_FORMAT,
+    LOG_ROTATE_WHEN,
+    LOG_ROTATE_BYTES,
+    LOG_BACKUP_COUNT,
+    LOG_COMPRESS,
+    LOG_QUEUE_SIZE,
+    LOG_UPDATE_SAMPLE_RATE
+)
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Логгеры строк о каждом обновлении, которые можно прореживать
+UPDATE_LOGGERS = ("bot", "cat_meme_bot.updates", "aiogram.event")
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Структурированный формат: одна JSON-запись на строку"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускать только долю записей ниже WARNING (предупреждения и ошибки — всегда)"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Помещает записи в очередь; при переполнении запись отбрасывается, а не блокирует бота"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Подготовить запись к передаче в другой поток, сохранив трассировку отдельно от текста"""
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _gzip_namer(name: str) -> str:
+    """Имя сжатого файла после ротации"""
+    return name + ".gz"
+
+
+def _gzip_rotator(source: str, dest: str):
+    """Сжать закрытый файл лога (выполняется в потоке записи логов)"""
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def _file_handler() -> logging.Handler:
+    """Файловый обработчик с ротацией по времени или по размеру"""
+    if LOG_ROTATE_WHEN:
+        handler = logging.handlers.TimedRotatingFileHandler(
+            LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_ROTATE_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+    if LOG_COMPRESS:
+        handler.namer = _gzip_namer
+        handler.rotator = _gzip_rotator
+    return handler
+
+
+def setup_logger():
+    """
+    Настройка логирования для бота
+
+    Обработчики бота только кладут записи в очередь, а запись в файл
+    (с ротацией и сжатием) и в консоль идёт в отдельном потоке.
+    """
+    global _listener
+    if _listener is not None:
+        return logging.getLogger('cat_meme_bot')
+
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = [_file_handler(), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, LOG_LEVEL))
+    root.addHandler(DroppingQueueHandler(log_queue))
+
+    if LOG_UPDATE_SAMPLE_RATE < 1:
+        for name in UPDATE_LOGGERS:
+            logging.getLogger(name).addFilter(SamplingFilter(LOG_UPDATE_SAMPLE_RATE))
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Дописать оставшиеся в очереди записи при выходе
+    atexit.register(_listener.stop)
+
+    return logging.getLogger('cat_meme_bot')
+
+
+def log_command(user_id: int, username: str, command: str):
+    """Логирование выполненной команды"""
+    logger = logging.getLogger('cat_meme_bot.updates')
+    logger.info(f"User {user_id} (@{username}) executed command: {command}")
+
+
+def log_callback(user_id: int, username: str, callback_data: str):
+    """Логирование нажатия inline-кнопки"""
+    logger = logging.getLogger('cat_meme_bot.updates')
+    logger.info(f"User {user_id} (@{username}) pressed button: {callback_data}")